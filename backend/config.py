@@ -13,6 +13,14 @@ SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY", "")
 
 PORT = int(os.getenv("PORT", "5000"))
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
+# Responses smaller than this are sent uncompressed
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "1024"))
+# Also match new concept names to a user's existing concepts by similarity of
+# their normalized keys (0-1; 0 = exact key matches only)
+CONCEPT_FUZZY_THRESHOLD = float(os.getenv("CONCEPT_FUZZY_THRESHOLD", "0"))
+# Serve the /api/debug/* diagnostics (traces, cache and limiter state). They
+# have no auth, so keep them off outside local development.
+DEBUG_ENDPOINTS = os.getenv("DEBUG_ENDPOINTS", "0") == "1"
 
 GOOGLE_SCOPES = [
     "https://www.googleapis.com/auth/calendar.events",
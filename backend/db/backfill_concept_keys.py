@@ -0,0 +1,95 @@
+"""
+One-time migration to normalized concept keys (graph_nodes.concept_key).
+
+apply_graph_update resolves concept names by key and the unique
+(user_id, concept_key) index stops duplicates at write time, so there is no
+recurring dedup sweep any more. A database created before the column needs
+this once, after supabase_schema.sql has added it: nodes of one user whose
+names share a key ("Linked Lists", "linked list") are merged, keeping the row
+with the highest mastery_score (tiebreak: most times_studied) and cleaning up
+dependent rows in graph_edges, quiz_attempts and quiz_context; then every
+remaining node without a key gets one. Safe to re-run.
+
+Run from the backend/ directory:
+    python db/backfill_concept_keys.py
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
+
+from collections import defaultdict
+from db.connection import in_filter, table
+from services import graph_changes_service as graph_changes
+from services import subject_stats_service as subject_stats
+from services.concept_key_service import concept_key
+
+
+def backfill():
+    # Streamed in pages; only a compact tuple per node is kept, so the pass
+    # doesn't hold the whole table in memory.
+    groups: dict = defaultdict(list)
+    for n in table("graph_nodes").select_iter(
+        "id,user_id,concept_name,concept_key,mastery_score,times_studied,subject"
+    ):
+        key = concept_key(n["concept_name"])
+        groups[(n["user_id"], key)].append((
+            n.get("mastery_score") or 0, n.get("times_studied") or 0, n["id"],
+            n["concept_name"], n.get("concept_key"), n.get("subject"),
+        ))
+
+    to_delete: list[str] = []
+    to_key: list[dict] = []
+    removed_by_user: dict = defaultdict(list)
+    for (user_id, key), nodes in groups.items():
+        nodes.sort(key=lambda x: (x[0], x[1]), reverse=True)
+        kept, removed = nodes[0], nodes[1:]
+        if kept[4] != key:
+            to_key.append({"id": kept[2], "user_id": user_id, "concept_name": kept[3], "concept_key": key})
+        if removed:
+            to_delete.extend(d[2] for d in removed)
+            removed_by_user[user_id].extend((d[2], d[5]) for d in removed)
+            print(f"  [{user_id}] '{kept[3]}' — keeping {kept[2][:8]}, "
+                  f"merging {', '.join(repr(d[3]) for d in removed)}")
+
+    if to_delete:
+        print(f"\nRemoving {len(to_delete)} duplicate node(s)…")
+        ids = in_filter(to_delete)
+
+        # Delete edges that reference any of the duplicate nodes
+        deleted_edges = 0
+        for col in ("source_node_id", "target_node_id"):
+            try:
+                rows = table("graph_edges").delete({col: ids})
+                deleted_edges += len(rows)
+            except Exception as e:
+                print(f"  Warning: could not delete edges by {col}: {e}")
+
+        # Null out quiz_attempts.concept_node_id (nullable FK)
+        try:
+            table("quiz_attempts").update({"concept_node_id": None}, {"concept_node_id": ids})
+        except Exception as e:
+            print(f"  Warning: could not null quiz_attempts: {e}")
+
+        # Delete quiz_context rows tied to duplicate nodes
+        try:
+            table("quiz_context").delete({"concept_node_id": ids})
+        except Exception as e:
+            print(f"  Warning: could not delete quiz_context: {e}")
+
+        table("graph_nodes").delete({"id": ids})
+        for user_id, nodes in removed_by_user.items():
+            graph_changes.record(user_id, nodes=nodes)
+            subject_stats.rebuild(user_id)
+        print(f"Removed {len(to_delete)} node(s), {deleted_edges} edge(s).")
+
+    # Keys go on after the duplicates are gone, so the unique index never trips
+    if to_key:
+        table("graph_nodes").upsert(to_key, on_conflict="id")
+    print(f"Done. Set concept_key on {len(to_key)} node(s).")
+
+
+if __name__ == "__main__":
+    backfill()
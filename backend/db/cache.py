@@ -0,0 +1,154 @@
+"""
+db/cache.py
+
+Per-table read-through cache for SupabaseTable selects.
+
+Entries are keyed by (table, columns, filters, order, limit), expire after a
+TTL and are evicted LRU-first once a table's cache is full. Any insert/update/
+upsert/delete issued through db.connection on a table drops that table's
+entries, so a process always reads its own writes. Each drop starts a new
+generation; a select that was in flight across it doesn't store its
+(possibly pre-write) rows. Writes from other processes
+are only picked up once the TTL expires — keep TTLs short for shared tables.
+
+Enable from the environment:
+    SUPABASE_CACHE_TABLES=users,courses,graph_nodes
+    SUPABASE_CACHE_TTL=5          # seconds
+    SUPABASE_CACHE_MAXSIZE=512    # entries per table
+or in code with enable_cache("users", ttl=30).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+DEFAULT_TTL = float(os.getenv("SUPABASE_CACHE_TTL", "5"))
+DEFAULT_MAXSIZE = int(os.getenv("SUPABASE_CACHE_MAXSIZE", "512"))
+
+
+def make_key(
+    table_name: str,
+    columns: str,
+    filters: Optional[dict],
+    order: Optional[str],
+    limit: Optional[int],
+) -> tuple:
+    return (
+        table_name,
+        columns,
+        tuple(sorted((filters or {}).items())),
+        order,
+        limit,
+    )
+
+
+class TableCache:
+    """TTL + LRU cache of select results for a single table."""
+
+    def __init__(self, ttl: float = DEFAULT_TTL, maxsize: int = DEFAULT_MAXSIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_fills = 0
+
+    def get(self, key: tuple) -> Optional[list]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, rows = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # Hand out copies so callers that annotate rows don't corrupt the cache
+        return [dict(r) if isinstance(r, dict) else r for r in rows]
+
+    def put(self, key: tuple, rows: list, generation: Optional[int] = None) -> None:
+        """
+        Store `rows`. Pass the `generation` read before the select was sent:
+        if the table was invalidated since, the rows may predate that write
+        and are dropped.
+        """
+        snapshot = [dict(r) if isinstance(r, dict) else r for r in rows]
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                self.stale_fills += 1
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale_fills": self.stale_fills,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
+
+
+_caches: dict[str, TableCache] = {}
+
+
+def enable_cache(name: str, ttl: float = DEFAULT_TTL, maxsize: int = DEFAULT_MAXSIZE) -> TableCache:
+    cache = TableCache(ttl=ttl, maxsize=maxsize)
+    _caches[name] = cache
+    return cache
+
+
+def disable_cache(name: str) -> None:
+    _caches.pop(name, None)
+
+
+def get_cache(name: str) -> Optional[TableCache]:
+    return _caches.get(name)
+
+
+def invalidate(name: str) -> None:
+    cache = _caches.get(name)
+    if cache is not None:
+        cache.invalidate()
+
+
+def cache_stats() -> dict:
+    """Per-table hit/miss counters plus totals (each hit is a saved round-trip)."""
+    tables = {name: c.stats() for name, c in _caches.items()}
+    hits = sum(s["hits"] for s in tables.values())
+    misses = sum(s["misses"] for s in tables.values())
+    return {
+        "tables": tables,
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+    }
+
+
+for _name in filter(None, (t.strip() for t in os.getenv("SUPABASE_CACHE_TABLES", "").split(","))):
+    enable_cache(_name)
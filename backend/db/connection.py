@@ -1,15 +1,33 @@
+import asyncio
+import contextvars
+import itertools
 import os
-from typing import Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterator, Optional
 
 import httpx
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from db import cache as _cache  # noqa: E402  (reads cache settings from the env loaded above)
+from db import instrumentation as _trace  # noqa: E402
+from db import rows as _rows  # noqa: E402
+from db import transport as _transport  # noqa: E402
+from db.postgrest_syntax import format_in_value, split_in_list  # noqa: E402
+from db.transport import CircuitOpenError  # noqa: E402,F401  (re-exported for callers)
+
 SUPABASE_URL = os.getenv("SUPABASE_URL", "").strip().rstrip("/")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY", "").strip()
 REST_URL = f"{SUPABASE_URL}/rest/v1"
 
+# Path (or ":memory:") of a SQLite file served by the local PostgREST stand-in
+# instead of Supabase — see db/local_postgrest.py.
+SUPABASE_LOCAL_DB = os.getenv("SUPABASE_LOCAL_DB", "").strip()
+LOCAL_REST_URL = "http://local-postgrest/rest/v1"
+
 _HEADERS = {
     "apikey": SUPABASE_KEY,
     "Authorization": f"Bearer {SUPABASE_KEY}",
@@ -17,16 +35,179 @@ _HEADERS = {
     "Prefer": "return=representation",
 }
 
-# Persistent client — reuses TCP connections across requests (much faster)
-_client = httpx.Client(headers=_HEADERS, timeout=30.0)
+# Persistent clients — reuse TCP connections across requests (much faster).
+# The async client serves `async def` routes so they never block the event loop.
+# Pool size, HTTP/2, timeouts, retries and the breaker live in db/transport.py.
+_client = _transport.build_client(_HEADERS)
+_async_client = _transport.build_async_client(_HEADERS)
+
+_UPSERT_PREFER = "return=representation,resolution=merge-duplicates"
+_UPSERT_IGNORE_PREFER = "return=representation,resolution=ignore-duplicates"
+
+# Rows per Range page for select_iter. Keep at or below PostgREST's max-rows.
+DEFAULT_PAGE_SIZE = int(os.getenv("SUPABASE_PAGE_SIZE", "1000"))
+
+
+# Oversized work is split into bounded batches and run `SUPABASE_FANOUT` at a
+# time: in.() filters past MAX_IN_ITEMS values / MAX_IN_CHARS characters (URL
+# limits), and insert/upsert payloads past BULK_BATCH_SIZE rows.
+MAX_IN_ITEMS = int(os.getenv("SUPABASE_MAX_IN_ITEMS", "150"))
+MAX_IN_CHARS = int(os.getenv("SUPABASE_MAX_IN_CHARS", "6000"))
+BULK_BATCH_SIZE = int(os.getenv("SUPABASE_BULK_BATCH_SIZE", "500"))
+FANOUT = int(os.getenv("SUPABASE_FANOUT", "4"))
+
+
+def _range_headers(offset: int, page_size: int) -> dict:
+    return {"Range-Unit": "items", "Range": f"{offset}-{offset + page_size - 1}"}
+
+
+def in_filter(values) -> str:
+    """PostgREST in.() filter for arbitrary strings (quoted and escaped as needed)."""
+    return f"in.({','.join(format_in_value(str(v)) for v in values)})"
+
+
+def _chunk_in(expr) -> Optional[list]:
+    """Bounded in.() chunks of an oversized in.() filter expression, or None if it fits."""
+    if not isinstance(expr, str) or not expr.startswith("in.(") or not expr.endswith(")"):
+        return None
+    values = split_in_list(expr[4:-1])
+    if len(values) <= MAX_IN_ITEMS and len(expr) <= MAX_IN_CHARS:
+        return None
+    chunks, current, size = [], [], 0
+    for v in values:
+        item = format_in_value(v)
+        if current and (len(current) >= MAX_IN_ITEMS or size + len(item) + 1 > MAX_IN_CHARS):
+            chunks.append(current)
+            current, size = [], 0
+        current.append(item)
+        size += len(item) + 1
+    if current:
+        chunks.append(current)
+    return [f"in.({','.join(chunk)})" for chunk in chunks]
+
+
+def _chunk_filters(filters: Optional[dict]) -> Optional[list]:
+    """
+    If in.() filters are too large for a single URL, return one filters dict
+    per combination of bounded chunks of their values; otherwise None. Every
+    oversized filter is split in this one pass, so a chunk never needs
+    splitting again. not.in.() is never split (a union of exclusions would be
+    wrong).
+    """
+    if not filters:
+        return None
+    split = {}
+    for col, expr in filters.items():
+        chunks = _chunk_in(expr)
+        if chunks:
+            split[col] = chunks
+    if not split:
+        return None
+    return [{**filters, **dict(zip(split, combo))} for combo in itertools.product(*split.values())]
+
+
+def _batches(data) -> Optional[list]:
+    if isinstance(data, list) and len(data) > BULK_BATCH_SIZE:
+        return [data[i:i + BULK_BATCH_SIZE] for i in range(0, len(data), BULK_BATCH_SIZE)]
+    return None
+
+
+def _sort_rows(rows: list, order: str) -> list:
+    """Client-side re-sort of merged chunk results by a PostgREST order string."""
+    for term in reversed(order.split(",")):
+        bits = term.strip().split(".")
+        col, desc = bits[0], "desc" in bits[1:]
+        rows.sort(key=lambda r: (r.get(col) is None, r.get(col)), reverse=desc)
+    return rows
+
+
+def _order_columns(columns: str, order: Optional[str]) -> list:
+    """Order-by columns missing from a select list (needed to re-sort merged chunks)."""
+    if not order or columns.strip() == "*":
+        return []
+    selected = {c.strip() for c in columns.split(",")}
+    wanted = [t.strip().split(".")[0] for t in order.split(",")]
+    return [c for c in dict.fromkeys(wanted) if c not in selected]
+
+
+def _merge_select(chunk_results: list, order: Optional[str], limit: Optional[int], extra: list) -> list:
+    rows = [row for chunk in chunk_results for row in chunk]
+    if order:
+        rows = _sort_rows(rows, order)
+    if limit:
+        rows = rows[:limit]
+    for row in rows if extra else ():
+        for col in extra:
+            row.pop(col, None)
+    return rows
+
+
+_FANOUT_THREAD_PREFIX = "supabase-fanout"
+_executor = ThreadPoolExecutor(max_workers=FANOUT, thread_name_prefix=_FANOUT_THREAD_PREFIX)
+
+
+def _fan_out(fn: Callable, items: list) -> list:
+    """Run fn over items on the shared pool (trace context included); results in order."""
+    if len(items) == 1 or threading.current_thread().name.startswith(_FANOUT_THREAD_PREFIX):
+        # Inline on a pool thread: waiting there for the same pool can deadlock it
+        return [fn(item) for item in items]
+    futures = [_executor.submit(contextvars.copy_context().run, fn, item) for item in items]
+    return [f.result() for f in futures]
+
+
+async def _afan_out(fn: Callable, items: list) -> list:
+    sem = asyncio.Semaphore(FANOUT)
+
+    async def _run(item):
+        async with sem:
+            return await fn(item)
+
+    return list(await asyncio.gather(*(_run(item) for item in items)))
+
+
+def _select_params(
+    columns: str,
+    filters: Optional[dict],
+    order: Optional[str],
+    limit: Optional[int],
+) -> dict:
+    params: dict = {"select": columns}
+    if filters:
+        params.update(filters)
+    if order:
+        params["order"] = order
+    if limit:
+        params["limit"] = str(limit)
+    return params
 
 
 class SupabaseTable:
     """Thin synchronous wrapper around Supabase PostgREST REST API."""
 
-    def __init__(self, name: str):
+    def __init__(self, name: str, cached: bool = True, row_type: Optional[type] = None):
         self.name = name
         self.url = f"{REST_URL}/{name}"
+        self._cache = _cache.get_cache(name) if cached else None
+        self.row_type = row_type
+
+    def _request(
+        self,
+        verb: str,
+        method: str,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        json=None,
+    ) -> list:
+        started = time.perf_counter()
+        rows = None
+        try:
+            r = _transport.send(_client, verb, method, self.url, params=params, headers=headers, json=json)
+            rows = _rows.decode(r.content)
+            return rows
+        finally:
+            if verb != "select":
+                _cache.invalidate(self.name)
+            _trace.record(self.name, verb, params, started, rows)
 
     def select(
         self,
@@ -35,38 +216,352 @@ class SupabaseTable:
         order: Optional[str] = None,
         limit: Optional[int] = None,
     ) -> list:
-        params: dict = {"select": columns}
-        if filters:
-            params.update(filters)
-        if order:
-            params["order"] = order
-        if limit:
-            params["limit"] = str(limit)
-        r = _client.get(self.url, params=params)
-        r.raise_for_status()
-        return r.json()
+        chunks = _chunk_filters(filters)
+        if chunks:
+            extra = _order_columns(columns, order)
+            fetch = ",".join([columns, *extra])
+            results = _fan_out(lambda f: self._select(fetch, f, order, limit), chunks)
+            rows = _merge_select(results, order, limit, extra)
+        else:
+            rows = self._select(columns, filters, order, limit)
+        return _rows.as_rows(rows, self.row_type)
+
+    def _select(self, columns: str, filters: Optional[dict], order: Optional[str],
+                limit: Optional[int]) -> list:
+        params = _select_params(columns, filters, order, limit)
+        key = None
+        if self._cache is not None:
+            key = _cache.make_key(self.name, columns, filters, order, limit)
+            rows = self._cache.get(key)
+            if rows is not None:
+                _trace.record(self.name, "select", params, 0.0, rows, cached=True)
+                return rows
+            generation = self._cache.generation
+        rows = self._request("select", "GET", params=params)
+        if key is not None:
+            self._cache.put(key, rows, generation)
+        return rows
+
+    def select_iter(
+        self,
+        columns: str = "*",
+        filters: Optional[dict] = None,
+        order: str = "id.asc",
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> Iterator[dict]:
+        """
+        Yield every matching row, fetching `page_size` rows per request with a
+        PostgREST Range header so memory stays flat on large tables. `order`
+        must be a total order (defaults to the primary key) for stable pages.
+
+        Pages advance by the rows actually returned and stop on an empty page,
+        so a server-side max-rows cap smaller than page_size cannot truncate.
+        An oversized in.() filter is walked chunk by chunk (ordered per chunk).
+        """
+        chunks = _chunk_filters(filters)
+        if chunks:
+            for f in chunks:
+                yield from self.select_iter(columns, f, order, page_size)
+            return
+        params = _select_params(columns, filters, order, None)
+        offset = 0
+        while True:
+            try:
+                page = self._request("select", "GET", params=params,
+                                     headers=_range_headers(offset, page_size))
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 416:  # offset past the last row
+                    return
+                raise
+            if not page:
+                return
+            yield from _rows.as_rows(page, self.row_type)
+            offset += len(page)
 
     def insert(self, data) -> list:
-        r = _client.post(self.url, json=data)
-        r.raise_for_status()
-        return r.json()
+        batches = _batches(data)
+        if batches:
+            return [row for rows in _fan_out(self.insert, batches) for row in rows]
+        return self._request("insert", "POST", json=data)
 
     def update(self, data: dict, filters: dict) -> list:
-        r = _client.patch(self.url, params=filters, json=data)
-        r.raise_for_status()
-        return r.json()
+        chunks = _chunk_filters(filters)
+        if chunks:
+            return [row for rows in _fan_out(lambda f: self.update(data, f), chunks) for row in rows]
+        return self._request("update", "PATCH", params=filters, json=data)
 
-    def upsert(self, data, on_conflict: str = "id") -> list:
-        headers = {"Prefer": "return=representation,resolution=merge-duplicates"}
-        r = _client.post(self.url, headers=headers, params={"on_conflict": on_conflict}, json=data)
-        r.raise_for_status()
-        return r.json()
+    def upsert(self, data, on_conflict: str = "id", ignore_duplicates: bool = False) -> list:
+        """Insert or merge on `on_conflict`; ignore_duplicates keeps existing rows untouched."""
+        batches = _batches(data)
+        if batches:
+            results = _fan_out(lambda b: self.upsert(b, on_conflict, ignore_duplicates), batches)
+            return [row for rows in results for row in rows]
+        return self._request(
+            "upsert", "POST",
+            params={"on_conflict": on_conflict},
+            headers={"Prefer": _UPSERT_IGNORE_PREFER if ignore_duplicates else _UPSERT_PREFER},
+            json=data,
+        )
 
     def delete(self, filters: dict) -> list:
-        r = _client.delete(self.url, params=filters)
-        r.raise_for_status()
-        return r.json()
+        chunks = _chunk_filters(filters)
+        if chunks:
+            return [row for rows in _fan_out(self.delete, chunks) for row in rows]
+        return self._request("delete", "DELETE", params=filters)
+
+
+class AsyncSupabaseTable:
+    """Async twin of SupabaseTable for `async def` routes (same surface, awaitable)."""
+
+    def __init__(self, name: str, cached: bool = True, row_type: Optional[type] = None):
+        self.name = name
+        self.url = f"{REST_URL}/{name}"
+        self._cache = _cache.get_cache(name) if cached else None
+        self.row_type = row_type
+
+    async def _request(
+        self,
+        verb: str,
+        method: str,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        json=None,
+    ) -> list:
+        started = time.perf_counter()
+        rows = None
+        try:
+            r = await _transport.asend(
+                _async_client, verb, method, self.url, params=params, headers=headers, json=json
+            )
+            rows = _rows.decode(r.content)
+            return rows
+        finally:
+            if verb != "select":
+                _cache.invalidate(self.name)
+            _trace.record(self.name, verb, params, started, rows)
+
+    async def select(
+        self,
+        columns: str = "*",
+        filters: Optional[dict] = None,
+        order: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> list:
+        chunks = _chunk_filters(filters)
+        if chunks:
+            extra = _order_columns(columns, order)
+            fetch = ",".join([columns, *extra])
+            results = await _afan_out(lambda f: self._select(fetch, f, order, limit), chunks)
+            rows = _merge_select(results, order, limit, extra)
+        else:
+            rows = await self._select(columns, filters, order, limit)
+        return _rows.as_rows(rows, self.row_type)
+
+    async def _select(self, columns: str, filters: Optional[dict], order: Optional[str],
+                      limit: Optional[int]) -> list:
+        params = _select_params(columns, filters, order, limit)
+        key = None
+        if self._cache is not None:
+            key = _cache.make_key(self.name, columns, filters, order, limit)
+            rows = self._cache.get(key)
+            if rows is not None:
+                _trace.record(self.name, "select", params, 0.0, rows, cached=True)
+                return rows
+            generation = self._cache.generation
+        rows = await self._request("select", "GET", params=params)
+        if key is not None:
+            self._cache.put(key, rows, generation)
+        return rows
+
+    async def select_iter(
+        self,
+        columns: str = "*",
+        filters: Optional[dict] = None,
+        order: str = "id.asc",
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> AsyncIterator[dict]:
+        chunks = _chunk_filters(filters)
+        if chunks:
+            for f in chunks:
+                async for row in self.select_iter(columns, f, order, page_size):
+                    yield row
+            return
+        params = _select_params(columns, filters, order, None)
+        offset = 0
+        while True:
+            try:
+                page = await self._request("select", "GET", params=params,
+                                           headers=_range_headers(offset, page_size))
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 416:
+                    return
+                raise
+            if not page:
+                return
+            for row in _rows.as_rows(page, self.row_type):
+                yield row
+            offset += len(page)
+
+    async def insert(self, data) -> list:
+        batches = _batches(data)
+        if batches:
+            return [row for rows in await _afan_out(self.insert, batches) for row in rows]
+        return await self._request("insert", "POST", json=data)
+
+    async def update(self, data: dict, filters: dict) -> list:
+        chunks = _chunk_filters(filters)
+        if chunks:
+            results = await _afan_out(lambda f: self.update(data, f), chunks)
+            return [row for rows in results for row in rows]
+        return await self._request("update", "PATCH", params=filters, json=data)
+
+    async def upsert(self, data, on_conflict: str = "id", ignore_duplicates: bool = False) -> list:
+        batches = _batches(data)
+        if batches:
+            results = await _afan_out(lambda b: self.upsert(b, on_conflict, ignore_duplicates), batches)
+            return [row for rows in results for row in rows]
+        return await self._request(
+            "upsert", "POST",
+            params={"on_conflict": on_conflict},
+            headers={"Prefer": _UPSERT_IGNORE_PREFER if ignore_duplicates else _UPSERT_PREFER},
+            json=data,
+        )
+
+    async def delete(self, filters: dict) -> list:
+        chunks = _chunk_filters(filters)
+        if chunks:
+            return [row for rows in await _afan_out(self.delete, chunks) for row in rows]
+        return await self._request("delete", "DELETE", params=filters)
+
+
+def table(name: str, cached: bool = True, row_type: Optional[type] = None) -> SupabaseTable:
+    """
+    Return a PostgREST wrapper for `name`. Selects are served from the
+    read-through cache when one is enabled for the table (see db/cache.py);
+    pass cached=False for reads that must hit the database. With row_type
+    (e.g. db.rows.GraphNode) selects return slotted row objects, not dicts.
+    """
+    return SupabaseTable(name, cached=cached, row_type=row_type)
+
+
+def async_table(name: str, cached: bool = True, row_type: Optional[type] = None) -> AsyncSupabaseTable:
+    return AsyncSupabaseTable(name, cached=cached, row_type=row_type)
+
+
+class RpcNotFoundError(httpx.HTTPStatusError):
+    """
+    The SQL function is not deployed (PostgREST 404 with PGRST202, or 42883
+    from Postgres). Callers with a client-side fallback catch exactly this;
+    any other rpc failure must reach the caller.
+    """
+
+    def __init__(self, name: str, response: Optional[httpx.Response] = None):
+        if response is None:
+            response = httpx.Response(404, request=httpx.Request("POST", f"{REST_URL}/rpc/{name}"))
+        super().__init__(f"SQL function {name!r} is not deployed",
+                         request=response.request, response=response)
+        self.name = name
+
+
+_MISSING_FUNCTION_CODES = {"PGRST202", "42883"}
+# Read-only SQL functions (STABLE, or get_graph_bundle's ON CONFLICT DO NOTHING
+# user insert): safe to retry like a GET
+_IDEMPOTENT_RPCS = {"user_tier_counts", "course_concept_stats", "get_graph_bundle",
+                    "courses_with_node_counts"}
+# Functions PostgREST reported missing; later calls raise without a round-trip
+# (until restart or use_local_backend - deploying a function needs a restart).
+_missing_rpcs: set = set()
+
+
+def _is_missing_function(err: httpx.HTTPStatusError) -> bool:
+    if err.response.status_code != 404:
+        return False
+    try:
+        code = err.response.json().get("code")
+    except ValueError:
+        return False
+    return code in _MISSING_FUNCTION_CODES
+
+
+def rpc(name: str, args: Optional[dict] = None, writes: tuple = ()):
+    """
+    Call a SQL function through PostgREST (POST /rest/v1/rpc/<name>) and return
+    its decoded result. The functions live in db/supabase_functions.sql; use
+    them for aggregates so the database sends summaries instead of raw rows.
+    `writes` names the tables the function modifies: their read caches are
+    dropped once the call returns or fails, as after a table() write.
+    Raises RpcNotFoundError if the function is not deployed.
+    """
+    if name in _missing_rpcs:
+        raise RpcNotFoundError(name)
+    started = time.perf_counter()
+    result = None
+    try:
+        r = _transport.send(_client, "rpc", "POST", f"{REST_URL}/rpc/{name}",
+                            idempotent=name in _IDEMPOTENT_RPCS, json=args or {})
+        result = _rows.decode(r.content)
+        return result
+    except httpx.HTTPStatusError as e:
+        if _is_missing_function(e):
+            _missing_rpcs.add(name)
+            raise RpcNotFoundError(name, e.response) from e
+        raise
+    finally:
+        for written in writes:
+            _cache.invalidate(written)
+        _trace.record(f"rpc/{name}", "rpc", None, started, result)
+
+
+async def rpc_async(name: str, args: Optional[dict] = None, writes: tuple = ()):
+    if name in _missing_rpcs:
+        raise RpcNotFoundError(name)
+    started = time.perf_counter()
+    result = None
+    try:
+        r = await _transport.asend(_async_client, "rpc", "POST", f"{REST_URL}/rpc/{name}",
+                                   idempotent=name in _IDEMPOTENT_RPCS, json=args or {})
+        result = _rows.decode(r.content)
+        return result
+    except httpx.HTTPStatusError as e:
+        if _is_missing_function(e):
+            _missing_rpcs.add(name)
+            raise RpcNotFoundError(name, e.response) from e
+        raise
+    finally:
+        for written in writes:
+            _cache.invalidate(written)
+        _trace.record(f"rpc/{name}", "rpc", None, started, result)
+
+
+cache_stats = _cache.cache_stats
+
+
+def transport_stats() -> dict:
+    """Pool, retry and circuit-breaker state of the Supabase clients."""
+    return _transport.transport_stats(_client, _async_client)
+
+
+def use_local_backend(db_path: str = ":memory:", seed: bool = False, max_rows: Optional[int] = None):
+    """
+    Point every table()/async_table() at an in-process SQLite PostgREST
+    stand-in. Returns the LocalPostgrest so callers can seed or inspect it.
+    """
+    global _client, _async_client, REST_URL
+    from db.local_postgrest import LocalPostgrest, LocalPostgrestTransport
+
+    backend = LocalPostgrest(db_path, seed=seed, max_rows=max_rows)
+    transport = LocalPostgrestTransport(backend)
+    _client = _transport.build_client(_HEADERS, transport=transport)
+    _async_client = _transport.build_async_client(_HEADERS, transport=transport)
+    REST_URL = LOCAL_REST_URL
+    _missing_rpcs.clear()
+    return backend
+
+
+if SUPABASE_LOCAL_DB:
+    use_local_backend(SUPABASE_LOCAL_DB, seed=True)
 
 
-def table(name: str) -> SupabaseTable:
-    return SupabaseTable(name)
+async def aclose() -> None:
+    """Close the async client's pooled connections (called on app shutdown)."""
+    await _async_client.aclose()
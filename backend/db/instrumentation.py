@@ -0,0 +1,127 @@
+"""
+db/instrumentation.py
+
+Per-request record of every PostgREST call made through db.connection:
+table, verb, latency and row count. main.py opens a trace for each HTTP
+request, reports the totals in X-DB-Queries / X-DB-Time-Ms response headers,
+and keeps the most recent traces for GET /api/debug/queries.
+
+A request that issues more than DB_N1_THRESHOLD queries of the same shape
+(table + verb + filtered columns/operators, ignoring values) is logged as a
+likely N+1 loop.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Optional
+
+logger = logging.getLogger("sapling.db")
+
+N1_THRESHOLD = int(os.getenv("DB_N1_THRESHOLD", "5"))
+RECENT_TRACES = int(os.getenv("DB_RECENT_TRACES", "50"))
+
+_NON_FILTER_PARAMS = {"select", "order", "limit", "offset", "on_conflict"}
+
+
+def query_shape(table: str, verb: str, params: Optional[dict]) -> tuple:
+    """Identify 'the same query with different values' — e.g. eq.<id> per loop iteration."""
+    filters = tuple(sorted(
+        (col, str(expr).split(".", 1)[0])
+        for col, expr in (params or {}).items()
+        if col not in _NON_FILTER_PARAMS
+    ))
+    return (table, verb, filters)
+
+
+class RequestTrace:
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.queries: list = []
+        self._shapes: Counter = Counter()
+        self._warned: set = set()
+        self._lock = threading.Lock()
+
+    def record(self, table: str, verb: str, params: Optional[dict], latency_ms: float,
+               rows: Optional[int], cached: bool = False) -> None:
+        shape = query_shape(table, verb, params)
+        with self._lock:
+            self.queries.append({
+                "table": table,
+                "verb": verb,
+                "latency_ms": round(latency_ms, 2),
+                "rows": rows,
+                "cached": cached,
+            })
+            if cached:
+                return
+            self._shapes[shape] += 1
+            count = self._shapes[shape]
+            if count <= N1_THRESHOLD or shape in self._warned:
+                return
+            self._warned.add(shape)
+        logger.warning(
+            "Possible N+1 in %s: more than %d %s queries on %s filtered by %s",
+            self.label or "request", N1_THRESHOLD, verb, table,
+            ", ".join(f"{c}={op}" for c, op in shape[2]) or "nothing",
+        )
+
+    @property
+    def round_trips(self) -> int:
+        return sum(1 for q in self.queries if not q["cached"])
+
+    @property
+    def total_ms(self) -> float:
+        return round(sum(q["latency_ms"] for q in self.queries), 2)
+
+    def summary(self) -> dict:
+        with self._lock:
+            repeated = [
+                {"table": t, "verb": v, "filters": [f"{c}={op}" for c, op in f], "count": n}
+                for (t, v, f), n in self._shapes.most_common()
+                if n > 1
+            ]
+            return {
+                "request": self.label,
+                "round_trips": self.round_trips,
+                "cache_hits": len(self.queries) - self.round_trips,
+                "db_time_ms": self.total_ms,
+                "repeated_shapes": repeated,
+                "queries": list(self.queries),
+            }
+
+
+_current: ContextVar[Optional[RequestTrace]] = ContextVar("db_request_trace", default=None)
+_recent: deque = deque(maxlen=RECENT_TRACES)
+
+
+def start_trace(label: str = "") -> RequestTrace:
+    trace = RequestTrace(label)
+    _current.set(trace)
+    return trace
+
+
+def finish_trace(trace: RequestTrace) -> None:
+    _recent.append(trace)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current.get()
+
+
+def record(table: str, verb: str, params: Optional[dict], started: float,
+           rows: Optional[list], cached: bool = False) -> None:
+    """Attach one call to the active request trace (no-op outside a request)."""
+    trace = _current.get()
+    if trace is None:
+        return
+    latency_ms = 0.0 if cached else (time.perf_counter() - started) * 1000
+    count = len(rows) if isinstance(rows, list) else None
+    trace.record(table, verb, params, latency_ms, count, cached=cached)
+
+
+def recent_traces() -> list:
+    return [t.summary() for t in reversed(_recent)]
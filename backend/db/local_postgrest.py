@@ -0,0 +1,408 @@
+"""
+db/local_postgrest.py
+
+In-process PostgREST stand-in backed by SQLite, for tests and offline load
+testing. It plugs into the httpx clients in db/connection.py as a transport,
+so every route runs its real query code with no network:
+
+    SUPABASE_LOCAL_DB=:memory: uvicorn main:app          # fresh empty DB
+    SUPABASE_LOCAL_DB=sapling_local.db uvicorn main:app  # persisted on disk
+
+or from Python (tests):
+
+    from db.connection import use_local_backend
+    backend = use_local_backend()   # returns the LocalPostgrest instance
+
+The schema is translated from db/supabase_schema.sql. Supported PostgREST
+subset: select=<columns>, eq/neq/gt/gte/lt/lte/like/ilike, in.(), not.in.(),
+is.null / not.is.null, order=<col>.<asc|desc>[.nullsfirst|.nullslast],
+limit/offset, Range headers (206 / 416), on_conflict upserts with
+resolution=merge-duplicates or ignore-duplicates, and
+Prefer: return=representation|minimal, and POST /rpc/<name> for the SQL
+functions in db/supabase_functions.sql (implemented in db/local_rpc.py).
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Optional
+from urllib.parse import parse_qsl
+
+import httpx
+
+from db.local_rpc import FUNCTIONS as RPC_FUNCTIONS
+from db.postgrest_syntax import split_in_list
+
+DB_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_PATH = os.path.join(DB_DIR, "supabase_schema.sql")
+SEED_PATH = os.path.join(DB_DIR, "seed.sql")
+
+_RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+_OPERATORS = {
+    "eq": "=",
+    "neq": "!=",
+    "gt": ">",
+    "gte": ">=",
+    "lt": "<",
+    "lte": "<=",
+    "like": "LIKE",
+    "ilike": "LIKE",  # SQLite LIKE is already case-insensitive for ASCII
+}
+
+
+class PostgrestError(Exception):
+    def __init__(self, status: int, message: str, code: str = "PGRST000"):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.code = code
+
+
+# ── Schema translation ────────────────────────────────────────────────────────
+
+def translate_schema(sql: str) -> str:
+    """Rewrite the Postgres DDL we use into SQLite-compatible DDL."""
+    sql = re.sub(r"--[^\n]*", "", sql)
+    sql = re.sub(r"DEFAULT\s+gen_random_uuid\(\)::TEXT", "DEFAULT (lower(hex(randomblob(16))))", sql, flags=re.I)
+    sql = re.sub(r"DEFAULT\s+now\(\)", "DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))", sql, flags=re.I)
+    sql = re.sub(r"\bBIGSERIAL PRIMARY KEY\b", "INTEGER PRIMARY KEY AUTOINCREMENT", sql, flags=re.I)
+    sql = re.sub(r"\bTIMESTAMPTZ\b", "TEXT", sql, flags=re.I)
+    sql = re.sub(r"\bJSONB\b", "JSON", sql, flags=re.I)
+    sql = re.sub(r"\bDOUBLE PRECISION\b", "REAL", sql, flags=re.I)
+    # Columns added to older databases are already part of CREATE TABLE here
+    sql = re.sub(r"ALTER TABLE \w+ ADD COLUMN IF NOT EXISTS [^;]*;", "", sql, flags=re.I)
+    # ...and never had the constraints older databases drop
+    sql = re.sub(r"ALTER TABLE \w+ DROP CONSTRAINT IF EXISTS [^;]*;", "", sql, flags=re.I)
+    return sql
+
+
+def _parse_columns(ddl: str) -> dict:
+    """Map table name → {column: declared type} from translated CREATE TABLE statements."""
+    tables: dict = {}
+    for m in re.finditer(r"CREATE TABLE IF NOT EXISTS (\w+)\s*\((.*?)\);", ddl, re.S | re.I):
+        cols: dict = {}
+        for line in m.group(2).split(","):
+            parts = line.strip().split()
+            if len(parts) < 2 or parts[0].upper() in {"PRIMARY", "UNIQUE", "FOREIGN", "CONSTRAINT", "CHECK"}:
+                continue
+            cols[parts[0]] = parts[1].upper()
+        tables[m.group(1)] = cols
+    return tables
+
+
+def _parse_range(header: Optional[str]) -> Optional[tuple]:
+    """Parse a PostgREST `Range: <first>-<last>` header (inclusive, zero-based)."""
+    if not header:
+        return None
+    m = re.fullmatch(r"\s*(\d+)-(\d+)\s*", header)
+    if not m:
+        raise PostgrestError(416, f"invalid range: {header}", "PGRST103")
+    first, last = int(m.group(1)), int(m.group(2))
+    if last < first:
+        raise PostgrestError(416, f"invalid range: {header}", "PGRST103")
+    return first, last
+
+
+# ── The stand-in ──────────────────────────────────────────────────────────────
+
+class LocalPostgrest:
+    """A SQLite database answering PostgREST-shaped HTTP requests."""
+
+    def __init__(
+        self,
+        db_path: str = ":memory:",
+        schema_path: str = SCHEMA_PATH,
+        seed: bool = False,
+        max_rows: Optional[int] = None,
+    ):
+        self.db_path = db_path
+        self.max_rows = max_rows  # emulates PostgREST's db-max-rows cap
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._lock = threading.RLock()
+        with open(schema_path) as f:
+            ddl = translate_schema(f.read())
+        self._conn.executescript(ddl)
+        self.columns = _parse_columns(ddl)
+        if seed:
+            self.execute_script(SEED_PATH)
+
+    # ── helpers ──
+
+    def execute_script(self, path: str) -> None:
+        with open(path) as f:
+            script = f.read()
+        with self._lock:
+            self._conn.executescript(script)
+
+    def query(self, sql: str, args: tuple = ()) -> list:
+        """Run raw SQL against the stand-in (handy for test setup and assertions)."""
+        with self._lock:
+            return [self._decode_row(dict(r)) for r in self._conn.execute(sql, args).fetchall()]
+
+    @contextmanager
+    def transaction(self):
+        """Run the enclosed query() calls atomically (rpc functions that write several tables)."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _table_columns(self, name: str) -> dict:
+        cols = self.columns.get(name)
+        if cols is None:
+            raise PostgrestError(404, f'relation "public.{name}" does not exist', "42P01")
+        return cols
+
+    def _column(self, cols: dict, name: str) -> str:
+        if name not in cols:
+            raise PostgrestError(400, f'column "{name}" does not exist', "42703")
+        return name
+
+    def _encode(self, cols: dict, column: str, value):
+        kind = cols.get(column, "")
+        if kind == "JSON" and value is not None:
+            return json.dumps(value)
+        if kind == "BOOLEAN" and isinstance(value, bool):
+            return int(value)
+        return value
+
+    def _decode_row(self, row: dict, cols: Optional[dict] = None) -> dict:
+        for key, value in row.items():
+            kind = (cols or {}).get(key, "")
+            if kind == "JSON" and isinstance(value, str):
+                try:
+                    row[key] = json.loads(value)
+                except ValueError:
+                    pass
+            elif kind == "BOOLEAN" and value is not None:
+                row[key] = bool(value)
+        return row
+
+    def _filter_value(self, cols: dict, column: str, raw: str):
+        if cols.get(column) == "BOOLEAN" and raw in ("true", "false"):
+            return 1 if raw == "true" else 0
+        return raw
+
+    def _where(self, cols: dict, filters: list) -> tuple:
+        clauses, args = [], []
+        for column, expr in filters:
+            self._column(cols, column)
+            negate = expr.startswith("not.")
+            if negate:
+                expr = expr[4:]
+            op, _, value = expr.partition(".")
+            if op == "in":
+                if not (value.startswith("(") and value.endswith(")")):
+                    raise PostgrestError(400, f"malformed in filter: {expr}", "PGRST100")
+                items = [self._filter_value(cols, column, v) for v in split_in_list(value[1:-1])]
+                if items:
+                    clause = f'"{column}" IN ({",".join("?" * len(items))})'
+                    args.extend(items)
+                else:
+                    clause = "0"
+            elif op == "is":
+                if value not in ("null", "true", "false"):
+                    raise PostgrestError(400, f"unsupported is value: {value}", "PGRST100")
+                clause = f'"{column}" IS NULL' if value == "null" else f'"{column}" = {1 if value == "true" else 0}'
+            elif op in _OPERATORS:
+                if op in ("like", "ilike"):
+                    value = value.replace("*", "%")
+                clause = f'"{column}" {_OPERATORS[op]} ?'
+                args.append(self._filter_value(cols, column, value))
+            else:
+                raise PostgrestError(400, f"unsupported operator: {op}", "PGRST100")
+            clauses.append(f"NOT ({clause})" if negate else clause)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+    def _order(self, cols: dict, order: Optional[str]) -> str:
+        if not order:
+            return ""
+        terms = []
+        for part in order.split(","):
+            bits = part.strip().split(".")
+            column = self._column(cols, bits[0])
+            direction = "DESC" if "desc" in bits[1:] else "ASC"
+            if "nullsfirst" in bits[1:]:
+                nulls = " NULLS FIRST"
+            elif "nullslast" in bits[1:]:
+                nulls = " NULLS LAST"
+            else:
+                # Postgres default: NULLs sort as larger than any value
+                nulls = " NULLS FIRST" if direction == "DESC" else " NULLS LAST"
+            terms.append(f'"{column}" {direction}{nulls}')
+        return " ORDER BY " + ", ".join(terms)
+
+    def _projection(self, cols: dict, select: str) -> str:
+        if select.strip() in ("", "*"):
+            return "*"
+        names = [c.strip() for c in select.split(",") if c.strip()]
+        return ", ".join(f'"{self._column(cols, c)}"' for c in names)
+
+    # ── verbs ──
+
+    def select(self, name: str, params: list, row_range: Optional[tuple] = None) -> list:
+        cols = self._table_columns(name)
+        opts = {k: v for k, v in params if k in _RESERVED_PARAMS}
+        filters = [(k, v) for k, v in params if k not in _RESERVED_PARAMS]
+        where, args = self._where(cols, filters)
+        sql = f'SELECT {self._projection(cols, opts.get("select", "*"))} FROM "{name}"{where}'
+        sql += self._order(cols, opts.get("order"))
+        limit = int(opts["limit"]) if "limit" in opts else None
+        offset = int(opts.get("offset", 0))
+        if row_range is not None:
+            offset = row_range[0]
+            limit = row_range[1] - row_range[0] + 1
+        if self.max_rows is not None:
+            limit = self.max_rows if limit is None else min(limit, self.max_rows)
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            args += [limit if limit is not None else -1, offset]
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [self._decode_row(dict(r), cols) for r in rows]
+
+    def insert(self, name: str, params: list, payload, prefer: str) -> list:
+        cols = self._table_columns(name)
+        rows = payload if isinstance(payload, list) else [payload]
+        on_conflict = dict(params).get("on_conflict")
+        merge = "resolution=merge-duplicates" in prefer
+        ignore = "resolution=ignore-duplicates" in prefer
+        if (merge or ignore) and not on_conflict:
+            on_conflict = self._primary_key(name)
+        out = []
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN")
+                for row in rows:
+                    keys = [self._column(cols, k) for k in row]
+                    column_list = ", ".join(f'"{k}"' for k in keys)
+                    sql = f'INSERT INTO "{name}" ({column_list}) VALUES ({", ".join("?" * len(keys))})'
+                    if on_conflict and (merge or ignore):
+                        conflict_cols = [self._column(cols, c.strip()) for c in on_conflict.split(",")]
+                        target = ", ".join(f'"{c}"' for c in conflict_cols)
+                        updates = [k for k in keys if k not in conflict_cols]
+                        if merge and updates:
+                            sets = ", ".join(f'"{k}" = excluded."{k}"' for k in updates)
+                            sql += f" ON CONFLICT ({target}) DO UPDATE SET {sets}"
+                        else:
+                            sql += f" ON CONFLICT ({target}) DO NOTHING"
+                    sql += " RETURNING *"
+                    values = [self._encode(cols, k, row[k]) for k in keys]
+                    out.extend(dict(r) for r in self._conn.execute(sql, values).fetchall())
+                self._conn.execute("COMMIT")
+            except sqlite3.IntegrityError as e:
+                self._conn.execute("ROLLBACK")
+                raise PostgrestError(409, str(e), "23505")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [self._decode_row(r, cols) for r in out]
+
+    def update(self, name: str, params: list, payload: dict) -> list:
+        cols = self._table_columns(name)
+        filters = [(k, v) for k, v in params if k not in _RESERVED_PARAMS]
+        where, args = self._where(cols, filters)
+        keys = [self._column(cols, k) for k in payload]
+        if not keys:
+            return []
+        sets = ", ".join(f'"{k}" = ?' for k in keys)
+        values = [self._encode(cols, k, payload[k]) for k in keys]
+        with self._lock:
+            try:
+                rows = self._conn.execute(
+                    f'UPDATE "{name}" SET {sets}{where} RETURNING *', values + args
+                ).fetchall()
+            except sqlite3.IntegrityError as e:
+                raise PostgrestError(409, str(e), "23503")
+        return [self._decode_row(dict(r), cols) for r in rows]
+
+    def delete(self, name: str, params: list) -> list:
+        cols = self._table_columns(name)
+        filters = [(k, v) for k, v in params if k not in _RESERVED_PARAMS]
+        where, args = self._where(cols, filters)
+        with self._lock:
+            try:
+                rows = self._conn.execute(f'DELETE FROM "{name}"{where} RETURNING *', args).fetchall()
+            except sqlite3.IntegrityError as e:
+                raise PostgrestError(409, str(e), "23503")
+        return [self._decode_row(dict(r), cols) for r in rows]
+
+    def rpc(self, name: str, args: Optional[dict]):
+        fn = RPC_FUNCTIONS.get(name)
+        if fn is None:
+            raise PostgrestError(404, f"Could not find the function public.{name}", "PGRST202")
+        with self._lock:
+            return fn(self, args or {})
+
+    def _primary_key(self, name: str) -> str:
+        with self._lock:
+            info = self._conn.execute(f'PRAGMA table_info("{name}")').fetchall()
+        pk = [r["name"] for r in sorted(info, key=lambda r: r["pk"]) if r["pk"]]
+        return ",".join(pk) or "id"
+
+    # ── HTTP entry point ──
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        marker = "/rest/v1/"
+        if marker not in path:
+            return httpx.Response(404, json={"message": f"unknown path {path}"})
+        name = path.split(marker, 1)[1].strip("/")
+        params = parse_qsl(request.url.query.decode(), keep_blank_values=True)
+        prefer = request.headers.get("Prefer", "")
+        try:
+            body = json.loads(request.content) if request.content else None
+            if name.startswith("rpc/"):
+                if request.method != "POST":
+                    return httpx.Response(405, json={"message": "rpc calls must use POST"})
+                return httpx.Response(200, json=self.rpc(name[4:], body))
+            if request.method == "GET":
+                row_range = _parse_range(request.headers.get("Range"))
+                rows = self.select(name, params, row_range)
+                if row_range is None:
+                    return httpx.Response(200, json=rows)
+                if not rows and row_range[0] > 0:
+                    return httpx.Response(416, json={"code": "PGRST103", "message": "Requested range not satisfiable"})
+                end = row_range[0] + len(rows) - 1
+                content_range = f"{row_range[0]}-{end}/*" if rows else "*/*"
+                return httpx.Response(206, json=rows, headers={"Content-Range": content_range})
+            if request.method == "POST":
+                rows = self.insert(name, params, body, prefer)
+            elif request.method == "PATCH":
+                rows = self.update(name, params, body or {})
+            elif request.method == "DELETE":
+                rows = self.delete(name, params)
+            else:
+                return httpx.Response(405, json={"message": f"method {request.method} not allowed"})
+        except PostgrestError as e:
+            return httpx.Response(e.status, json={"code": e.code, "message": e.message})
+        except (sqlite3.Error, ValueError) as e:
+            return httpx.Response(400, json={"code": "PGRST100", "message": str(e)})
+        if "return=representation" in prefer:
+            return httpx.Response(201 if request.method == "POST" else 200, json=rows)
+        return httpx.Response(204)
+
+
+class LocalPostgrestTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """httpx transport (sync and async) that routes requests to a LocalPostgrest."""
+
+    def __init__(self, backend: LocalPostgrest):
+        self.backend = backend
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        return self.backend.handle(request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        return self.backend.handle(request)
@@ -0,0 +1,198 @@
+"""
+db/local_rpc.py
+
+SQLite implementations of the SQL functions in db/supabase_functions.sql, so
+the local PostgREST stand-in can answer POST /rest/v1/rpc/<name> the way
+Supabase does. Each function takes the LocalPostgrest instance and the JSON
+arguments and returns the JSON result. Keep these in sync with the SQL file.
+"""
+
+import json
+from typing import Callable
+
+FUNCTIONS: dict[str, Callable] = {}
+
+
+def rpc_function(name: str):
+    def register(fn: Callable) -> Callable:
+        FUNCTIONS[name] = fn
+        return fn
+    return register
+
+
+def _json(value):
+    return json.loads(value) if isinstance(value, str) else value
+
+
+@rpc_function("user_tier_counts")
+def user_tier_counts(db, args: dict) -> list:
+    rows = db.query(
+        """
+        SELECT user_id,
+               SUM(node_count) AS total,
+               SUM(mastered)   AS mastered,
+               SUM(learning)   AS learning,
+               SUM(struggling) AS struggling,
+               SUM(unexplored) AS unexplored
+        FROM subject_stats
+        GROUP BY user_id
+        """
+    )
+    top = db.query(
+        """
+        SELECT user_id, concept_name FROM (
+            SELECT user_id, concept_name,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY user_id ORDER BY mastery_score DESC, concept_name DESC
+                   ) AS rank
+            FROM graph_nodes
+            WHERE mastery_tier = 'mastered'
+        )
+        WHERE rank <= 4
+        ORDER BY user_id, rank
+        """
+    )
+    top_by_user: dict = {}
+    for r in top:
+        top_by_user.setdefault(r["user_id"], []).append(r["concept_name"])
+    for r in rows:
+        r["top_concepts"] = top_by_user.get(r["user_id"], [])
+    return rows
+
+
+@rpc_function("course_concept_stats")
+def course_concept_stats(db, args: dict) -> dict:
+    course = args.get("p_course_name")
+    concepts = db.query(
+        """
+        SELECT concept_name,
+               COUNT(*)                                                  AS n,
+               SUM(COALESCE(mastery_score, 0))                           AS score_sum,
+               SUM(CASE WHEN mastery_tier = 'struggling' THEN 1 ELSE 0 END) AS struggling,
+               SUM(CASE WHEN mastery_tier = 'mastered' THEN 1 ELSE 0 END)   AS mastered
+        FROM graph_nodes
+        WHERE subject = ?
+        GROUP BY concept_name
+        ORDER BY MIN(id)
+        """,
+        (course,),
+    )
+    students = db.query(
+        "SELECT COUNT(DISTINCT user_id) AS n FROM graph_nodes WHERE subject = ?", (course,)
+    )
+    contexts = db.query(
+        """
+        SELECT q.context_json
+        FROM quiz_context q
+        JOIN graph_nodes n ON n.id = q.concept_node_id AND n.subject = ?
+        WHERE q.user_id IN (SELECT user_id FROM graph_nodes WHERE subject = ?)
+        ORDER BY q.id
+        """,
+        (course, course),
+    )
+    return {
+        "student_count": students[0]["n"],
+        "concepts": [{**c, "score_sum": float(c["score_sum"])} for c in concepts],
+        "contexts": [_json(r["context_json"]) for r in contexts],
+    }
+
+
+@rpc_function("get_graph_bundle")
+def get_graph_bundle(db, args: dict) -> dict:
+    user_id = args.get("p_user_id")
+    db.query(
+        "INSERT OR IGNORE INTO users (id, name, streak_count) VALUES (?, ?, 0)",
+        (user_id, args.get("p_name")),
+    )
+    users = db.query("SELECT streak_count FROM users WHERE id = ?", (user_id,))
+    return {
+        "nodes": db.query("SELECT * FROM graph_nodes WHERE user_id = ?", (user_id,)),
+        "edges": db.query("SELECT * FROM graph_edges WHERE user_id = ?", (user_id,)),
+        "streak": users[0]["streak_count"],
+        "course_names": [
+            r["course_name"]
+            for r in db.query("SELECT course_name FROM courses WHERE user_id = ?", (user_id,))
+        ],
+        "version": db.query(
+            "SELECT COALESCE(MAX(id), 0) AS v FROM graph_changes WHERE user_id = ?", (user_id,)
+        )[0]["v"],
+    }
+
+
+@rpc_function("courses_with_node_counts")
+def courses_with_node_counts(db, args: dict) -> list:
+    return db.query(
+        """
+        SELECT c.id, c.course_name, c.color, COALESCE(s.node_count, 0) AS node_count, c.created_at
+        FROM courses c
+        LEFT JOIN subject_stats s ON s.user_id = c.user_id AND s.subject = c.course_name
+        WHERE c.user_id = ?
+        ORDER BY c.created_at
+        """,
+        (args.get("p_user_id"),),
+    )
+
+
+@rpc_function("delete_course_cascade")
+def delete_course_cascade(db, args: dict) -> dict:
+    user_id, course = args.get("p_user_id"), args.get("p_course_name")
+    course_nodes = "SELECT id FROM graph_nodes WHERE user_id = ? AND subject = ?"
+    with db.transaction():
+        node_ids = [r["id"] for r in db.query(course_nodes, (user_id, course))]
+        quiz_context = db.query(
+            f"DELETE FROM quiz_context WHERE concept_node_id IN ({course_nodes}) RETURNING id",
+            (user_id, course),
+        )
+        quiz_attempts = db.query(
+            f"DELETE FROM quiz_attempts WHERE concept_node_id IN ({course_nodes}) RETURNING id",
+            (user_id, course),
+        )
+        edge_ids = [
+            r["id"]
+            for r in db.query(
+                f"DELETE FROM graph_edges WHERE source_node_id IN ({course_nodes}) "
+                f"OR target_node_id IN ({course_nodes}) RETURNING id",
+                (user_id, course, user_id, course),
+            )
+        ]
+        db.query("DELETE FROM graph_nodes WHERE user_id = ? AND subject = ?", (user_id, course))
+        courses = db.query(
+            "DELETE FROM courses WHERE user_id = ? AND course_name = ? RETURNING id",
+            (user_id, course),
+        )
+        db.query("DELETE FROM subject_stats WHERE user_id = ? AND subject = ?", (user_id, course))
+        changes = [(user_id, "node", node_id, course)
+                   for node_id in node_ids + [f"subject_root__{course}"]]
+        changes += [(user_id, "edge", edge_id, None) for edge_id in edge_ids]
+        for row in changes:
+            db.query(
+                "INSERT INTO graph_changes (user_id, entity, entity_id, subject) VALUES (?, ?, ?, ?)",
+                row,
+            )
+    return {
+        "quiz_context": len(quiz_context),
+        "quiz_attempts": len(quiz_attempts),
+        "graph_edges": len(edge_ids),
+        "graph_nodes": len(node_ids),
+        "courses": len(courses),
+    }
+
+
+_STAT_COLUMNS = ("node_count", "mastery_sum", "times_studied",
+                 "mastered", "learning", "struggling", "unexplored")
+
+
+@rpc_function("apply_subject_stats_deltas")
+def apply_subject_stats_deltas(db, args: dict) -> None:
+    user_id = args.get("p_user_id")
+    columns = ", ".join(_STAT_COLUMNS)
+    increments = ", ".join(f"{c} = {c} + excluded.{c}" for c in _STAT_COLUMNS)
+    with db.transaction():
+        for d in _json(args.get("p_deltas")) or []:
+            db.query(
+                f"INSERT INTO subject_stats (user_id, subject, {columns}) "
+                f"VALUES (?, ?{', ?' * len(_STAT_COLUMNS)}) "
+                f"ON CONFLICT (user_id, subject) DO UPDATE SET {increments}, "
+                "updated_at = CURRENT_TIMESTAMP",
+                (user_id, d["subject"], *(d.get(c) or 0 for c in _STAT_COLUMNS)),
+            )
@@ -0,0 +1,37 @@
+"""
+db/postgrest_syntax.py
+
+Quoting rules for values inside PostgREST in.() filters, shared by the
+client side (db/connection.py builds and re-chunks filters) and the local
+stand-in (db/local_postgrest.py parses them), so both read the same syntax.
+A value containing a comma, parenthesis, double quote, space or backslash is
+double-quoted, and its quotes and backslashes are escaped with a backslash.
+"""
+
+
+def format_in_value(value: str) -> str:
+    """One in.() list item, quoted and escaped if needed."""
+    if not any(ch in value for ch in ',()" \\'):
+        return value
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def split_in_list(raw: str) -> list:
+    """Split the inside of in.(a,"b,c",d) honouring PostgREST double quotes and backslash escapes."""
+    values, buf, quoted, escaped = [], [], False, False
+    for ch in raw:
+        if escaped:
+            buf.append(ch)
+            escaped = False
+        elif ch == "\\" and quoted:
+            escaped = True
+        elif ch == '"':
+            quoted = not quoted
+        elif ch == "," and not quoted:
+            values.append("".join(buf))
+            buf = []
+        else:
+            buf.append(ch)
+    values.append("".join(buf))
+    return [v for v in values if v != ""] if raw else []
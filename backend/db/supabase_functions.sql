@@ -0,0 +1,214 @@
+-- ============================================================
+-- Sapling — Supabase SQL functions (PostgREST /rpc/ endpoints)
+-- Run this in: Supabase Dashboard → SQL Editor → New query
+-- Run AFTER supabase_schema.sql
+--
+-- Called from Python with db.connection.rpc(name, args). The local
+-- SQLite stand-in implements the same functions in db/local_rpc.py —
+-- keep the two in sync.
+-- ============================================================
+
+-- Per-user mastery tier counts (summed from subject_stats) plus the top 4
+-- mastered concepts (GET /api/social/students)
+CREATE OR REPLACE FUNCTION user_tier_counts()
+RETURNS TABLE (
+    user_id      TEXT,
+    total        INTEGER,
+    mastered     INTEGER,
+    learning     INTEGER,
+    struggling   INTEGER,
+    unexplored   INTEGER,
+    top_concepts TEXT[]
+)
+LANGUAGE sql STABLE AS $$
+    SELECT
+        s.user_id,
+        SUM(s.node_count)::INTEGER,
+        SUM(s.mastered)::INTEGER,
+        SUM(s.learning)::INTEGER,
+        SUM(s.struggling)::INTEGER,
+        SUM(s.unexplored)::INTEGER,
+        COALESCE(
+            (SELECT ARRAY_AGG(t.concept_name)
+             FROM (
+                 SELECT n.concept_name
+                 FROM graph_nodes n
+                 WHERE n.user_id = s.user_id AND n.mastery_tier = 'mastered'
+                 ORDER BY n.mastery_score DESC, n.concept_name DESC
+                 LIMIT 4
+             ) t),
+            '{}'
+        )
+    FROM subject_stats s
+    GROUP BY s.user_id;
+$$;
+
+-- Per-concept mastery totals for one course, the number of students in it,
+-- and the quiz contexts recorded against its concepts (update_course_context)
+CREATE OR REPLACE FUNCTION course_concept_stats(p_course_name TEXT)
+RETURNS JSON
+LANGUAGE sql STABLE AS $$
+    WITH course_nodes AS (
+        SELECT id, user_id, concept_name, mastery_score, mastery_tier
+        FROM graph_nodes
+        WHERE subject = p_course_name
+    )
+    SELECT json_build_object(
+        'student_count', (SELECT COUNT(DISTINCT user_id) FROM course_nodes),
+        'concepts', COALESCE((
+            SELECT json_agg(c ORDER BY c.first_id)
+            FROM (
+                SELECT
+                    concept_name,
+                    MIN(id)                                                AS first_id,
+                    COUNT(*)                                               AS n,
+                    SUM(COALESCE(mastery_score, 0))                        AS score_sum,
+                    COUNT(*) FILTER (WHERE mastery_tier = 'struggling')    AS struggling,
+                    COUNT(*) FILTER (WHERE mastery_tier = 'mastered')      AS mastered
+                FROM course_nodes
+                GROUP BY concept_name
+            ) c
+        ), '[]'::JSON),
+        'contexts', COALESCE((
+            SELECT json_agg(q.context_json ORDER BY q.id)
+            FROM quiz_context q
+            JOIN course_nodes cn ON cn.id = q.concept_node_id
+            WHERE q.user_id IN (SELECT user_id FROM course_nodes)
+        ), '[]'::JSON)
+    );
+$$;
+
+-- Everything get_graph needs in one round-trip: creates the user row if it is
+-- missing (like ensure_user_exists), then returns the user's nodes, edges,
+-- streak, course names and graph version (latest graph_changes id).
+-- Subject-root synthesis stays in Python.
+CREATE OR REPLACE FUNCTION get_graph_bundle(p_user_id TEXT, p_name TEXT)
+RETURNS JSON
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO users (id, name, streak_count)
+    VALUES (p_user_id, p_name, 0)
+    ON CONFLICT (id) DO NOTHING;
+
+    RETURN json_build_object(
+        'nodes', COALESCE((
+            SELECT json_agg(n) FROM graph_nodes n WHERE n.user_id = p_user_id
+        ), '[]'::JSON),
+        'edges', COALESCE((
+            SELECT json_agg(e) FROM graph_edges e WHERE e.user_id = p_user_id
+        ), '[]'::JSON),
+        'streak', (SELECT streak_count FROM users WHERE id = p_user_id),
+        'course_names', COALESCE((
+            SELECT json_agg(c.course_name) FROM courses c WHERE c.user_id = p_user_id
+        ), '[]'::JSON),
+        'version', (SELECT COALESCE(MAX(id), 0) FROM graph_changes WHERE user_id = p_user_id)
+    );
+END;
+$$;
+
+-- A user's courses with the number of graph nodes in each, oldest first
+-- (GET /api/graph/{user_id}/courses)
+CREATE OR REPLACE FUNCTION courses_with_node_counts(p_user_id TEXT)
+RETURNS TABLE (
+    id          TEXT,
+    course_name TEXT,
+    color       TEXT,
+    node_count  INTEGER,
+    created_at  TIMESTAMPTZ
+)
+LANGUAGE sql STABLE AS $$
+    SELECT c.id, c.course_name, c.color, COALESCE(s.node_count, 0), c.created_at
+    FROM courses c
+    LEFT JOIN subject_stats s ON s.user_id = c.user_id AND s.subject = c.course_name
+    WHERE c.user_id = p_user_id
+    ORDER BY c.created_at;
+$$;
+
+-- Delete a course with its nodes and everything that references them, in one
+-- transaction, and log the removed ids to graph_changes. Returns the number
+-- of rows removed per table (delete_course).
+CREATE OR REPLACE FUNCTION delete_course_cascade(p_user_id TEXT, p_course_name TEXT)
+RETURNS JSON
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_node_ids      TEXT[];
+    v_edge_ids      TEXT[];
+    v_quiz_context  INTEGER;
+    v_quiz_attempts INTEGER;
+    v_nodes         INTEGER;
+    v_courses       INTEGER;
+BEGIN
+    SELECT COALESCE(array_agg(id), '{}') INTO v_node_ids
+    FROM graph_nodes
+    WHERE user_id = p_user_id AND subject = p_course_name;
+
+    DELETE FROM quiz_context WHERE concept_node_id = ANY(v_node_ids);
+    GET DIAGNOSTICS v_quiz_context = ROW_COUNT;
+
+    DELETE FROM quiz_attempts WHERE concept_node_id = ANY(v_node_ids);
+    GET DIAGNOSTICS v_quiz_attempts = ROW_COUNT;
+
+    WITH gone AS (
+        DELETE FROM graph_edges
+        WHERE source_node_id = ANY(v_node_ids) OR target_node_id = ANY(v_node_ids)
+        RETURNING id
+    )
+    SELECT COALESCE(array_agg(id), '{}') INTO v_edge_ids FROM gone;
+
+    DELETE FROM graph_nodes WHERE id = ANY(v_node_ids);
+    GET DIAGNOSTICS v_nodes = ROW_COUNT;
+
+    DELETE FROM courses WHERE user_id = p_user_id AND course_name = p_course_name;
+    GET DIAGNOSTICS v_courses = ROW_COUNT;
+
+    DELETE FROM subject_stats WHERE user_id = p_user_id AND subject = p_course_name;
+
+    INSERT INTO graph_changes (user_id, entity, entity_id, subject)
+    SELECT p_user_id, 'node', node_id, p_course_name
+    FROM unnest(v_node_ids || ('subject_root__' || p_course_name)) AS node_id
+    UNION ALL
+    SELECT p_user_id, 'edge', edge_id, NULL
+    FROM unnest(v_edge_ids) AS edge_id;
+
+    RETURN json_build_object(
+        'quiz_context',  v_quiz_context,
+        'quiz_attempts', v_quiz_attempts,
+        'graph_edges',   COALESCE(array_length(v_edge_ids, 1), 0),
+        'graph_nodes',   v_nodes,
+        'courses',       v_courses
+    );
+END;
+$$;
+
+-- Add per-subject deltas to a user's subject_stats rows, creating missing
+-- rows (apply_graph_update, submit_quiz). p_deltas is a JSON array of
+-- {subject, node_count, mastery_sum, times_studied, mastered, learning,
+-- struggling, unexplored}; the increments are atomic under concurrent writers.
+CREATE OR REPLACE FUNCTION apply_subject_stats_deltas(p_user_id TEXT, p_deltas JSON)
+RETURNS VOID
+LANGUAGE sql AS $$
+    INSERT INTO subject_stats AS s
+        (user_id, subject, node_count, mastery_sum, times_studied,
+         mastered, learning, struggling, unexplored, updated_at)
+    SELECT p_user_id, d.subject, d.node_count, d.mastery_sum, d.times_studied,
+           d.mastered, d.learning, d.struggling, d.unexplored, now()
+    FROM json_to_recordset(p_deltas) AS d(
+        subject       TEXT,
+        node_count    INTEGER,
+        mastery_sum   DOUBLE PRECISION,
+        times_studied INTEGER,
+        mastered      INTEGER,
+        learning      INTEGER,
+        struggling    INTEGER,
+        unexplored    INTEGER
+    )
+    ON CONFLICT (user_id, subject) DO UPDATE SET
+        node_count    = s.node_count    + EXCLUDED.node_count,
+        mastery_sum   = s.mastery_sum   + EXCLUDED.mastery_sum,
+        times_studied = s.times_studied + EXCLUDED.times_studied,
+        mastered      = s.mastered      + EXCLUDED.mastered,
+        learning      = s.learning      + EXCLUDED.learning,
+        struggling    = s.struggling    + EXCLUDED.struggling,
+        unexplored    = s.unexplored    + EXCLUDED.unexplored,
+        updated_at    = now();
+$$;
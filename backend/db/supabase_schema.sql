@@ -19,6 +19,7 @@ CREATE TABLE IF NOT EXISTS graph_nodes (
     id              TEXT PRIMARY KEY,
     user_id         TEXT NOT NULL REFERENCES users(id),
     concept_name    TEXT NOT NULL,
+    concept_key     TEXT,
     mastery_score   DOUBLE PRECISION DEFAULT 0.0,
     mastery_tier    TEXT DEFAULT 'unexplored',
     times_studied   INTEGER DEFAULT 0,
@@ -155,3 +156,79 @@ CREATE TABLE IF NOT EXISTS course_context (
     student_count INTEGER DEFAULT 0,
     updated_at    TIMESTAMPTZ DEFAULT now()
 );
+
+-- Per-user log of graph changes behind GET /api/graph/{user_id}?since=<version>.
+-- A user's graph version is the id of their latest change.
+CREATE TABLE IF NOT EXISTS graph_changes (
+    id         BIGSERIAL PRIMARY KEY,
+    user_id    TEXT NOT NULL,
+    entity     TEXT NOT NULL,
+    entity_id  TEXT NOT NULL,
+    subject    TEXT,
+    created_at TIMESTAMPTZ DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS graph_changes_user_id_idx ON graph_changes (user_id, id);
+
+-- Per-(user, subject) mastery summary, kept current by every mastery write
+-- (apply_subject_stats_deltas). Nodes without a subject count under 'General'.
+CREATE TABLE IF NOT EXISTS subject_stats (
+    user_id       TEXT NOT NULL REFERENCES users(id),
+    subject       TEXT NOT NULL,
+    node_count    INTEGER NOT NULL DEFAULT 0,
+    mastery_sum   DOUBLE PRECISION NOT NULL DEFAULT 0,
+    times_studied INTEGER NOT NULL DEFAULT 0,
+    mastered      INTEGER NOT NULL DEFAULT 0,
+    learning      INTEGER NOT NULL DEFAULT 0,
+    struggling    INTEGER NOT NULL DEFAULT 0,
+    unexplored    INTEGER NOT NULL DEFAULT 0,
+    updated_at    TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (user_id, subject)
+);
+
+-- Backfill summaries for graphs created before the table (no-op once filled).
+INSERT INTO subject_stats
+    (user_id, subject, node_count, mastery_sum, times_studied,
+     mastered, learning, struggling, unexplored)
+SELECT user_id,
+       COALESCE(subject, 'General'),
+       COUNT(*),
+       SUM(COALESCE(mastery_score, 0)),
+       SUM(COALESCE(times_studied, 0)),
+       SUM(CASE WHEN mastery_tier = 'mastered' THEN 1 ELSE 0 END),
+       SUM(CASE WHEN mastery_tier = 'learning' THEN 1 ELSE 0 END),
+       SUM(CASE WHEN mastery_tier = 'struggling' THEN 1 ELSE 0 END),
+       SUM(CASE WHEN mastery_tier = 'unexplored' THEN 1 ELSE 0 END)
+FROM graph_nodes
+GROUP BY user_id, COALESCE(subject, 'General')
+ON CONFLICT (user_id, subject) DO NOTHING;
+
+-- One edge per (source, target): apply_graph_update upserts edges on this key.
+-- Older databases may hold duplicate pairs, which must go before the unique
+-- index can be built. Of each set of duplicates the oldest edge (earliest
+-- created_at, then smallest id) is kept, matching apply_graph_update, which
+-- leaves an existing pair as it is; the rest are deleted. No-op once the
+-- index exists.
+DELETE FROM graph_edges
+WHERE EXISTS (
+    SELECT 1 FROM graph_edges keep
+    WHERE keep.source_node_id = graph_edges.source_node_id
+      AND keep.target_node_id = graph_edges.target_node_id
+      AND (keep.created_at < graph_edges.created_at
+           OR (keep.created_at = graph_edges.created_at AND keep.id < graph_edges.id))
+);
+CREATE UNIQUE INDEX IF NOT EXISTS graph_edges_source_target_key
+    ON graph_edges (source_node_id, target_node_id);
+-- An earlier revision also declared the pair UNIQUE in CREATE TABLE, which
+-- built a second identical index; this index replaces it.
+ALTER TABLE graph_edges DROP CONSTRAINT IF EXISTS graph_edges_source_node_id_target_node_id_key;
+
+-- One node per normalized concept name (services/concept_key_service.py):
+-- apply_graph_update resolves concept names by this key. Older databases get
+-- the column here, then fill it once with `python db/backfill_concept_keys.py`,
+-- which merges existing duplicates; rows without a key don't collide. The key
+-- rules (NFKC case folding, singularization) are Python, so the fill can't be
+-- done in SQL here; until it runs, apply_graph_update matches unkeyed rows by
+-- the key of their concept_name and writes the key back when it updates them.
+ALTER TABLE graph_nodes ADD COLUMN IF NOT EXISTS concept_key TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS graph_nodes_user_concept_key
+    ON graph_nodes (user_id, concept_key);
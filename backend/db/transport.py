@@ -0,0 +1,283 @@
+"""
+db/transport.py
+
+HTTP plumbing for the Supabase clients in db/connection.py: connection-pool
+and HTTP/2 settings, per-verb timeouts, bounded retries with jittered
+exponential backoff for idempotent reads, and a circuit breaker that fails
+fast while Supabase is degraded.
+
+All knobs are environment variables (see .env.example). transport_stats()
+reports pool, retry and breaker state for GET /api/debug/transport.
+"""
+
+import asyncio
+import importlib.util
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+import httpx
+
+HTTP2 = os.getenv("SUPABASE_HTTP2", "1") == "1" and importlib.util.find_spec("h2") is not None
+MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "30"))
+
+CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("SUPABASE_READ_TIMEOUT", "10"))
+WRITE_TIMEOUT = float(os.getenv("SUPABASE_WRITE_TIMEOUT", "30"))
+
+MAX_RETRIES = int(os.getenv("SUPABASE_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("SUPABASE_BACKOFF_BASE", "0.2"))
+BACKOFF_CAP = float(os.getenv("SUPABASE_BACKOFF_CAP", "3"))
+
+BREAKER_THRESHOLD = int(os.getenv("SUPABASE_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET = float(os.getenv("SUPABASE_BREAKER_RESET", "15"))
+
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# select/select_iter are reads; everything else gets the longer write budget
+_VERB_TIMEOUTS = {
+    "select": httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+}
+_DEFAULT_TIMEOUT = httpx.Timeout(WRITE_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling Supabase while the circuit breaker is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Supabase circuit breaker is open; retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    closed → (threshold consecutive failures) → open → (reset timeout) →
+    half_open: one trial call; success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, reset_timeout: float = BREAKER_RESET,
+                 clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._trial_in_flight = False
+
+    def before_call(self) -> bool:
+        """Admit a call or raise CircuitOpenError; True if it is the half-open trial."""
+        with self._lock:
+            if self.state == "closed":
+                return False
+            elapsed = self._clock() - self.opened_at
+            if self.state == "open" and elapsed >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejected += 1
+            raise CircuitOpenError(max(0.0, self.reset_timeout - elapsed))
+
+    def release_trial(self) -> None:
+        """The trial ended with no verdict (e.g. cancelled): let the next call try."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self.failures >= self.threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                self.state = "open"
+                self.opened_at = self._clock()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "threshold": self.threshold,
+                "reset_timeout": self.reset_timeout,
+                "times_opened": self.times_opened,
+                "rejected_calls": self.rejected,
+            }
+
+
+breaker = CircuitBreaker()
+
+_counters = {"requests": 0, "retries": 0, "in_flight": 0}
+_counters_lock = threading.Lock()
+
+
+def _count(name: str, delta: int = 1) -> None:
+    with _counters_lock:
+        _counters[name] += delta
+
+
+def limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def build_client(headers: dict, transport: Optional[httpx.BaseTransport] = None) -> httpx.Client:
+    if transport is not None:
+        return httpx.Client(headers=headers, transport=transport, timeout=_DEFAULT_TIMEOUT)
+    return httpx.Client(headers=headers, timeout=_DEFAULT_TIMEOUT, limits=limits(), http2=HTTP2)
+
+
+def build_async_client(headers: dict, transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    if transport is not None:
+        return httpx.AsyncClient(headers=headers, transport=transport, timeout=_DEFAULT_TIMEOUT)
+    return httpx.AsyncClient(headers=headers, timeout=_DEFAULT_TIMEOUT, limits=limits(), http2=HTTP2)
+
+
+def backoff_delay(attempt: int, response: Optional[httpx.Response] = None) -> float:
+    """Full-jitter exponential backoff, honouring a numeric Retry-After on 429/503."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.replace(".", "", 1).isdigit():
+            return min(BACKOFF_CAP, float(retry_after))
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _is_failure(response: Optional[httpx.Response]) -> bool:
+    return response is None or response.status_code in _RETRYABLE_STATUS
+
+
+def send(client: httpx.Client, verb: str, method: str, url: str, idempotent: bool = False,
+         **kwargs) -> httpx.Response:
+    """
+    Send one PostgREST request through the breaker. GETs, and requests the
+    caller marks idempotent (read-only rpc calls), retry transient failures.
+    The breaker sees the request once: a failure is recorded only after the
+    last attempt, so retries cannot open the circuit on their own.
+    """
+    retries = MAX_RETRIES if method == "GET" or idempotent else 0
+    timeout = _VERB_TIMEOUTS.get(verb, _DEFAULT_TIMEOUT)
+    trial = breaker.before_call()
+    attempt = 0
+    try:
+        while True:
+            response = None
+            _count("requests")
+            _count("in_flight")
+            try:
+                response = client.request(method, url, timeout=timeout, **kwargs)
+            except httpx.TransportError:
+                if attempt >= retries:
+                    breaker.record_failure()
+                    raise
+            except Exception:
+                breaker.record_failure()
+                raise
+            finally:
+                _count("in_flight", -1)
+            if response is not None:
+                if not _is_failure(response):
+                    breaker.record_success()
+                    response.raise_for_status()
+                    return response
+                if attempt >= retries:
+                    breaker.record_failure()
+                    response.raise_for_status()
+            _count("retries")
+            time.sleep(backoff_delay(attempt, response))
+            attempt += 1
+    except BaseException as e:
+        # Every Exception above already settled the breaker; a cancelled
+        # (or interrupted) trial has not, and would leave it rejecting calls
+        if trial and not isinstance(e, Exception):
+            breaker.release_trial()
+        raise
+
+
+async def asend(client: httpx.AsyncClient, verb: str, method: str, url: str, idempotent: bool = False,
+                **kwargs) -> httpx.Response:
+    retries = MAX_RETRIES if method == "GET" or idempotent else 0
+    timeout = _VERB_TIMEOUTS.get(verb, _DEFAULT_TIMEOUT)
+    trial = breaker.before_call()
+    attempt = 0
+    try:
+        while True:
+            response = None
+            _count("requests")
+            _count("in_flight")
+            try:
+                response = await client.request(method, url, timeout=timeout, **kwargs)
+            except httpx.TransportError:
+                if attempt >= retries:
+                    breaker.record_failure()
+                    raise
+            except Exception:
+                breaker.record_failure()
+                raise
+            finally:
+                _count("in_flight", -1)
+            if response is not None:
+                if not _is_failure(response):
+                    breaker.record_success()
+                    response.raise_for_status()
+                    return response
+                if attempt >= retries:
+                    breaker.record_failure()
+                    response.raise_for_status()
+            _count("retries")
+            await asyncio.sleep(backoff_delay(attempt, response))
+            attempt += 1
+    except BaseException as e:
+        # Every Exception above already settled the breaker; a cancelled
+        # (or interrupted) trial has not, and would leave it rejecting calls
+        if trial and not isinstance(e, Exception):
+            breaker.release_trial()
+        raise
+
+
+def _pool_connections(client) -> Optional[int]:
+    # httpx has no public pool API; read httpcore's pool defensively
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    return len(connections) if connections is not None else None
+
+
+def transport_stats(client=None, async_client=None) -> dict:
+    with _counters_lock:
+        counters = dict(_counters)
+    return {
+        "http2": HTTP2,
+        "pool": {
+            "max_connections": MAX_CONNECTIONS,
+            "max_keepalive_connections": MAX_KEEPALIVE,
+            "keepalive_expiry": KEEPALIVE_EXPIRY,
+            "sync_open_connections": _pool_connections(client),
+            "async_open_connections": _pool_connections(async_client),
+        },
+        "timeouts": {"connect": CONNECT_TIMEOUT, "read": READ_TIMEOUT, "write": WRITE_TIMEOUT},
+        "max_retries": MAX_RETRIES,
+        **counters,
+        "breaker": breaker.stats(),
+    }
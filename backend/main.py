@@ -1,10 +1,22 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
+
+from config import FRONTEND_URL, GZIP_MIN_BYTES, PORT
+from db import connection, instrumentation
+from routes import graph, learn, quiz, calendar, social, extract, debug
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await connection.aclose()
 
-from config import FRONTEND_URL, PORT
-from routes import graph, learn, quiz, calendar, social, extract
 
-app = FastAPI(title="Sapling API", version="1.0.0")
+app = FastAPI(title="Sapling API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,7 +24,50 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-DB-Queries", "X-DB-Time-Ms"],
 )
+# Graph payloads (full or ?format=compact) run to hundreds of KB for large users
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_BYTES)
+
+
+@app.middleware("http")
+async def trace_db_queries(request: Request, call_next):
+    """
+    Count PostgREST round-trips per request and surface them in response headers.
+
+    The trace is finished once the body has been sent, so the queries a
+    streamed (SSE) reply makes while streaming are in /api/debug/queries; the
+    headers go out first and only count the queries made before the body.
+    """
+    trace = instrumentation.start_trace(f"{request.method} {request.url.path}")
+    try:
+        response = await call_next(request)
+    except BaseException:
+        instrumentation.finish_trace(trace)
+        raise
+    response.headers["X-DB-Queries"] = str(trace.round_trips)
+    response.headers["X-DB-Time-Ms"] = f"{trace.total_ms:.1f}"
+    body = response.body_iterator
+
+    async def traced_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            instrumentation.finish_trace(trace)
+
+    response.body_iterator = traced_body()
+    return response
+
+
+@app.exception_handler(connection.CircuitOpenError)
+async def database_unavailable(request: Request, exc: connection.CircuitOpenError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database temporarily unavailable"},
+        headers={"Retry-After": str(max(1, int(exc.retry_after)))},
+    )
+
 
 app.include_router(graph.router,    prefix="/api/graph")
 app.include_router(learn.router,    prefix="/api/learn")
@@ -20,6 +75,7 @@ app.include_router(quiz.router,     prefix="/api/quiz")
 app.include_router(calendar.router, prefix="/api/calendar")
 app.include_router(social.router,   prefix="/api/social")
 app.include_router(extract.router,  prefix="/api/extract")
+app.include_router(debug.router,    prefix="/api/debug")
 
 
 @app.get("/api/health")
@@ -38,8 +94,9 @@ def list_users():
 def gemini_test():
     """Test Gemini connectivity. Shows clear error if API key is missing/wrong."""
     from services.gemini_service import call_gemini
+    from services.rate_limit_service import CHAT
     try:
-        reply = call_gemini('Reply with exactly the text: Gemini OK', retries=0)
+        reply = call_gemini('Reply with exactly the text: Gemini OK', retries=0, priority=CHAT)
         return {"ok": True, "reply": reply.strip()}
     except Exception as e:
         return {"ok": False, "error": str(e)}
@@ -0,0 +1,66 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from config import DEBUG_ENDPOINTS
+from db.connection import cache_stats, transport_stats
+from db.instrumentation import N1_THRESHOLD, recent_traces
+from services import graph_cache_service, llm_cache_service, prompt_cache_service
+from services.prompt_budget_service import recent_reports
+from services.rate_limit_service import limiter
+
+
+
+def _enabled():
+    """Hide every debug route (404) unless DEBUG_ENDPOINTS=1."""
+    if not DEBUG_ENDPOINTS:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+router = APIRouter(dependencies=[Depends(_enabled)])
+
+
+@router.get("/db-cache")
+def db_cache():
+    """Read-through cache counters per table; every hit is a PostgREST round-trip saved."""
+    return cache_stats()
+
+
+@router.get("/queries")
+def queries(limit: int = 20):
+    """Most recent requests' PostgREST calls (table, verb, latency, rows), newest first."""
+    return {"n1_threshold": N1_THRESHOLD, "requests": recent_traces()[:limit]}
+
+
+@router.get("/transport")
+def transport():
+    """Supabase connection pool, retry counters and circuit-breaker state."""
+    return transport_stats()
+
+
+@router.get("/graph-cache")
+def graph_cache():
+    """Per-user graph snapshot cache: hit rate, evictions and approximate memory."""
+    return graph_cache_service.stats()
+
+
+@router.get("/gemini")
+def gemini():
+    """Gemini rate limiter: tokens left, admission queue depth and wait times per priority class."""
+    return limiter.stats()
+
+
+@router.get("/llm-cache")
+def llm_cache():
+    """Gemini response cache: memory and disk hit rates, evictions and size."""
+    return llm_cache_service.stats()
+
+
+@router.get("/prompt-cache")
+def prompt_cache():
+    """Cached system-prompt prefixes per tutoring mode: hits, refreshes and inline fallbacks."""
+    return prompt_cache_service.stats()
+
+
+@router.get("/prompts")
+def prompts(limit: int = 20):
+    """Estimated token size of recent Gemini prompts per section, and how each was shrunk."""
+    return {"prompts": recent_reports()[:limit]}
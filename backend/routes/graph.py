@@ -1,9 +1,11 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
-from typing import Optional
+from typing import Literal, Optional
 
+from services import compact_graph_service as compact_graph
+from services import subject_stats_service as subject_stats
 from services.graph_service import (
-    get_graph, get_recommendations,
+    get_graph_async, get_graph_delta_async, get_recommendations,
     get_courses, add_course, delete_course, update_course_color,
 )
 
@@ -11,8 +13,24 @@ router = APIRouter()
 
 
 @router.get("/{user_id}")
-def get_user_graph(user_id: str):
-    return get_graph(user_id)
+async def get_user_graph(
+    user_id: str,
+    since: Optional[int] = None,
+    format: Literal["full", "compact"] = "full",
+):
+    # ?since=<version> from a previous response returns only what changed
+    if since is not None:
+        graph = await get_graph_delta_async(user_id, since)
+        if not graph.get("full"):
+            return graph  # deltas are small already and index pairs can't span them
+    else:
+        graph = await get_graph_async(user_id)
+    if format == "compact":
+        payload = compact_graph.encode(user_id, graph)
+        if since is not None:
+            payload.update(full=True, since=since)
+        return compact_graph.response(payload)
+    return graph
 
 
 @router.get("/{user_id}/recommendations")
@@ -20,6 +38,12 @@ def get_user_recommendations(user_id: str):
     return {"recommendations": get_recommendations(user_id)}
 
 
+@router.get("/{user_id}/subjects")
+def get_subject_stats(user_id: str):
+    # Per-subject summaries maintained on write; no graph_nodes scan
+    return {"subjects": subject_stats.get(user_id)}
+
+
 # ── Course endpoints ──────────────────────────────────────────────────────────
 
 class AddCourseBody(BaseModel):
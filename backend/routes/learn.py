@@ -1,16 +1,26 @@
+import asyncio
 import uuid
 import json
+import logging
 import os
 from datetime import datetime
 
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 
-from db.connection import table
+from db.connection import async_table, table
+from db.rows import Message
 from models import StartSessionBody, ChatBody, EndSessionBody, ActionBody
-from services.gemini_service import call_gemini, extract_graph_update
-from services.graph_service import get_graph, apply_graph_update
+from services.concept_key_service import concept_key
+from services.gemini_service import (
+    GraphUpdateFilter, call_gemini_async, extract_graph_update, stream_gemini_async,
+)
+from services.graph_service import get_graph_async, apply_graph_update_async
+from services.prompt_budget_service import PromptBudget
+from services.rate_limit_service import CHAT
 
 router = APIRouter()
+logger = logging.getLogger("sapling.learn")
 
 PROMPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "prompts")
 
@@ -21,32 +31,39 @@ def _load_prompt(name: str) -> str:
 
 
 PREAMBLE_TEMPLATE = _load_prompt("preamble.txt")
+STUDENT_CONTEXT_TEMPLATE = _load_prompt("student_context.txt")
 SHARED_CONTEXT_TEMPLATE = _load_prompt("shared_context.txt")
 MODE_PROMPTS = {
     "socratic": _load_prompt("socratic.txt"),
     "expository": _load_prompt("expository.txt"),
     "teachback": _load_prompt("teachback.txt"),
 }
+# Static system-prompt prefix per mode: identical on every turn, so Gemini
+# serves it from its context cache (services/prompt_cache_service.py)
+STATIC_PROMPTS = {
+    mode: f"{PREAMBLE_TEMPLATE.strip()}\n\n{text}" for mode, text in MODE_PROMPTS.items()
+}
 
 
-def _resolve_course(topic: str, user_id: str) -> str:
+async def _resolve_course_async(topic: str, user_id: str) -> str:
     """Return the subject/course the topic belongs to, or '' if unknown."""
     if not topic:
         return ""
     # Is the topic itself a subject name?
-    subject_match = table("graph_nodes").select(
+    subject_match = await async_table("graph_nodes").select(
         "subject", filters={"user_id": f"eq.{user_id}", "subject": f"eq.{topic}"}, limit=1
     )
     if subject_match:
         return topic
-    # Is the topic a concept name? Get its subject.
-    concept_match = table("graph_nodes").select(
-        "subject", filters={"user_id": f"eq.{user_id}", "concept_name": f"eq.{topic}"}, limit=1
+    # Is the topic a concept name (any spelling of it)? Get its subject.
+    concept_match = await async_table("graph_nodes").select(
+        "subject", filters={"user_id": f"eq.{user_id}", "concept_key": f"eq.{concept_key(topic)}"},
+        limit=1,
     )
     if concept_match:
         return concept_match[0].get("subject") or ""
     # Is the topic itself a registered course name (even if it has no nodes yet)?
-    course_match = table("courses").select(
+    course_match = await async_table("courses").select(
         "course_name", filters={"user_id": f"eq.{user_id}", "course_name": f"eq.{topic}"}, limit=1
     )
     if course_match:
@@ -54,144 +71,246 @@ def _resolve_course(topic: str, user_id: str) -> str:
     return ""
 
 
-def _get_session_topic(session_id: str) -> str:
-    rows = table("sessions").select("topic", filters={"id": f"eq.{session_id}"}, limit=1)
+async def _get_session_topic_async(session_id: str) -> str:
+    rows = await async_table("sessions").select(
+        "topic", filters={"id": f"eq.{session_id}"}, limit=1
+    )
     return rows[0]["topic"] if rows else ""
 
 
-def build_system_prompt(
+async def build_system_prompt_async(
     mode: str,
     student_name: str,
     graph_json: str,
     last_summary: str = "",
     course_name: str = "",
     use_shared_context: bool = True,
-) -> str:
-    from services.course_context_service import get_course_context
+    budget: PromptBudget = None,
+) -> tuple:
+    """
+    The tutor's system prompt as (static prefix, dynamic context): the prefix
+    is the preamble and mode rules, the same for every turn in `mode`; the
+    context holds the student, their graph and the shared course block (fit
+    to `budget` when one is given).
+    """
+    from services.course_context_service import get_course_context_async
 
-    preamble = PREAMBLE_TEMPLATE.replace("{student_name}", student_name)
-    preamble = preamble.replace("{graph_json}", graph_json)
-    preamble = preamble.replace("{last_session_summary}", last_summary or "None")
+    ctx = await get_course_context_async(course_name) if use_shared_context and course_name else {}
+    return _compose_system_prompt(mode, student_name, graph_json, last_summary, course_name, ctx, budget)
 
-    parts = [preamble]
 
-    if use_shared_context and course_name:
-        ctx = get_course_context(course_name)
-        if ctx:
-            shared_block = (
-                SHARED_CONTEXT_TEMPLATE
-                .replace("{course_name}", course_name)
-                .replace("{shared_context_json}", json.dumps(ctx, indent=2))
-            )
-            parts.append(shared_block)
+def _compose_system_prompt(
+    mode: str,
+    student_name: str,
+    graph_json: str,
+    last_summary: str,
+    course_name: str,
+    ctx: dict,
+    budget: PromptBudget = None,
+) -> tuple:
+    student = STUDENT_CONTEXT_TEMPLATE.replace("{student_name}", student_name)
+    student = student.replace("{graph_json}", graph_json)
+    student = student.replace("{last_session_summary}", last_summary or "None")
+
+    parts = [student]
+
+    if ctx:
+        shared_block = (
+            SHARED_CONTEXT_TEMPLATE
+            .replace("{course_name}", course_name)
+            .replace("{shared_context_json}", budget.shared(ctx) if budget else json.dumps(ctx, indent=2))
+        )
+        parts.append(shared_block)
 
-    parts.append(MODE_PROMPTS.get(mode, MODE_PROMPTS["socratic"]))
-    return "\n\n".join(parts)
+    return STATIC_PROMPTS.get(mode, STATIC_PROMPTS["socratic"]), "\n\n".join(parts)
 
 
-def get_conversation_history(session_id: str) -> list:
-    rows = table("messages").select(
+async def get_conversation_history_async(session_id: str) -> list:
+    rows = await async_table("messages", row_type=Message).select(
         "role,content",
         filters={"session_id": f"eq.{session_id}"},
         order="created_at.asc",
     )
-    return [{"role": r["role"], "content": r["content"]} for r in rows]
-
-
-def format_history_for_prompt(history: list) -> str:
-    parts = []
-    for msg in history:
-        role = "Student" if msg["role"] == "user" else "Sapling"
-        parts.append(f"{role}: {msg['content']}")
-    return "\n\n".join(parts)
+    return [{"role": r.role, "content": r.content} for r in rows]
 
 
-def save_message(session_id: str, role: str, content: str, graph_update: dict = None):
-    table("messages").insert({
+def _message_row(session_id: str, role: str, content: str, graph_update: dict = None) -> dict:
+    return {
         "id": str(uuid.uuid4()),
         "session_id": session_id,
         "role": role,
         "content": content,
         "graph_update_json": graph_update if graph_update else None,
         "created_at": datetime.utcnow().isoformat(),
-    })
+    }
+
+
+async def save_message_async(session_id: str, role: str, content: str, graph_update: dict = None):
+    await async_table("messages").insert(_message_row(session_id, role, content, graph_update))
 
 
-def get_user_name(user_id: str) -> str:
-    rows = table("users").select("name", filters={"id": f"eq.{user_id}"})
+async def get_user_name_async(user_id: str) -> str:
+    rows = await async_table("users").select("name", filters={"id": f"eq.{user_id}"})
     return rows[0]["name"] if rows else "Student"
 
 
+# Streamed replies still generating or saving; holds a reference so a task
+# outlives a disconnected client
+_replies_in_flight: set = set()
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _reply(system_prefix: str, mode: str, prompt: str, stream: bool, finish):
+    """
+    Generate the tutor's reply to `prompt` (the static `system_prefix` for
+    `mode` goes first, from Gemini's context cache) and hand
+    (reply, graph_update) to `finish`, which persists it and returns the
+    response body.
+
+    With stream=True the reply is sent as server-sent events while Gemini
+    generates it: `token` events carry conversational text ({"text": ...},
+    <graph_update> held back), then a single `done` event carries finish()'s
+    body once the graph update has been applied; a failure mid-stream ends
+    with an `error` event instead. The first chunk is awaited before the
+    response starts, so a failing call is still a plain 502.
+
+    Generation and finish() run in a task of their own, not in the response
+    body, so a client that disconnects mid-reply still gets the reply saved
+    and its graph update applied.
+    """
+    mode = mode if mode in STATIC_PROMPTS else "socratic"
+    if not stream:
+        try:
+            raw = await call_gemini_async(prompt, priority=CHAT, system_prefix=system_prefix,
+                                          prefix_label=mode)
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Gemini error: {e}")
+        return await finish(*extract_graph_update(raw))
+
+    chunks = stream_gemini_async(prompt, priority=CHAT, system_prefix=system_prefix,
+                                 prefix_label=mode)
+    try:
+        first = await anext(chunks)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Gemini error: {e}")
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def generate():
+        split = GraphUpdateFilter()
+        try:
+            text = split.feed(first)
+            if text:
+                queue.put_nowait(_sse("token", {"text": text}))
+            async for chunk in chunks:
+                text = split.feed(chunk)
+                if text:
+                    queue.put_nowait(_sse("token", {"text": text}))
+        except Exception as e:
+            queue.put_nowait(_sse("error", {"detail": f"Gemini error: {e}"}))
+            return
+        tail = split.flush()
+        if tail:
+            queue.put_nowait(_sse("token", {"text": tail}))
+        try:
+            queue.put_nowait(_sse("done", await finish(*split.finish())))
+        except Exception as e:
+            logger.exception("Saving streamed reply failed")
+            queue.put_nowait(_sse("error", {"detail": f"Could not save reply: {e}"}))
+
+    async def run():
+        try:
+            await generate()
+        finally:
+            queue.put_nowait(None)
+
+    task = asyncio.create_task(run())
+    _replies_in_flight.add(task)
+    task.add_done_callback(_replies_in_flight.discard)
+
+    async def events():
+        while (event := await queue.get()) is not None:
+            yield event
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/start-session")
-def start_session(body: StartSessionBody):
+async def start_session(body: StartSessionBody, stream: bool = False):
     session_id = str(uuid.uuid4())
-    table("sessions").insert({
+    await async_table("sessions").insert({
         "id": session_id,
         "user_id": body.user_id,
         "mode": body.mode,
         "topic": body.topic,
     })
 
-    student_name = get_user_name(body.user_id)
-    graph_data = get_graph(body.user_id)
-    course_name = _resolve_course(body.topic, body.user_id)
-    system_prompt = build_system_prompt(
-        body.mode, student_name, json.dumps(graph_data, indent=2),
-        course_name=course_name, use_shared_context=body.use_shared_context,
+    student_name, graph_data, course_name = await asyncio.gather(
+        get_user_name_async(body.user_id),
+        get_graph_async(body.user_id),
+        _resolve_course_async(body.topic, body.user_id),
+    )
+    budget = PromptBudget("start-session")
+    system_prefix, system_prompt = await build_system_prompt_async(
+        body.mode, student_name, budget.graph(graph_data, focus=(body.topic,), course=course_name),
+        course_name=course_name, use_shared_context=body.use_shared_context, budget=budget,
     )
     full_prompt = (
         f"{system_prompt}\n\n"
-        f"Student wants to learn about: {body.topic}\n\n"
+        f"Student wants to learn about: {budget.message(body.topic)}\n\n"
         "Begin the session with a warm greeting and your first question or explanation."
     )
+    budget.report(full_prompt, system_prefix)
 
-    try:
-        raw = call_gemini(full_prompt)
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Gemini error: {e}")
+    async def finish(reply: str, graph_update: dict) -> dict:
+        await save_message_async(session_id, "assistant", reply, graph_update)
+        await apply_graph_update_async(body.user_id, graph_update)
+        return {
+            "session_id": session_id,
+            "initial_message": reply,
+            "graph_state": await get_graph_async(body.user_id),
+        }
 
-    reply, graph_update = extract_graph_update(raw)
-    save_message(session_id, "assistant", reply, graph_update)
-    apply_graph_update(body.user_id, graph_update)
-
-    return {
-        "session_id": session_id,
-        "initial_message": reply,
-        "graph_state": get_graph(body.user_id),
-    }
+    return await _reply(system_prefix, body.mode, full_prompt, stream, finish)
 
 
 @router.post("/chat")
-def chat(body: ChatBody):
-    save_message(body.session_id, "user", body.message)
-
-    student_name = get_user_name(body.user_id)
-    graph_data = get_graph(body.user_id)
-    history = get_conversation_history(body.session_id)
-    history_text = format_history_for_prompt(history[:-1])
-    topic = _get_session_topic(body.session_id)
-    course_name = _resolve_course(topic, body.user_id)
-    system_prompt = build_system_prompt(
-        body.mode, student_name, json.dumps(graph_data, indent=2),
-        course_name=course_name, use_shared_context=body.use_shared_context,
+async def chat(body: ChatBody, stream: bool = False):
+    await save_message_async(body.session_id, "user", body.message)
+
+    student_name, graph_data, history, topic = await asyncio.gather(
+        get_user_name_async(body.user_id),
+        get_graph_async(body.user_id),
+        get_conversation_history_async(body.session_id),
+        _get_session_topic_async(body.session_id),
+    )
+    course_name = await _resolve_course_async(topic, body.user_id)
+    budget = PromptBudget("chat")
+    system_prefix, system_prompt = await build_system_prompt_async(
+        body.mode, student_name, budget.graph(graph_data, focus=(topic,), course=course_name),
+        course_name=course_name, use_shared_context=body.use_shared_context, budget=budget,
     )
 
     full_prompt = (
         f"{system_prompt}\n\n"
-        f"CONVERSATION SO FAR:\n{history_text}\n\n"
-        f"Student: {body.message}\n\nSapling:"
+        f"CONVERSATION SO FAR:\n{budget.history(history[:-1])}\n\n"
+        f"Student: {budget.message(body.message)}\n\nSapling:"
     )
+    budget.report(full_prompt, system_prefix)
 
-    try:
-        raw = call_gemini(full_prompt)
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Gemini error: {e}")
-
-    reply, graph_update = extract_graph_update(raw)
-    save_message(body.session_id, "assistant", reply, graph_update)
-    mastery_changes = apply_graph_update(body.user_id, graph_update)
+    async def finish(reply: str, graph_update: dict) -> dict:
+        await save_message_async(body.session_id, "assistant", reply, graph_update)
+        mastery_changes = await apply_graph_update_async(body.user_id, graph_update)
+        return {"reply": reply, "graph_update": graph_update, "mastery_changes": mastery_changes}
 
-    return {"reply": reply, "graph_update": graph_update, "mastery_changes": mastery_changes}
+    return await _reply(system_prefix, body.mode, full_prompt, stream, finish)
 
 
 @router.post("/end-session")
@@ -294,36 +413,36 @@ def resume_session(session_id: str):
 
 
 @router.post("/action")
-def action(body: ActionBody):
+async def action(body: ActionBody, stream: bool = False):
     action_prompts = {
         "hint": "The student asked for a hint. Give a small scaffold or clue without giving away the answer.",
         "confused": "The student said they are confused. Identify the likely point of confusion and re-explain with a different analogy.",
         "skip": "The student wants to skip this concept. Acknowledge and transition to the next recommended concept.",
     }
 
-    student_name = get_user_name(body.user_id)
-    graph_data = get_graph(body.user_id)
-    history = get_conversation_history(body.session_id)
-    history_text = format_history_for_prompt(history)
-    topic = _get_session_topic(body.session_id)
-    course_name = _resolve_course(topic, body.user_id)
-    system_prompt = build_system_prompt(
-        body.mode, student_name, json.dumps(graph_data, indent=2),
-        course_name=course_name, use_shared_context=body.use_shared_context,
+    student_name, graph_data, history, topic = await asyncio.gather(
+        get_user_name_async(body.user_id),
+        get_graph_async(body.user_id),
+        get_conversation_history_async(body.session_id),
+        _get_session_topic_async(body.session_id),
+    )
+    course_name = await _resolve_course_async(topic, body.user_id)
+    budget = PromptBudget("action")
+    system_prefix, system_prompt = await build_system_prompt_async(
+        body.mode, student_name, budget.graph(graph_data, focus=(topic,), course=course_name),
+        course_name=course_name, use_shared_context=body.use_shared_context, budget=budget,
     )
 
     full_prompt = (
         f"{system_prompt}\n\n"
-        f"CONVERSATION SO FAR:\n{history_text}\n\n"
+        f"CONVERSATION SO FAR:\n{budget.history(history)}\n\n"
         f"[ACTION: {action_prompts.get(body.action_type, '')}]\n\nSapling:"
     )
+    budget.report(full_prompt, system_prefix)
 
-    try:
-        raw = call_gemini(full_prompt)
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Gemini error: {e}")
+    async def finish(reply: str, graph_update: dict) -> dict:
+        await save_message_async(body.session_id, "assistant", reply, graph_update)
+        await apply_graph_update_async(body.user_id, graph_update)
+        return {"reply": reply, "graph_update": graph_update}
 
-    reply, graph_update = extract_graph_update(raw)
-    save_message(body.session_id, "assistant", reply, graph_update)
-    apply_graph_update(body.user_id, graph_update)
-    return {"reply": reply, "graph_update": graph_update}
+    return await _reply(system_prefix, body.mode, full_prompt, stream, finish)
@@ -8,9 +8,14 @@ from fastapi import APIRouter, BackgroundTasks, HTTPException
 from config import get_mastery_tier
 from db.connection import table
 from models import GenerateQuizBody, SubmitQuizBody
+from services import graph_cache_service as graph_cache
+from services import graph_changes_service as graph_changes
+from services import subject_stats_service as subject_stats
 from services.gemini_service import call_gemini_json
 from services.graph_service import get_graph
+from services.prompt_budget_service import QUIZ_GRAPH_BUDGET, PromptBudget
 from services.quiz_context_service import get_quiz_context, save_quiz_context
+from services.rate_limit_service import BACKGROUND
 
 router = APIRouter()
 
@@ -33,18 +38,20 @@ def generate_quiz(body: GenerateQuizBody):
     quiz_ctx = get_quiz_context(body.user_id, body.concept_node_id)
     quiz_ctx_str = json.dumps(quiz_ctx, indent=2) if quiz_ctx else "No previous quiz history."
 
+    subject = node.get("subject", "")
+    budget = PromptBudget("quiz", graph=QUIZ_GRAPH_BUDGET)
     prompt = (
         _load_prompt("quiz_generation.txt")
         .replace("{concept_name}", node["concept_name"])
         .replace("{mastery_score}", str(int(node["mastery_score"] * 100)))
         .replace("{difficulty}", body.difficulty)
         .replace("{num_questions}", str(body.num_questions))
-        .replace("{graph_json_subset}", json.dumps(graph_data["nodes"][:10], indent=2))
-        .replace("{quiz_context_json}", quiz_ctx_str)
+        .replace("{graph_json_subset}",
+                 budget.graph(graph_data, focus=(node["concept_name"],), course=subject))
+        .replace("{quiz_context_json}", budget.measure("quiz_context", quiz_ctx_str))
     )
 
     # Append shared course-level context (misconceptions + weak areas) if available
-    subject = node.get("subject", "")
     if body.use_shared_context and subject:
         from services.course_context_service import get_course_context
         course_ctx = get_course_context(subject)
@@ -64,10 +71,11 @@ def generate_quiz(body: GenerateQuizBody):
                         "Weak areas to target:\n"
                         + "\n".join(f"- {w}" for w in weak_areas[:10])
                     )
-                prompt += "\n\n" + "\n\n".join(addendum_parts)
+                prompt += "\n\n" + budget.measure("shared", "\n\n".join(addendum_parts))
+    budget.report(prompt)
 
     try:
-        result = call_gemini_json(prompt)
+        result = call_gemini_json(prompt, cache=True)
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Gemini error: {e}")
 
@@ -83,6 +91,62 @@ def generate_quiz(body: GenerateQuizBody):
     return {"quiz_id": quiz_id, "questions": questions}
 
 
+# Conditional mastery writes tried before falling back to an unconditional one
+_MASTERY_WRITE_ATTEMPTS = 3
+
+
+def _matches(value) -> str:
+    return "is.null" if value is None else f"eq.{value}"
+
+
+def _apply_quiz_mastery(user_id: str, node_id: str, score: int, total: int) -> tuple:
+    """
+    Move the node's mastery by the quiz result; returns (row as read, new
+    score, new tier, new times_studied), with row None for a missing node.
+
+    The write only applies if the node still holds the values it was computed
+    from, so a concurrent quiz or chat update is re-read and built on rather
+    than overwritten, and the subject_stats delta is exact. If the node keeps
+    changing the last write wins and the user's summaries are rebuilt instead.
+    """
+    for attempt in range(_MASTERY_WRITE_ATTEMPTS):
+        rows = table("graph_nodes").select(
+            "mastery_score,mastery_tier,times_studied,subject", filters={"id": f"eq.{node_id}"},
+        )
+        node = rows[0] if rows else None
+        before = (node["mastery_score"] if node else 0.0) or 0.0
+        mastery_after = max(0.0, min(1.0, before + (score * 0.03) - ((total - score) * 0.02)))
+        new_tier = get_mastery_tier(mastery_after)
+        times_studied = ((node["times_studied"] if node else 0) or 0) + 1
+        if node is None:
+            return None, mastery_after, new_tier, times_studied
+
+        filters = {"id": f"eq.{node_id}"}
+        conditional = attempt < _MASTERY_WRITE_ATTEMPTS - 1
+        if conditional:
+            filters["mastery_score"] = _matches(node["mastery_score"])
+            filters["times_studied"] = _matches(node["times_studied"])
+        written = table("graph_nodes").update(
+            {
+                "mastery_score": mastery_after,
+                "mastery_tier": new_tier,
+                "times_studied": times_studied,
+                "last_studied_at": datetime.utcnow().isoformat(),
+            },
+            filters=filters,
+        )
+        if written and conditional:
+            subject_stats.apply(user_id, subject_stats.deltas([node], [{
+                **node,
+                "mastery_score": mastery_after,
+                "mastery_tier": new_tier,
+                "times_studied": times_studied,
+            }]))
+            return node, mastery_after, new_tier, times_studied
+    subject_stats.mark_dirty(user_id)
+    return node, mastery_after, new_tier, times_studied
+
+
 @router.post("/submit")
 def submit_quiz(body: SubmitQuizBody, background_tasks: BackgroundTasks):
     attempt_rows = table("quiz_attempts").select("*", filters={"id": f"eq.{body.quiz_id}"})
@@ -117,24 +181,12 @@ def submit_quiz(body: SubmitQuizBody, background_tasks: BackgroundTasks):
 
     total = len(questions)
 
-    node_rows = table("graph_nodes").select(
-        "mastery_score,times_studied",
-        filters={"id": f"eq.{concept_node_id}"},
-    )
-    mastery_before = node_rows[0]["mastery_score"] if node_rows else 0.0
-    mastery_after = max(0.0, min(1.0, mastery_before + (score * 0.03) - ((total - score) * 0.02)))
-    new_tier = get_mastery_tier(mastery_after)
-    times_studied = (node_rows[0]["times_studied"] if node_rows else 0) + 1
-
-    table("graph_nodes").update(
-        {
-            "mastery_score": mastery_after,
-            "mastery_tier": new_tier,
-            "times_studied": times_studied,
-            "last_studied_at": datetime.utcnow().isoformat(),
-        },
-        filters={"id": f"eq.{concept_node_id}"},
+    node, mastery_after, new_tier, times_studied = _apply_quiz_mastery(
+        user_id, concept_node_id, score, total
     )
+    mastery_before = node["mastery_score"] if node else 0.0
+    graph_changes.record(user_id, nodes=[(concept_node_id, node["subject"] if node else None)])
+    graph_cache.bump(user_id)
     table("quiz_attempts").update(
         {
             "score": score,
@@ -165,7 +217,7 @@ def submit_quiz(body: SubmitQuizBody, background_tasks: BackgroundTasks):
 
     def _update_context(prompt: str, uid: str, node_id: str):
         try:
-            new_ctx = call_gemini_json(prompt)
+            new_ctx = call_gemini_json(prompt, priority=BACKGROUND)
             save_quiz_context(uid, node_id, new_ctx)
         except Exception:
             pass
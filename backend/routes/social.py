@@ -1,15 +1,21 @@
+import heapq
 import uuid
 import random
 import string
 from collections import defaultdict
+from typing import Literal
 
 from fastapi import APIRouter, HTTPException, Query
 
-from db.connection import table
+from db.connection import RpcNotFoundError, rpc, table
+from db.rows import GraphNode
 from models import CreateRoomBody, JoinRoomBody, MatchBody
-from services.graph_service import get_graph
+from services import compact_graph_service as compact_graph
+from services import subject_stats_service as subject_stats
+from services.graph_service import get_graph, get_knowledge_graph
 from services.matching_service import find_study_matches
 from services.gemini_service import call_gemini
+from services.rate_limit_service import BACKGROUND
 from services.social_cache_service import get_cached_summary, save_summary, invalidate as invalidate_summary
 
 router = APIRouter()
@@ -66,7 +72,11 @@ def get_user_rooms(user_id: str):
 
 
 @router.get("/rooms/{room_id}/overview")
-def room_overview(room_id: str, viewer_id: str = Query("user_john")):
+def room_overview(
+    room_id: str,
+    viewer_id: str = Query("user_john"),
+    format: Literal["full", "compact"] = "full",
+):
     room_rows = table("rooms").select("*", filters={"id": f"eq.{room_id}"})
     if not room_rows:
         raise HTTPException(status_code=404, detail="Room not found")
@@ -96,13 +106,19 @@ def room_overview(room_id: str, viewer_id: str = Query("user_john")):
             ai_summary = call_gemini(
                 "Write a 2-3 sentence summary of this study group's collective knowledge:\n"
                 + "\n".join(member_summaries)
-                + "\nFocus on complementary strengths and shared goals."
+                + "\nFocus on complementary strengths and shared goals.",
+                priority=BACKGROUND,
+                cache=True,
             )
             save_summary(room_id, member_summaries, ai_summary)
         except Exception as e:
             print(f"Gemini summary failed: {e}")
             ai_summary = "This study group has complementary strengths across multiple subjects."
 
+    if format == "compact":
+        for m in members:
+            m["graph"] = compact_graph.encode(m["user_id"], m["graph"])
+        return compact_graph.response({"room": room, "members": members, "ai_summary": ai_summary})
     return {"room": room, "members": members, "ai_summary": ai_summary}
 
 
@@ -144,7 +160,7 @@ def match_partners(room_id: str, body: MatchBody):
     if member_ids:
         user_rows = table("users").select("id,name", filters={"id": f"in.({','.join(member_ids)})"})
         members_with_graphs = [
-            {"user_id": u["id"], "name": u["name"], "graph": get_graph(u["id"])}
+            {"user_id": u["id"], "name": u["name"], "graph": get_knowledge_graph(u["id"])}
             for u in user_rows
         ]
 
@@ -181,11 +197,11 @@ def school_match(body: MatchBody):
     )
 
     members_with_graphs = [
-        {"user_id": u["id"], "name": u["name"], "graph": get_graph(u["id"])}
+        {"user_id": u["id"], "name": u["name"], "graph": get_knowledge_graph(u["id"])}
         for u in school_users
     ]
 
-    requester_graph = get_graph(body.user_id)
+    requester_graph = get_knowledge_graph(body.user_id)
     requester_rows = table("users").select("name", filters={"id": f"eq.{body.user_id}"})
     requester_name = requester_rows[0]["name"] if requester_rows else body.user_id
 
@@ -201,35 +217,58 @@ def school_match(body: MatchBody):
     return {"matches": matches}
 
 
-@router.get("/students")
-def get_students():
-    """Return a lightweight profile for every user in the DB."""
-    users = table("users").select("id,name,streak_count")
-    courses_rows = table("courses").select("user_id,course_name")
-    nodes_rows = table("graph_nodes").select("user_id,mastery_tier,concept_name,mastery_score")
-
-    courses_by_user: dict = defaultdict(list)
-    for c in courses_rows:
-        courses_by_user[c["user_id"]].append(c["course_name"])
-
+def _stream_tier_counts() -> list:
+    """Client-side fallback for the user_tier_counts SQL function."""
+    # Stream graph_nodes page by page; keep only counters and a top-4 heap per user
     mastery_by_user: dict = defaultdict(
         lambda: {"mastered": 0, "learning": 0, "struggling": 0, "unexplored": 0, "total": 0}
     )
     top_concepts_by_user: dict = defaultdict(list)
-    for n in nodes_rows:
-        uid = n["user_id"]
-        tier = n["mastery_tier"]
+    nodes = table("graph_nodes", row_type=GraphNode).select_iter(
+        "id,user_id,mastery_tier,concept_name,mastery_score"
+    )
+    for n in nodes:
+        uid = n.user_id
+        tier = n.mastery_tier
         mastery_by_user[uid]["total"] += 1
         if tier in mastery_by_user[uid]:
             mastery_by_user[uid][tier] += 1
         if tier == "mastered":
-            top_concepts_by_user[uid].append((n.get("mastery_score", 0), n["concept_name"]))
+            entry = (n.mastery_score or 0, n.concept_name)
+            heap = top_concepts_by_user[uid]
+            if len(heap) < 4:
+                heapq.heappush(heap, entry)
+            else:
+                heapq.heappushpop(heap, entry)
 
     # Sort each user's mastered concepts by score desc, keep top 4
-    for uid in top_concepts_by_user:
-        top_concepts_by_user[uid] = [
-            name for _, name in sorted(top_concepts_by_user[uid], reverse=True)[:4]
-        ]
+    return [
+        {
+            "user_id": uid,
+            **counts,
+            "top_concepts": [name for _, name in sorted(top_concepts_by_user[uid], reverse=True)],
+        }
+        for uid, counts in mastery_by_user.items()
+    ]
+
+
+@router.get("/students")
+def get_students():
+    """Return a lightweight profile for every user in the DB."""
+    courses_by_user: dict = defaultdict(list)
+    for c in table("courses").select_iter("user_id,course_name"):
+        courses_by_user[c["user_id"]].append(c["course_name"])
+
+    # Tier counts are aggregated in the database; stream rows if the function isn't deployed
+    subject_stats.repair()
+    try:
+        tier_rows = rpc("user_tier_counts")
+    except RpcNotFoundError:
+        tier_rows = _stream_tier_counts()
+
+    empty = {"mastered": 0, "learning": 0, "struggling": 0, "unexplored": 0, "total": 0}
+    mastery_by_user = {r["user_id"]: {k: r[k] or 0 for k in empty} for r in tier_rows}
+    top_concepts_by_user = {r["user_id"]: r["top_concepts"] or [] for r in tier_rows}
 
     students = [
         {
@@ -237,10 +276,10 @@ def get_students():
             "name": u["name"],
             "streak": u.get("streak_count") or 0,
             "courses": sorted(courses_by_user[u["id"]]),
-            "stats": dict(mastery_by_user[u["id"]]),
-            "top_concepts": top_concepts_by_user[u["id"]],
+            "stats": dict(mastery_by_user.get(u["id"], empty)),
+            "top_concepts": top_concepts_by_user.get(u["id"], []),
         }
-        for u in users
+        for u in table("users").select_iter("id,name,streak_count")
     ]
     students.sort(key=lambda s: s["name"])
     return {"students": students}
@@ -15,7 +15,7 @@ def parse_syllabus(extracted_text: str) -> dict:
     with open(PROMPT_PATH) as f:
         prompt_template = f.read()
     prompt = prompt_template + f"\n\nDOCUMENT TEXT:\n{extracted_text}"
-    return call_gemini_json(prompt)
+    return call_gemini_json(prompt, cache=True)
 
 
 def save_assignments_to_db(user_id: str, assignments: list) -> int:
@@ -0,0 +1,206 @@
+"""
+compact_graph_service.py
+------------------------
+Columnar wire format for large graphs (?format=compact on GET /api/graph/{user_id}
+and GET /api/social/rooms/{room_id}/overview).
+
+The default payload repeats every key on every node and adds one synthetic
+subject_edge__ dict per node. The compact payload stores each field once as a
+parallel array, tiers and subjects as small integer codes, and edges as index
+pairs into the node arrays:
+
+    {
+      "format": "compact", "user_id": ..., "version": ..., "stats": {...},
+      "tiers": ["unexplored", "struggling", "learning", "mastered", "subject_root"],
+      "subjects": ["CS101", ...],
+      "nodes": {"id": [...], "name": [...], "score": [...], "tier": [0, 3, ...],
+                "subject": [0, 0, ...], "times_studied": [...], "last_studied_at": [...]},
+      "edges": {"id": [...], "source": [0, ...], "target": [2, ...], "strength": [...]},
+      "subject_edge_strength": 0.7
+    }
+
+Subject edges are not sent: every non-root node hangs off the root of its
+subject (tier "subject_root") with subject_edge_strength. decode() rebuilds the
+default node/edge dicts and is the reference for client-side decoders.
+
+Responses go out through GZipMiddleware (main.py); the repeated-key payload
+compresses well too, but the compact one is smaller before and after gzip and
+parses several times faster. Compare with: python -m services.compact_graph_service
+"""
+
+import json
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, see requirements.txt
+    orjson = None
+
+TIERS = ("unexplored", "struggling", "learning", "mastered", "subject_root")
+SUBJECT_EDGE_STRENGTH = 0.7
+
+
+def encode(user_id: str, graph: dict) -> dict:
+    """Convert a get_graph payload to the columnar format."""
+    tier_codes = {t: i for i, t in enumerate(TIERS)}
+    tiers = list(TIERS)
+    subject_codes: dict = {}
+    subjects: list = []
+
+    ids, names, scores, tier_col, subject_col, studied, last_studied = [], [], [], [], [], [], []
+    # Real nodes first so subject codes follow the order subject edges are built in
+    nodes = sorted(graph["nodes"], key=lambda n: bool(n.get("is_subject_root")))
+    for n in nodes:
+        tier = n["mastery_tier"]
+        if tier not in tier_codes:
+            tier_codes[tier] = len(tiers)
+            tiers.append(tier)
+        subject = n.get("subject") or "General"
+        if subject not in subject_codes:
+            subject_codes[subject] = len(subjects)
+            subjects.append(subject)
+        ids.append(n["id"])
+        names.append(n["concept_name"])
+        scores.append(n["mastery_score"])
+        tier_col.append(tier_codes[tier])
+        subject_col.append(subject_codes[subject])
+        studied.append(n.get("times_studied") or 0)
+        last_studied.append(n.get("last_studied_at"))
+
+    index = {node_id: i for i, node_id in enumerate(ids)}
+    edge_ids, sources, targets, strengths = [], [], [], []
+    for e in graph["edges"]:
+        if e["id"].startswith("subject_edge__"):
+            continue
+        src, tgt = index.get(e["source"]), index.get(e["target"])
+        if src is None or tgt is None:
+            continue  # dangling edge; the graph view would drop it anyway
+        edge_ids.append(e["id"])
+        sources.append(src)
+        targets.append(tgt)
+        strengths.append(e["strength"])
+
+    return {
+        "format": "compact",
+        "user_id": user_id,
+        "version": graph.get("version", 0),
+        "stats": graph["stats"],
+        "tiers": tiers,
+        "subjects": subjects,
+        "nodes": {
+            "id": ids,
+            "name": names,
+            "score": scores,
+            "tier": tier_col,
+            "subject": subject_col,
+            "times_studied": studied,
+            "last_studied_at": last_studied,
+        },
+        "edges": {"id": edge_ids, "source": sources, "target": targets, "strength": strengths},
+        "subject_edge_strength": SUBJECT_EDGE_STRENGTH,
+    }
+
+
+def decode(compact: dict) -> dict:
+    """Rebuild the default nodes/edges/stats payload from encode() output."""
+    cols = compact["nodes"]
+    tiers, subjects, user_id = compact["tiers"], compact["subjects"], compact["user_id"]
+    nodes = []
+    for i, node_id in enumerate(cols["id"]):
+        tier = tiers[cols["tier"][i]]
+        node = {
+            "id": node_id,
+            "user_id": user_id,
+            "concept_name": cols["name"][i],
+            "mastery_score": cols["score"][i],
+            "mastery_tier": tier,
+            "subject": subjects[cols["subject"][i]],
+            "times_studied": cols["times_studied"][i],
+            "last_studied_at": cols["last_studied_at"][i],
+        }
+        if tier == "subject_root":
+            node["is_subject_root"] = True
+        nodes.append(node)
+
+    ids = cols["id"]
+    e = compact["edges"]
+    edges = [
+        {"id": e["id"][k], "source": ids[e["source"][k]], "target": ids[e["target"][k]],
+         "strength": e["strength"][k]}
+        for k in range(len(e["id"]))
+    ]
+    roots = {n["subject"]: n["id"] for n in nodes if n.get("is_subject_root")}
+    for n in nodes:
+        if not n.get("is_subject_root") and n["subject"] in roots:
+            root_id = roots[n["subject"]]
+            edges.append({
+                "id": f"subject_edge__{root_id}__{n['id']}",
+                "source": root_id,
+                "target": n["id"],
+                "strength": compact["subject_edge_strength"],
+            })
+    return {"nodes": nodes, "edges": edges, "stats": compact["stats"],
+            "version": compact["version"]}
+
+
+def dumps(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+def response(payload) -> Response:
+    """
+    Serialize directly to bytes: FastAPI's default path walks every list
+    element through jsonable_encoder, which dominates for large graphs.
+    """
+    return Response(content=dumps(payload), media_type="application/json")
+
+
+# ── Micro-benchmark ───────────────────────────────────────────────────────────
+
+def _sample_graph(n_nodes: int) -> dict:
+    from services.graph_service import _assemble_graph
+
+    tiers = TIERS[:4]
+    nodes = [
+        {
+            "id": f"node_{i}", "user_id": "user_andres", "concept_name": f"Concept number {i}",
+            "mastery_score": round((i % 100) / 100, 2), "mastery_tier": tiers[i % 4],
+            "times_studied": i % 7, "last_studied_at": "2026-03-01T12:00:00+00:00",
+            "subject": f"Course {i % 6}", "created_at": "2026-02-01T09:30:00+00:00",
+        }
+        for i in range(n_nodes)
+    ]
+    edges = [
+        {"id": f"edge_{i}", "source_node_id": f"node_{i}",
+         "target_node_id": f"node_{(i * 7 + 1) % n_nodes}", "strength": 0.5}
+        for i in range(n_nodes * 2)
+    ]
+    return _assemble_graph("user_andres", nodes, edges, 3, set(), version=42)
+
+
+def _benchmark(n_nodes: int = 800, repeat: int = 20) -> dict:
+    import gzip
+    import timeit
+
+    graph = _sample_graph(n_nodes)
+    full = json.dumps(graph).encode()
+    compact = dumps(encode("user_andres", graph))
+    results = {}
+    for label, body in (("full", full), ("compact", compact)):
+        results[label] = {
+            "bytes": len(body),
+            "gzip_bytes": len(gzip.compress(body)),
+            "parse_ms": round(
+                min(timeit.repeat(lambda: json.loads(body), number=1, repeat=repeat)) * 1000, 2
+            ),
+        }
+    results["_env"] = {"nodes": n_nodes, "edges": n_nodes * 2, "orjson": orjson is not None}
+    return results
+
+
+if __name__ == "__main__":
+    for label, stats in _benchmark().items():
+        print(f"{label:8s} {stats}")
@@ -0,0 +1,90 @@
+"""
+concept_key_service.py
+----------------------
+Normalized concept keys: the identity of a concept within one user's graph.
+
+Gemini names the same concept differently from one session to the next
+("Linked Lists", "linked list", "Linked-List"). graph_nodes.concept_key holds
+the normalized form and is unique per user, so apply_graph_update resolves
+names by key and a variant spelling updates the existing node instead of
+creating a duplicate. The displayed concept_name stays as first written.
+
+    concept_key("Linked Lists")          → "linked list"
+    concept_key("  Big-O  (Notation) ")  → "big o notation"
+    concept_key("Binary Search Trees")   → "binary search tree"
+
+Keys are case-folded (NFKC), split on anything but letters, digits, "+" and
+"#" (so "C++" and "C#" survive), and each word is singularized by a few
+conservative suffix rules. The rules only need to map variants of one name to
+the same key, not produce correct English.
+
+With CONCEPT_FUZZY_THRESHOLD set, keys that are still unknown are also
+matched to the closest existing key (difflib ratio at or above the threshold),
+which catches typos and word-order-preserving variants the rules miss.
+"""
+
+import difflib
+import re
+import unicodedata
+from typing import Iterable
+
+_WORD = re.compile(r"[\w+#]+")
+
+# Plural forms the suffix rules below would get wrong
+_IRREGULAR = {
+    "indices": "index",
+    "vertices": "vertex",
+    "matrices": "matrix",
+    "analyses": "analysis",
+    "hypotheses": "hypothesis",
+    "theses": "thesis",
+    "axes": "axis",
+    "caches": "cache",
+    "children": "child",
+    "data": "data",
+    "criteria": "criterion",
+    "phenomena": "phenomenon",
+}
+_UNCHANGED_ENDINGS = ("ss", "us", "is", "ous", "series", "species")
+
+
+def _singular(word: str) -> str:
+    if word in _IRREGULAR:
+        return _IRREGULAR[word]
+    if len(word) <= 3 or not word.endswith("s") or word.endswith(_UNCHANGED_ENDINGS):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("sses", "xes", "zes", "ches", "shes")):
+        return word[:-2]
+    return word[:-1]
+
+
+def concept_key(name: str) -> str:
+    """The normalized key for a concept name."""
+    folded = unicodedata.normalize("NFKC", name or "").casefold()
+    words = _WORD.findall(folded)
+    # A name with no words at all ("???") keeps its folded text as the key
+    return " ".join(_singular(w) for w in words) if words else folded.strip()
+
+
+def resolve_keys(keys: Iterable[str], existing: Iterable[str], threshold: float) -> dict:
+    """
+    Map each of `keys` to the key it should resolve to: itself when it already
+    exists or has no close match, otherwise the closest existing key with a
+    similarity ratio of at least `threshold`. New keys are matched against each
+    other too (in sorted order), so two spellings in one batch become one node.
+    """
+    known = list(dict.fromkeys(existing))
+    known_set = set(known)
+    resolved: dict = {}
+    for key in sorted(set(keys)):
+        if key in known_set:
+            resolved[key] = key
+            continue
+        match = difflib.get_close_matches(key, known, n=1, cutoff=threshold)
+        resolved[key] = match[0] if match else key
+        if not match:
+            known.append(key)
+            known_set.add(key)
+    return resolved
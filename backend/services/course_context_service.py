@@ -10,7 +10,7 @@ any student's graph is updated (via apply_graph_update in graph_service.py).
 
 from datetime import datetime, timezone
 
-from db.connection import table
+from db.connection import RpcNotFoundError, async_table, rpc, table
 
 
 def get_course_context(course_name: str) -> dict:
@@ -27,51 +27,92 @@ def get_course_context(course_name: str) -> dict:
         return {}
 
 
-def update_course_context(course_name: str) -> None:
-    """
-    Aggregate mastery + quiz data for all students in course_name and upsert
-    into the course_context table. Called automatically after any graph update.
-    """
+async def get_course_context_async(course_name: str) -> dict:
     if not course_name:
-        return
+        return {}
+    try:
+        rows = await async_table("course_context").select(
+            "context_json",
+            filters={"course_name": f"eq.{course_name}"},
+        )
+        return rows[0]["context_json"] if rows else {}
+    except Exception:
+        return {}
 
-    # ── 1. All graph nodes for this course across every user ─────────────────
-    node_rows = table("graph_nodes").select(
-        "id,concept_name,mastery_score,mastery_tier,user_id",
-        filters={"subject": f"eq.{course_name}"},
-    )
-    if not node_rows:
-        return
 
-    # ── 2. Group by concept_name, track per-user scores ──────────────────────
+def _stream_course_stats(course_name: str) -> dict:
+    """
+    Client-side fallback for the course_concept_stats SQL function: stream the
+    course's graph nodes, fold them into per-concept totals, then pull the quiz
+    contexts recorded against those nodes.
+    """
     concept_data: dict = {}
     user_ids: set = set()
     node_id_set: set = set()
 
-    for n in node_rows:
+    for n in table("graph_nodes").select_iter(
+        "id,concept_name,mastery_score,mastery_tier,user_id",
+        filters={"subject": f"eq.{course_name}"},
+    ):
         user_ids.add(n["user_id"])
         node_id_set.add(n["id"])
         name = n["concept_name"]
         if name not in concept_data:
-            concept_data[name] = {"scores": [], "tiers": []}
-        concept_data[name]["scores"].append(float(n["mastery_score"] or 0.0))
-        concept_data[name]["tiers"].append(n["mastery_tier"] or "unexplored")
+            concept_data[name] = {"concept_name": name, "n": 0, "score_sum": 0.0,
+                                  "struggling": 0, "mastered": 0}
+        data = concept_data[name]
+        tier = n["mastery_tier"] or "unexplored"
+        data["n"] += 1
+        data["score_sum"] += float(n["mastery_score"] or 0.0)
+        data["struggling"] += tier == "struggling"
+        data["mastered"] += tier == "mastered"
+
+    contexts: list = []
+    if concept_data:
+        try:
+            ctx_rows_all = table("quiz_context").select(
+                "concept_node_id,context_json",
+                filters={"user_id": f"in.({','.join(user_ids)})"},
+            )
+        except Exception:
+            ctx_rows_all = []
+        # Keep only contexts for concepts that belong to this course
+        contexts = [r.get("context_json") for r in ctx_rows_all if r["concept_node_id"] in node_id_set]
+
+    return {
+        "student_count": len(user_ids),
+        "concepts": list(concept_data.values()),
+        "contexts": contexts,
+    }
+
+
+def update_course_context(course_name: str) -> None:
+    """
+    Aggregate mastery + quiz data for all students in course_name and upsert
+    into the course_context table. Called automatically after any graph update.
+    """
+    if not course_name:
+        return
+
+    # ── 1+2. Per-concept totals, computed by the database when possible ──────
+    try:
+        summary = rpc("course_concept_stats", {"p_course_name": course_name})
+    except RpcNotFoundError:
+        summary = _stream_course_stats(course_name)
+
+    if not summary or not summary.get("concepts"):
+        return
 
-    student_count = len(user_ids)
+    student_count = summary["student_count"]
 
     # ── 3. Compute per-concept metrics ────────────────────────────────────────
     concept_metrics: dict = {}
-    for name, data in concept_data.items():
-        scores = data["scores"]
-        tiers = data["tiers"]
-        n_s = len(scores)
-        avg_mastery = sum(scores) / n_s
-        struggling_pct = sum(1 for t in tiers if t == "struggling") / n_s
-        mastered_pct = sum(1 for t in tiers if t == "mastered") / n_s
-        concept_metrics[name] = {
-            "avg_mastery": round(avg_mastery, 3),
-            "struggling_pct": round(struggling_pct, 2),
-            "mastered_pct": round(mastered_pct, 2),
+    for data in summary["concepts"]:
+        n_s = data["n"]
+        concept_metrics[data["concept_name"]] = {
+            "avg_mastery": round(data["score_sum"] / n_s, 3),
+            "struggling_pct": round(data["struggling"] / n_s, 2),
+            "mastered_pct": round(data["mastered"] / n_s, 2),
         }
 
     struggling_concepts = sorted(
@@ -109,27 +150,14 @@ def update_course_context(course_name: str) -> None:
         key=lambda x: x["avg_mastery"],  # lowest mastery = hardest
     )
 
-    # ── 4. Pull quiz_context for this course's students, filter by node ───────
-    user_id_list = list(user_ids)
-    try:
-        ctx_rows_all = table("quiz_context").select(
-            "concept_node_id,context_json",
-            filters={"user_id": f"in.({','.join(user_id_list)})"},
-        )
-    except Exception:
-        ctx_rows_all = []
-
-    # Keep only contexts for concepts that belong to this course
-    ctx_rows = [r for r in ctx_rows_all if r["concept_node_id"] in node_id_set]
-
-    # ── 5. Deduplicate misconceptions and weak areas (case-insensitive) ───────
+    # ── 4. Deduplicate misconceptions and weak areas (case-insensitive) ───────
     seen: set = set()
     common_misconceptions: list = []
     seen2: set = set()
     weak_areas: list = []
 
-    for ctx in ctx_rows:
-        cj = ctx.get("context_json") or {}
+    for cj in summary["contexts"]:
+        cj = cj or {}
         if isinstance(cj, str):
             import json as _json
             try:
@@ -149,7 +177,7 @@ def update_course_context(course_name: str) -> None:
                 seen2.add(w.lower())
                 weak_areas.append(w)
 
-    # ── 6. Upsert into course_context ─────────────────────────────────────────
+    # ── 5. Upsert into course_context ─────────────────────────────────────────
     context = {
         "struggling_concepts": struggling_concepts,
         "mastered_concepts": mastered_concepts,
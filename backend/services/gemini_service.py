@@ -1,17 +1,23 @@
+import asyncio
 import json
 import re
 import time
 import os
 import sys
+from typing import AsyncIterator
 
 from google import genai
 from google.genai import types
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import GEMINI_API_KEY
+from services import llm_cache_service as llm_cache
+from services import prompt_cache_service as prompt_cache
+from services.rate_limit_service import CHAT, MAX_RETRIES, QUIZ, backoff_delay, limiter
 
 _client = genai.Client(api_key=GEMINI_API_KEY)
 _MODEL = "gemini-2.5-flash"
+_TEMPERATURE = 0.7
 
 
 def _strip_backtick_fencing(text: str) -> str:
@@ -55,14 +61,95 @@ def _extract_json(text: str) -> str:
     return text  # give up, let json.loads raise
 
 
-def call_gemini(prompt: str, retries: int = 1, json_mode: bool = False) -> str:
+def _generation_config(json_mode: bool, **extra) -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        temperature=_TEMPERATURE,
+        max_output_tokens=16384,
+        **({"response_mime_type": "application/json"} if json_mode else {}),
+        **extra,
+    )
+
+
+class _CachedContentBackend:
+    """prompt_cache_service backend over the SDK's cached-content API."""
+
+    async def create(self, prefix: str, ttl: float, label: str) -> str:
+        # Made on behalf of a tutoring turn, so it queues with chat calls
+        await limiter.acquire_async(CHAT)
+        cached = await _client.aio.caches.create(
+            model=_MODEL,
+            config=types.CreateCachedContentConfig(
+                system_instruction=prefix,
+                ttl=f"{int(ttl)}s",
+                display_name=f"sapling-{label}",
+            ),
+        )
+        return cached.name
+
+
+prompt_cache.set_backend(_CachedContentBackend())
+
+
+async def _prefixed_config(json_mode: bool, system_prefix: str, prefix_label: str) -> tuple:
+    """
+    (config, cached content name or None) for a call whose prompt starts with
+    the static `system_prefix`: the prefix is referenced from the prompt cache
+    when it has one, and sent inline as the system instruction otherwise.
+    """
+    if not system_prefix:
+        return _generation_config(json_mode), None
+    name = await prompt_cache.get(system_prefix, prefix_label)
+    if name:
+        return _generation_config(json_mode, cached_content=name), name
+    return _generation_config(json_mode, system_instruction=system_prefix), None
+
+
+def _is_stale_cache(err: Exception) -> bool:
+    # The cached content expired or was deleted on Gemini's side before we refreshed it
+    return "cachedcontent" in str(err).lower().replace(" ", "").replace("_", "")
+
+
+def _is_retryable(err: Exception) -> bool:
+    err_str = str(err)
+    return "429" in err_str or "500" in err_str
+
+
+def _retry_delay(err: Exception, attempt: int, retries: int):
+    """Seconds to back off before retrying after `err`, or None to give up.
+    A 429 also empties the shared bucket so other callers slow down too."""
+    if attempt >= retries or not _is_retryable(err):
+        return None
+    if "429" in str(err):
+        limiter.penalize()
+    return backoff_delay(attempt)
+
+
+def _cache_key(prompt: str, json_mode: bool) -> str:
+    return llm_cache.cache_key(_MODEL, prompt, json_mode, _TEMPERATURE)
+
+
+def call_gemini(prompt: str, retries: int = MAX_RETRIES, json_mode: bool = False,
+                priority: int = QUIZ, cache: bool = False) -> str:
+    """
+    Generate a response. Every attempt is admitted by the process-wide rate
+    limiter at `priority` (rate_limit_service.CHAT / QUIZ / BACKGROUND), and
+    429/500 errors are retried with jittered exponential backoff.
+
+    cache=True serves repeated prompts from llm_cache_service; use it only
+    where the same prompt should always get the same answer.
+    """
+    if cache:
+        key = _cache_key(prompt, json_mode)
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return cached
+        response = call_gemini(prompt, retries, json_mode, priority)
+        llm_cache.put(key, response)
+        return response
     for attempt in range(retries + 1):
+        limiter.acquire(priority)
         try:
-            config = types.GenerateContentConfig(
-                temperature=0.7,
-                max_output_tokens=16384,
-                **({"response_mime_type": "application/json"} if json_mode else {}),
-            )
+            config = _generation_config(json_mode)
             response = _client.models.generate_content(
                 model=_MODEL,
                 contents=prompt,
@@ -72,15 +159,88 @@ def call_gemini(prompt: str, retries: int = 1, json_mode: bool = False) -> str:
                 raise ValueError("Gemini returned empty response (content may have been filtered)")
             return response.text
         except Exception as e:
-            err_str = str(e)
-            if attempt < retries and ("429" in err_str or "500" in err_str):
-                time.sleep(2)
+            delay = _retry_delay(e, attempt, retries)
+            if delay is None:
+                raise
+            time.sleep(delay)
+
+
+async def call_gemini_async(prompt: str, retries: int = MAX_RETRIES, json_mode: bool = False,
+                            priority: int = QUIZ, cache: bool = False,
+                            system_prefix: str = "", prefix_label: str = "prefix") -> str:
+    """
+    Non-blocking call_gemini for async routes (uses the SDK's aio client).
+
+    `system_prefix` is static text that precedes `prompt` on every call
+    (e.g. the rules for one tutoring mode); it is served from Gemini's
+    context cache via prompt_cache_service, keyed by `prefix_label` in stats.
+    """
+    if cache:
+        key = _cache_key(f"{system_prefix}\n\n{prompt}" if system_prefix else prompt, json_mode)
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return cached
+        response = await call_gemini_async(prompt, retries, json_mode, priority,
+                                           system_prefix=system_prefix, prefix_label=prefix_label)
+        llm_cache.put(key, response)
+        return response
+    for attempt in range(retries + 1):
+        await limiter.acquire_async(priority)
+        config, cached_name = await _prefixed_config(json_mode, system_prefix, prefix_label)
+        try:
+            response = await _client.aio.models.generate_content(
+                model=_MODEL,
+                contents=prompt,
+                config=config,
+            )
+            if not response.text:
+                raise ValueError("Gemini returned empty response (content may have been filtered)")
+            return response.text
+        except Exception as e:
+            if cached_name and attempt < retries and _is_stale_cache(e):
+                prompt_cache.invalidate(system_prefix)
                 continue
-            raise
+            delay = _retry_delay(e, attempt, retries)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
 
 
-def call_gemini_json(prompt: str):
-    raw = call_gemini(prompt, json_mode=True)
+async def stream_gemini_async(prompt: str, retries: int = MAX_RETRIES, priority: int = QUIZ,
+                              system_prefix: str = "", prefix_label: str = "prefix") -> AsyncIterator[str]:
+    """
+    Stream a text response as it is generated (the SDK's streaming API),
+    yielding text chunks. Retries like call_gemini_async, but only before the
+    first chunk: once text has reached the caller a failure is raised.
+    """
+    for attempt in range(retries + 1):
+        await limiter.acquire_async(priority)
+        config, cached_name = await _prefixed_config(False, system_prefix, prefix_label)
+        streamed = False
+        try:
+            stream = await _client.aio.models.generate_content_stream(
+                model=_MODEL,
+                contents=prompt,
+                config=config,
+            )
+            async for chunk in stream:
+                if chunk.text:
+                    streamed = True
+                    yield chunk.text
+            if not streamed:
+                raise ValueError("Gemini returned empty response (content may have been filtered)")
+            return
+        except Exception as e:
+            if cached_name and not streamed and attempt < retries and _is_stale_cache(e):
+                prompt_cache.invalidate(system_prefix)
+                continue
+            delay = None if streamed else _retry_delay(e, attempt, retries)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+
+
+def _parse_json(raw: str):
     try:
         return json.loads(raw)
     except json.JSONDecodeError:
@@ -92,13 +252,27 @@ def call_gemini_json(prompt: str):
             raise ValueError(f"Gemini response was not valid JSON: {e}\nRaw response: {raw[:200]!r}") from e
 
 
+def call_gemini_json(prompt: str, priority: int = QUIZ, cache: bool = False):
+    if not cache:
+        return _parse_json(call_gemini(prompt, json_mode=True, priority=priority))
+    key = _cache_key(prompt, True)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return _parse_json(cached)
+    raw = call_gemini(prompt, json_mode=True, priority=priority)
+    result = _parse_json(raw)
+    llm_cache.put(key, raw)  # only responses that parsed are worth replaying
+    return result
+
+
 def extract_graph_update(response_text: str) -> tuple:
     """
-    Extract <graph_update>...</graph_update> block from AI response.
-    Returns (conversational_text, graph_update_dict).
+    Extract <graph_update>...</graph_update> blocks from AI response.
+    Returns (conversational_text, graph_update_dict). Every block is removed
+    from the text, an unterminated one up to the end, as GraphUpdateFilter
+    hides them while streaming; the lists of all blocks that parse are merged.
     """
-    pattern = r"<graph_update>(.*?)</graph_update>"
-    match = re.search(pattern, response_text, re.DOTALL)
+    pattern = r"<graph_update>(.*?)(?:</graph_update>|$)"
 
     graph_update = {
         "new_nodes": [],
@@ -107,14 +281,76 @@ def extract_graph_update(response_text: str) -> tuple:
         "recommended_next": [],
     }
 
-    if match:
-        raw_json = match.group(1).strip()
+    parsed = []
+    for match in re.finditer(pattern, response_text, re.DOTALL):
         try:
-            graph_update = json.loads(_strip_backtick_fencing(raw_json))
+            parsed.append(json.loads(_strip_backtick_fencing(match.group(1).strip())))
         except json.JSONDecodeError:
             pass
-        conversational = response_text[: match.start()] + response_text[match.end():]
+    if len(parsed) == 1:
+        graph_update = parsed[0]
     else:
-        conversational = response_text
+        for block in parsed:
+            for key, value in block.items():
+                if isinstance(value, list):
+                    graph_update.setdefault(key, []).extend(value)
+                else:
+                    graph_update[key] = value
 
+    conversational = re.sub(pattern, "", response_text, flags=re.DOTALL)
     return conversational.strip(), graph_update
+
+
+_OPEN_TAG = "<graph_update>"
+_CLOSE_TAG = "</graph_update>"
+
+
+def _partial_tag(text: str, tag: str) -> int:
+    """Length of the longest proper prefix of `tag` that `text` ends with."""
+    for k in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:k]):
+            return k
+    return 0
+
+
+class GraphUpdateFilter:
+    """
+    Incremental extract_graph_update for streamed replies. feed() each chunk
+    and show what it returns: conversational text, with <graph_update> blocks
+    held back as soon as their opening tag starts to arrive (a chunk ending in
+    "<graph_up" is kept until the next one decides). When the stream ends,
+    flush() returns any held-back text that turned out not to be a tag and
+    finish() parses the whole response exactly as extract_graph_update does.
+    """
+
+    def __init__(self):
+        self._raw: list = []
+        self._pending = ""
+        self._in_block = False
+
+    def feed(self, chunk: str) -> str:
+        self._raw.append(chunk)
+        self._pending += chunk
+        visible = []
+        while True:
+            tag = _CLOSE_TAG if self._in_block else _OPEN_TAG
+            idx = self._pending.find(tag)
+            if idx == -1:
+                break
+            if not self._in_block:
+                visible.append(self._pending[:idx])
+            self._pending = self._pending[idx + len(tag):]
+            self._in_block = not self._in_block
+        keep = _partial_tag(self._pending, _CLOSE_TAG if self._in_block else _OPEN_TAG)
+        if not self._in_block:
+            visible.append(self._pending[:len(self._pending) - keep])
+        self._pending = self._pending[len(self._pending) - keep:]
+        return "".join(visible)
+
+    def flush(self) -> str:
+        tail, self._pending = ("" if self._in_block else self._pending), ""
+        return tail
+
+    def finish(self) -> tuple:
+        """(conversational_text, graph_update_dict) for the complete response."""
+        return extract_graph_update("".join(self._raw))
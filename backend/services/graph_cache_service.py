@@ -0,0 +1,156 @@
+"""
+graph_cache_service.py
+----------------------
+In-memory snapshots of assembled user graphs, keyed by a per-user version.
+
+Every writer that changes what get_graph returns calls bump(user_id):
+apply_graph_update, submit_quiz, add_course, update_course_color and
+delete_course. get_graph serves the snapshot while its version is current and
+rebuilds it otherwise. Snapshots are evicted LRU-first past GRAPH_CACHE_MAXSIZE
+users and expire after GRAPH_CACHE_TTL seconds, which bounds staleness from
+writes made by other worker processes (versions are per process).
+
+Values computed from a snapshot (e.g. recommendation scores) can be attached
+with put_derived() and live exactly as long as the snapshot they came from.
+
+GRAPH_CACHE_MAXSIZE=0 disables the cache. Counters and memory footprint are
+reported by stats() at GET /api/debug/graph-cache.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+MAXSIZE = int(os.getenv("GRAPH_CACHE_MAXSIZE", "256"))
+TTL = float(os.getenv("GRAPH_CACHE_TTL", "60"))
+
+
+def _deep_size(obj) -> int:
+    """Approximate bytes held by a JSON-shaped object (dicts, lists, scalars)."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k) + _deep_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(_deep_size(v) for v in obj)
+    return size
+
+
+def _copy_graph(graph: dict) -> dict:
+    # Callers may annotate nodes/edges; hand out copies so the snapshot stays intact
+    return {
+        **graph,
+        "nodes": [dict(n) for n in graph["nodes"]],
+        "edges": [dict(e) for e in graph["edges"]],
+        "stats": dict(graph["stats"]),
+    }
+
+
+class GraphSnapshotCache:
+    def __init__(self, maxsize: int = MAXSIZE, ttl: float = TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._versions: dict = {}
+        # user_id → (version, expires_at, bytes, graph, derived values by name)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bumps = 0
+
+    def version(self, user_id: str) -> int:
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def bump(self, user_id: str) -> int:
+        with self._lock:
+            version = self._versions.get(user_id, 0) + 1
+            self._versions[user_id] = version
+            self._entries.pop(user_id, None)
+            self.bumps += 1
+            return version
+
+    def _current(self, user_id: str) -> Optional[tuple]:
+        entry = self._entries.get(user_id)
+        if (
+            entry is None
+            or entry[0] != self._versions.get(user_id, 0)
+            or entry[1] < time.monotonic()
+        ):
+            return None
+        return entry
+
+    def get(self, user_id: str) -> Optional[dict]:
+        if self.maxsize <= 0:
+            return None
+        with self._lock:
+            entry = self._current(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            graph = entry[3]
+        return _copy_graph(graph)
+
+    def put(self, user_id: str, version: int, graph: dict) -> None:
+        """Store a graph built while `version` was current (stale builds are dropped)."""
+        if self.maxsize <= 0:
+            return
+        snapshot = _copy_graph(graph)
+        nbytes = _deep_size(snapshot)
+        with self._lock:
+            if version != self._versions.get(user_id, 0):
+                return  # a writer bumped the version while this graph was being read
+            self._entries[user_id] = (version, time.monotonic() + self.ttl, nbytes, snapshot, {})
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_derived(self, user_id: str, name: str):
+        """A value attached to the current snapshot, or None. Callers must not mutate it."""
+        with self._lock:
+            entry = self._current(user_id)
+            return None if entry is None else entry[4].get(name)
+
+    def put_derived(self, user_id: str, version: int, name: str, value) -> None:
+        """Attach `value` to the snapshot if it is still the one built at `version`."""
+        with self._lock:
+            entry = self._current(user_id)
+            if entry is not None and entry[0] == version:
+                entry[4][name] = value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "version_bumps": self.bumps,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "memory_bytes": sum(e[2] for e in self._entries.values()),
+            }
+
+
+_cache = GraphSnapshotCache()
+
+version = _cache.version
+bump = _cache.bump
+get = _cache.get
+put = _cache.put
+get_derived = _cache.get_derived
+put_derived = _cache.put_derived
+clear = _cache.clear
+stats = _cache.stats
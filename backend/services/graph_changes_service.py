@@ -0,0 +1,145 @@
+"""
+graph_changes_service.py
+------------------------
+Per-user change log (graph_changes table) behind incremental graph fetches.
+
+Writers append one row per node or edge they create, update or delete; a
+user's graph version is the id of their latest row. GET /api/graph/{user_id}
+returns the version, and ?since=<version> returns only what changed after it
+(see graph_service.get_graph_delta), so the payload scales with the change
+rather than with the graph.
+
+Rows only say *which* entity changed. Whether it was upserted or deleted is
+read off the current graph, so replaying a change twice is harmless. If a
+row can't be written the user is marked for a resync, and their next delta
+request gets the full graph instead of one missing that change.
+"""
+
+import logging
+import threading
+
+from db.connection import async_table, table
+
+logger = logging.getLogger("sapling.db")
+
+# Past this many changes a full graph is cheaper to send than a delta
+MAX_DELTA_CHANGES = 500
+
+SUBJECT_ROOT_PREFIX = "subject_root__"
+
+# Users whose change log lost rows; served a full graph by the next delta
+_resync: set = set()
+_resync_lock = threading.Lock()
+
+
+def record(user_id: str, nodes=(), edges=()) -> None:
+    """
+    Log changed entities: `nodes` is an iterable of (node_id, subject), `edges`
+    of edge ids. Never raises, so a graph write never fails because of the log;
+    if the rows are lost the user is marked for a resync (take_resync).
+    """
+    rows = [
+        {"user_id": user_id, "entity": "node", "entity_id": node_id, "subject": subject}
+        for node_id, subject in nodes
+    ]
+    rows += [
+        {"user_id": user_id, "entity": "edge", "entity_id": edge_id, "subject": None}
+        for edge_id in edges
+    ]
+    if not rows:
+        return
+    try:
+        table("graph_changes").insert(rows)
+    except Exception as e:
+        logger.warning("graph_changes rows for %s lost, next delta is a full graph: %s", user_id, e)
+        with _resync_lock:
+            _resync.add(user_id)
+
+
+def take_resync(user_id: str) -> bool:
+    """True if the user's change log lost rows since the last call (clears the mark)."""
+    with _resync_lock:
+        if user_id not in _resync:
+            return False
+        _resync.discard(user_id)
+        return True
+
+
+def latest_version(user_id: str) -> int:
+    try:
+        rows = table("graph_changes").select(
+            "id", filters={"user_id": f"eq.{user_id}"}, order="id.desc", limit=1
+        )
+    except Exception:
+        return 0
+    return rows[0]["id"] if rows else 0
+
+
+async def latest_version_async(user_id: str) -> int:
+    try:
+        rows = await async_table("graph_changes").select(
+            "id", filters={"user_id": f"eq.{user_id}"}, order="id.desc", limit=1
+        )
+    except Exception:
+        return 0
+    return rows[0]["id"] if rows else 0
+
+
+def _changes_params(user_id: str, since: int) -> dict:
+    return {
+        "columns": "id,entity,entity_id,subject",
+        "filters": {"user_id": f"eq.{user_id}", "id": f"gt.{since}"},
+        "order": "id.asc",
+        "limit": MAX_DELTA_CHANGES + 1,
+    }
+
+
+def changes_since(user_id: str, since: int) -> list:
+    return table("graph_changes").select(**_changes_params(user_id, since))
+
+
+async def changes_since_async(user_id: str, since: int) -> list:
+    return await async_table("graph_changes").select(**_changes_params(user_id, since))
+
+
+def diff_graph(graph: dict, since: int, changes: list) -> dict:
+    """
+    Cut an assembled graph (get_graph output) down to the entities named in
+    `changes`: present ones are returned in full, missing ones as deletions.
+    Subject roots and subject edges are derived data, so the roots of every
+    touched subject and the subject edges of every changed node are included.
+    """
+    changed_nodes: dict = {}
+    changed_edges: set = set()
+    for c in changes:
+        if c["entity"] == "edge":
+            changed_edges.add(c["entity_id"])
+        elif c["entity_id"].startswith(SUBJECT_ROOT_PREFIX):
+            changed_nodes[c["entity_id"]] = c["entity_id"][len(SUBJECT_ROOT_PREFIX):]
+        else:
+            changed_nodes[c["entity_id"]] = c.get("subject") or "General"
+    root_ids = {f"{SUBJECT_ROOT_PREFIX}{s}" for s in changed_nodes.values()}
+
+    nodes = [n for n in graph["nodes"] if n["id"] in changed_nodes or n["id"] in root_ids]
+    present = {n["id"] for n in nodes}
+    deleted_nodes = sorted((set(changed_nodes) | root_ids) - present)
+
+    subject_edge_ids = {
+        f"subject_edge__{SUBJECT_ROOT_PREFIX}{subject}__{node_id}"
+        for node_id, subject in changed_nodes.items()
+        if not node_id.startswith(SUBJECT_ROOT_PREFIX)
+    }
+    edges = [e for e in graph["edges"] if e["id"] in changed_edges or e["id"] in subject_edge_ids]
+    present_edges = {e["id"] for e in edges}
+    deleted_edges = sorted((changed_edges | subject_edge_ids) - present_edges)
+
+    return {
+        "full": False,
+        "since": since,
+        "version": graph.get("version", 0),
+        "nodes": nodes,
+        "edges": edges,
+        "deleted_nodes": deleted_nodes,
+        "deleted_edges": deleted_edges,
+        "stats": graph["stats"],
+    }
@@ -1,26 +1,57 @@
+import asyncio
+import functools
 import uuid
+from collections import Counter
 from datetime import datetime
 
-from config import get_mastery_tier
-from db.connection import table
+from config import CONCEPT_FUZZY_THRESHOLD, get_mastery_tier
+from db.connection import RpcNotFoundError, async_table, in_filter, rpc, rpc_async, table
+from services import graph_cache_service as graph_cache
+from services import graph_changes_service as graph_changes
+from services.knowledge_graph_service import KnowledgeGraph
+from services import recommendation_service as recommendations
+from services import subject_stats_service as subject_stats
+from services.concept_key_service import concept_key, resolve_keys
+
+
+def _default_user_name(user_id: str) -> str:
+    return user_id.replace("user_", "").replace("_", " ").title()
 
 
 def ensure_user_exists(user_id: str) -> None:
     """Create a user row if one doesn't exist yet (prevents FK violations)."""
     existing = table("users").select("id", filters={"id": f"eq.{user_id}"})
     if not existing:
-        name = user_id.replace("user_", "").replace("_", " ").title()
+        name = _default_user_name(user_id)
         try:
             table("users").insert({"id": user_id, "name": name, "streak_count": 0})
         except Exception:
             pass  # already exists (race condition) — safe to ignore
 
 
-def get_graph(user_id: str) -> dict:
-    ensure_user_exists(user_id)
-    nodes = table("graph_nodes").select("*", filters={"user_id": f"eq.{user_id}"})
+async def ensure_user_exists_async(user_id: str) -> None:
+    existing = await async_table("users").select("id", filters={"id": f"eq.{user_id}"})
+    if not existing:
+        name = _default_user_name(user_id)
+        try:
+            await async_table("users").insert({"id": user_id, "name": name, "streak_count": 0})
+        except Exception:
+            pass  # already exists (race condition) — safe to ignore
 
-    edges_raw = table("graph_edges").select("*", filters={"user_id": f"eq.{user_id}"})
+
+def _assemble_graph(
+    user_id: str,
+    nodes: list,
+    edges_raw: list,
+    streak: int,
+    user_course_names: set,
+    version: int = 0,
+) -> dict:
+    """
+    Build the API graph payload (stats + synthetic subject roots) from raw rows.
+    `version` is the user's graph_changes position, the token for ?since= deltas.
+    """
+    kg = KnowledgeGraph.from_rows(user_id, nodes, edges_raw)
     edges = [
         {
             "id": e["id"],
@@ -31,60 +62,35 @@ def get_graph(user_id: str) -> dict:
         for e in edges_raw
     ]
 
-    mastered   = sum(1 for n in nodes if n["mastery_tier"] == "mastered")
-    learning   = sum(1 for n in nodes if n["mastery_tier"] == "learning")
-    struggling = sum(1 for n in nodes if n["mastery_tier"] == "struggling")
-    unexplored = sum(1 for n in nodes if n["mastery_tier"] == "unexplored")
-
-    user_rows = table("users").select("streak_count", filters={"id": f"eq.{user_id}"})
-    streak = user_rows[0]["streak_count"] if user_rows else 0
-
-    try:
-        course_rows = table("courses").select("course_name", filters={"user_id": f"eq.{user_id}"})
-        user_course_names = {r["course_name"] for r in course_rows}
-    except Exception:
-        user_course_names = set()
-
-    stats = {
-        "total_nodes": len(nodes),
-        "mastered": mastered,
-        "learning": learning,
-        "struggling": struggling,
-        "unexplored": unexplored,
-        "streak": streak,
-    }
-
-    subject_map: dict = {}
-    for n in nodes:
-        subj = n.get("subject") or "General"
-        subject_map.setdefault(subj, []).append(n)
+    stats = {"total_nodes": len(nodes), **kg.tier_counts(), "streak": streak}
 
     subject_nodes = []
     subject_edges = []
-    for subj, subj_nodes in subject_map.items():
+    counts, score_sums, studied_sums = kg.subject_totals()
+    for code, members in enumerate(kg.subject_members()):
+        subj = kg.subject_names[code]
         root_id = f"subject_root__{subj}"
-        avg_mastery = sum(n["mastery_score"] for n in subj_nodes) / len(subj_nodes)
         subject_nodes.append({
             "id": root_id,
             "user_id": user_id,
             "concept_name": subj,
-            "mastery_score": round(avg_mastery, 4),
+            "mastery_score": round(float(score_sums[code] / counts[code]), 4),
             "mastery_tier": "subject_root",
             "subject": subj,
-            "times_studied": sum(n.get("times_studied", 0) for n in subj_nodes),
+            "times_studied": int(studied_sums[code]),
             "last_studied_at": None,
             "is_subject_root": True,
         })
-        for n in subj_nodes:
+        for i in members:
             subject_edges.append({
-                "id": f"subject_edge__{root_id}__{n['id']}",
+                "id": f"subject_edge__{root_id}__{kg.ids[i]}",
                 "source": root_id,
-                "target": n["id"],
+                "target": kg.ids[i],
                 "strength": 0.7,
             })
 
     for course_name in user_course_names:
-        if course_name not in subject_map:
+        if course_name not in kg.subject_names:
             subject_nodes.append({
                 "id": f"subject_root__{course_name}",
                 "user_id": user_id,
@@ -97,12 +103,179 @@ def get_graph(user_id: str) -> dict:
                 "is_subject_root": True,
             })
 
-    return {"nodes": nodes + subject_nodes, "edges": edges + subject_edges, "stats": stats}
+    return {
+        "nodes": nodes + subject_nodes,
+        "edges": edges + subject_edges,
+        "stats": stats,
+        "version": version,
+    }
+
+
+def _get_graph_per_table(user_id: str) -> dict:
+    """Fallback for get_graph when the get_graph_bundle SQL function is not deployed."""
+    ensure_user_exists(user_id)
+    # Read the version first: data newer than its token is re-sent, never missed
+    version = graph_changes.latest_version(user_id)
+    nodes = table("graph_nodes").select("*", filters={"user_id": f"eq.{user_id}"})
+    edges_raw = table("graph_edges").select("*", filters={"user_id": f"eq.{user_id}"})
+
+    user_rows = table("users").select("streak_count", filters={"id": f"eq.{user_id}"})
+    streak = user_rows[0]["streak_count"] if user_rows else 0
+
+    try:
+        course_rows = table("courses").select("course_name", filters={"user_id": f"eq.{user_id}"})
+        user_course_names = {r["course_name"] for r in course_rows}
+    except Exception:
+        user_course_names = set()
+
+    return _assemble_graph(user_id, nodes, edges_raw, streak, user_course_names, version)
+
+
+async def _get_graph_per_table_async(user_id: str) -> dict:
+    """Async fallback: the four reads are independent, so they run concurrently."""
+    await ensure_user_exists_async(user_id)
+    version = await graph_changes.latest_version_async(user_id)
+
+    async def _course_names() -> set:
+        try:
+            rows = await async_table("courses").select(
+                "course_name", filters={"user_id": f"eq.{user_id}"}
+            )
+            return {r["course_name"] for r in rows}
+        except Exception:
+            return set()
+
+    nodes, edges_raw, user_rows, user_course_names = await asyncio.gather(
+        async_table("graph_nodes").select("*", filters={"user_id": f"eq.{user_id}"}),
+        async_table("graph_edges").select("*", filters={"user_id": f"eq.{user_id}"}),
+        async_table("users").select("streak_count", filters={"id": f"eq.{user_id}"}),
+        _course_names(),
+    )
+    streak = user_rows[0]["streak_count"] if user_rows else 0
+    return _assemble_graph(user_id, nodes, edges_raw, streak, user_course_names, version)
+
+
+# Tables the SQL functions write, so their read caches are dropped (db/cache.py)
+_BUNDLE_WRITES = ("users",)  # a missing user row is created
+_DELETE_COURSE_WRITES = ("quiz_context", "quiz_attempts", "graph_edges", "graph_nodes",
+                         "courses", "subject_stats", "graph_changes")
+
+
+def _bundle_args(user_id: str) -> dict:
+    return {"p_user_id": user_id, "p_name": _default_user_name(user_id)}
+
+
+def _assemble_bundle(user_id: str, bundle: dict) -> dict:
+    return _assemble_graph(
+        user_id,
+        bundle.get("nodes") or [],
+        bundle.get("edges") or [],
+        bundle.get("streak") or 0,
+        set(bundle.get("course_names") or []),
+        bundle.get("version") or 0,
+    )
+
+
+def get_graph(user_id: str) -> dict:
+    """
+    Fetch the user's graph in one round-trip (get_graph_bundle SQL function,
+    which also creates a missing user row). Falls back to per-table reads when
+    the function isn't deployed. Unchanged graphs are served from the
+    versioned snapshot cache (services/graph_cache_service.py).
+    """
+    cached = graph_cache.get(user_id)
+    if cached is not None:
+        return cached
+    version = graph_cache.version(user_id)
+    try:
+        bundle = rpc("get_graph_bundle", _bundle_args(user_id), writes=_BUNDLE_WRITES)
+    except RpcNotFoundError:
+        graph = _get_graph_per_table(user_id)
+    else:
+        graph = _assemble_bundle(user_id, bundle)
+    graph_cache.put(user_id, version, graph)
+    return graph
+
+
+async def get_graph_async(user_id: str) -> dict:
+    cached = graph_cache.get(user_id)
+    if cached is not None:
+        return cached
+    version = graph_cache.version(user_id)
+    try:
+        bundle = await rpc_async("get_graph_bundle", _bundle_args(user_id), writes=_BUNDLE_WRITES)
+    except RpcNotFoundError:
+        graph = await _get_graph_per_table_async(user_id)
+    else:
+        graph = _assemble_bundle(user_id, bundle)
+    graph_cache.put(user_id, version, graph)
+    return graph
+
+
+def _delta(since: int, graph: dict, changes) -> dict:
+    if changes is None or len(changes) > graph_changes.MAX_DELTA_CHANGES:
+        return {**graph, "full": True, "since": since}
+    # Changes logged after the graph was read are picked up by the next delta
+    changes = [c for c in changes if c["id"] <= graph["version"]]
+    return graph_changes.diff_graph(graph, since, changes)
+
+
+def get_graph_delta(user_id: str, since: int) -> dict:
+    """
+    Nodes and edges created, updated or deleted after version `since`, with the
+    new version token. Falls back to the full graph (full=True) when the token
+    is unknown, the change log can't be read or it lost rows since the last
+    delta (graph_changes.take_resync).
+    """
+    graph = get_graph(user_id)
+    if graph_changes.take_resync(user_id) or since > graph["version"] or since < 0:
+        return {**graph, "full": True, "since": since}
+    if since == graph["version"]:
+        return graph_changes.diff_graph(graph, since, [])
+    try:
+        changes = graph_changes.changes_since(user_id, since)
+    except Exception:
+        changes = None
+    return _delta(since, graph, changes)
+
+
+async def get_graph_delta_async(user_id: str, since: int) -> dict:
+    graph = await get_graph_async(user_id)
+    if graph_changes.take_resync(user_id) or since > graph["version"] or since < 0:
+        return {**graph, "full": True, "since": since}
+    if since == graph["version"]:
+        return graph_changes.diff_graph(graph, since, [])
+    try:
+        changes = await graph_changes.changes_since_async(user_id, since)
+    except Exception:
+        changes = None
+    return _delta(since, graph, changes)
+
+
+def _bumps_graph_version(writer):
+    """Invalidate the user's graph snapshot after a writer runs (even if it fails midway)."""
+    @functools.wraps(writer)
+    def wrapper(user_id: str, *args, **kwargs):
+        try:
+            return writer(user_id, *args, **kwargs)
+        finally:
+            graph_cache.bump(user_id)
+    return wrapper
 
 
 # ── Course management ──────────────────────────────────────────────────────────
 
 def get_courses(user_id: str) -> list:
+    """Courses with their node counts in one round-trip (courses_with_node_counts SQL function)."""
+    subject_stats.repair(user_id)
+    try:
+        return rpc("courses_with_node_counts", {"p_user_id": user_id})
+    except RpcNotFoundError:
+        return _get_courses_per_table(user_id)
+
+
+def _get_courses_per_table(user_id: str) -> list:
+    """Fallback when the SQL function is not deployed: two selects, counted client-side."""
     try:
         rows = table("courses").select(
             "id,course_name,color,created_at",
@@ -111,22 +284,29 @@ def get_courses(user_id: str) -> list:
         )
     except Exception:
         return []
-    result = []
-    for r in rows:
-        node_rows = table("graph_nodes").select(
-            "id",
-            filters={"user_id": f"eq.{user_id}", "subject": f"eq.{r['course_name']}"},
+    if not rows:
+        return []
+    node_counts = Counter(
+        n["subject"]
+        for n in table("graph_nodes").select(
+            "subject",
+            filters={"user_id": f"eq.{user_id}",
+                     "subject": in_filter([r["course_name"] for r in rows])},
         )
-        result.append({
+    )
+    return [
+        {
             "id": r["id"],
             "course_name": r["course_name"],
             "color": r["color"],
-            "node_count": len(node_rows),
+            "node_count": node_counts[r["course_name"]],
             "created_at": r["created_at"],
-        })
-    return result
+        }
+        for r in rows
+    ]
 
 
+@_bumps_graph_version
 def add_course(user_id: str, course_name: str, color: str | None = None) -> dict:
     existing = table("courses").select(
         "id",
@@ -140,9 +320,12 @@ def add_course(user_id: str, course_name: str, color: str | None = None) -> dict
         "course_name": course_name,
         "color": color,
     })
+    root_id = f"{graph_changes.SUBJECT_ROOT_PREFIX}{course_name}"
+    graph_changes.record(user_id, nodes=[(root_id, course_name)])
     return {"course_name": course_name, "already_existed": False}
 
 
+@_bumps_graph_version
 def update_course_color(user_id: str, course_name: str, color: str) -> dict:
     table("courses").update(
         {"color": color},
@@ -151,109 +334,225 @@ def update_course_color(user_id: str, course_name: str, color: str) -> dict:
     return {"updated": True}
 
 
+@_bumps_graph_version
 def delete_course(user_id: str, course_name: str) -> dict:
+    """
+    Delete a course, its nodes and every row that references them. The
+    delete_course_cascade SQL function does it in one transaction and one
+    round-trip; `removed` is the number of rows deleted per table. Only a
+    missing function falls back to per-table deletes - a timeout or database
+    error may already have committed, so it is raised, not retried by hand.
+    """
+    try:
+        removed = rpc("delete_course_cascade", {"p_user_id": user_id, "p_course_name": course_name},
+                      writes=_DELETE_COURSE_WRITES)
+    except RpcNotFoundError:
+        removed = _delete_course_per_table(user_id, course_name)
+    return {"deleted": True, "removed": removed}
+
+
+def _delete_course_per_table(user_id: str, course_name: str) -> dict:
+    """Fallback when the SQL function is not deployed: one DELETE per table, not atomic."""
     node_rows = table("graph_nodes").select(
         "id",
         filters={"user_id": f"eq.{user_id}", "subject": f"eq.{course_name}"},
     )
     node_ids = [n["id"] for n in node_rows]
+    removed = dict.fromkeys(("quiz_context", "quiz_attempts", "graph_edges", "graph_nodes"), 0)
+    deleted_edges: list = []
 
     if node_ids:
-        ids_str = ",".join(node_ids)
+        ids = in_filter(node_ids)
         # Delete all tables that FK-reference graph_nodes before deleting nodes
-        table("quiz_context").delete({"concept_node_id": f"in.({ids_str})"})
-        table("quiz_attempts").delete({"concept_node_id": f"in.({ids_str})"})
-        table("graph_edges").delete({"source_node_id": f"in.({ids_str})"})
-        table("graph_edges").delete({"target_node_id": f"in.({ids_str})"})
-        table("graph_nodes").delete(
+        removed["quiz_context"] = len(table("quiz_context").delete({"concept_node_id": ids}) or [])
+        removed["quiz_attempts"] = len(table("quiz_attempts").delete({"concept_node_id": ids}) or [])
+        deleted_edges += table("graph_edges").delete({"source_node_id": ids}) or []
+        deleted_edges += table("graph_edges").delete({"target_node_id": ids}) or []
+        removed["graph_edges"] = len(deleted_edges)
+        removed["graph_nodes"] = len(table("graph_nodes").delete(
             {"user_id": f"eq.{user_id}", "subject": f"eq.{course_name}"}
-        )
+        ) or [])
 
-    table("courses").delete(
+    removed["courses"] = len(table("courses").delete(
         {"user_id": f"eq.{user_id}", "course_name": f"eq.{course_name}"}
+    ) or [])
+    try:
+        table("subject_stats").delete({"user_id": f"eq.{user_id}", "subject": f"eq.{course_name}"})
+    except Exception:
+        subject_stats.mark_dirty(user_id)  # derived summary; the next read rebuilds it
+    graph_changes.record(
+        user_id,
+        nodes=[(node_id, course_name) for node_id in node_ids]
+        + [(f"{graph_changes.SUBJECT_ROOT_PREFIX}{course_name}", course_name)],
+        edges=[e["id"] for e in deleted_edges],
     )
-    return {"deleted": True}
+    return removed
+
+
+# Node columns apply_graph_update reads to resolve and update concepts
+_NODE_COLUMNS = "id,concept_name,concept_key,mastery_score,mastery_tier,times_studied,subject"
 
 
+@_bumps_graph_version
 def apply_graph_update(user_id: str, graph_update: dict) -> list:
-    """Apply a graph_update dict to the DB. Returns mastery_changes list."""
+    """
+    Apply a graph_update dict to the DB. Returns mastery_changes list.
+
+    Concept names are matched on their normalized key (concept_key_service),
+    so spelling variants update the existing node rather than adding one.
+
+    Batched: one in.() select resolves every concept name the update mentions
+    (plus one over nodes that predate concept_key when a name is not found),
+    then new nodes go in one bulk insert, mastery changes in one bulk upsert,
+    new edges in one upsert on the (source, target) key, the touched ids in
+    one graph_changes insert and the per-subject summary deltas in one
+    subject_stats call — at most seven round-trips however large the update
+    (plus one re-read if another writer created the same concept meanwhile).
+    Updates are applied in order on the resolved rows, so repeated concepts
+    compound exactly as sequential writes did.
+    """
     mastery_changes = []
     touched_subjects: set = set()
-
-    for new_node in graph_update.get("new_nodes", []):
+    changed_nodes: dict = {}  # node id → subject, for the graph_changes log
+    new_edge_ids: list = []
+    stats_before: dict = {}  # node id → row as read, for the subject_stats deltas
+    new_nodes = graph_update.get("new_nodes", [])
+    updated_nodes = graph_update.get("updated_nodes", [])
+    new_edges = graph_update.get("new_edges", [])
+
+    # ── 1. Resolve every referenced concept name in one query, by key ─────────
+    names = {n.get("concept_name", "") for n in new_nodes}
+    names |= {u.get("concept_name", "") for u in updated_nodes}
+    names |= {e.get(k, "") for e in new_edges for k in ("source", "target")}
+    key_of = {name: concept_key(name) for name in names}
+    by_key: dict = {}
+    if names:
+        filters = {"user_id": f"eq.{user_id}"}
+        if not CONCEPT_FUZZY_THRESHOLD:
+            filters["concept_key"] = in_filter(sorted(set(key_of.values())))
+        # Fuzzy matching compares against every existing key, so read them all
+        rows = table("graph_nodes").select(_NODE_COLUMNS, filters=filters)
+        if not CONCEPT_FUZZY_THRESHOLD and set(key_of.values()) - {r["concept_key"] for r in rows}:
+            # Nodes written before the concept_key column have no key until
+            # db/backfill_concept_keys.py runs; the in.() filter never returns
+            # them, so a name it missed is looked for among them by its key.
+            rows += table("graph_nodes").select(
+                _NODE_COLUMNS, filters={"user_id": f"eq.{user_id}", "concept_key": "is.null"},
+            )
+        for row in rows:
+            if row["concept_key"] is not None:
+                by_key.setdefault(row["concept_key"], row)
+        # A keyed row wins over an unkeyed one; the key is written back with
+        # the mastery update in step 3
+        for row in rows:
+            if row["concept_key"] is None:
+                key = concept_key(row["concept_name"])
+                if key not in by_key:
+                    by_key[key] = {**row, "concept_key": key}
+        if CONCEPT_FUZZY_THRESHOLD:
+            resolved = resolve_keys(key_of.values(), by_key, CONCEPT_FUZZY_THRESHOLD)
+            key_of = {name: resolved[key] for name, key in key_of.items()}
+
+    # ── 2. Bulk-insert concepts that don't exist yet ──────────────────────────
+    to_insert: dict = {}
+    for new_node in new_nodes:
         name = new_node.get("concept_name", "")
+        key = key_of[name]
         subject = new_node.get("subject", "General")
         init_m = float(new_node.get("initial_mastery", 0.0))
-        existing = table("graph_nodes").select(
-            "id",
-            filters={"user_id": f"eq.{user_id}", "concept_name": f"eq.{name}"},
-        )
-        if not existing:
-            table("graph_nodes").insert({
+        if key not in by_key and key not in to_insert:
+            to_insert[key] = {
                 "id": str(uuid.uuid4()),
                 "user_id": user_id,
                 "concept_name": name,
+                "concept_key": key,
                 "mastery_score": init_m,
                 "mastery_tier": get_mastery_tier(init_m),
                 "subject": subject,
-            })
+            }
         if subject and subject != "General":
             touched_subjects.add(subject)
-
-    for upd in graph_update.get("updated_nodes", []):
+    if to_insert:
+        # A concurrent writer may have created the same key since step 1: the
+        # unique (user_id, concept_key) index skips those rows and they are
+        # read back instead, so a concept is never created twice.
+        inserted = table("graph_nodes").upsert(
+            list(to_insert.values()), on_conflict="user_id,concept_key", ignore_duplicates=True,
+        ) or []
+        for row in inserted:
+            by_key.setdefault(row["concept_key"], row)
+        raced = [key for key in to_insert if key not in by_key]
+        if raced:
+            for row in table("graph_nodes").select(
+                _NODE_COLUMNS,
+                filters={"user_id": f"eq.{user_id}", "concept_key": in_filter(raced)},
+            ):
+                by_key.setdefault(row["concept_key"], row)
+        for key, row in to_insert.items():
+            by_key.setdefault(key, {**row, "times_studied": 0})
+            if by_key[key]["id"] == row["id"]:  # created here, not by the other writer
+                changed_nodes[row["id"]] = row["subject"]
+
+    # ── 3. Apply mastery deltas in order, then write them in one upsert ───────
+    pending: dict = {}
+    studied_at = datetime.utcnow().isoformat()
+    for upd in updated_nodes:
         name = upd.get("concept_name", "")
         delta = float(upd.get("mastery_delta", 0.0))
-        rows = table("graph_nodes").select(
-            "id,mastery_score,times_studied,subject",
-            filters={"user_id": f"eq.{user_id}", "concept_name": f"eq.{name}"},
-        )
-        if rows:
-            row = rows[0]
-            before = row["mastery_score"]
-            after = max(0.0, min(1.0, before + delta))
-            table("graph_nodes").update(
-                {
-                    "mastery_score": after,
-                    "mastery_tier": get_mastery_tier(after),
-                    "times_studied": row["times_studied"] + 1,
-                    "last_studied_at": datetime.utcnow().isoformat(),
-                },
-                filters={"id": f"eq.{row['id']}"},
-            )
-            mastery_changes.append({"concept": name, "before": before, "after": after})
-            subj = row.get("subject", "")
-            if subj and subj != "General":
-                touched_subjects.add(subj)
-
-    for new_edge in graph_update.get("new_edges", []):
-        src_name = new_edge.get("source", "")
-        tgt_name = new_edge.get("target", "")
-        strength = float(new_edge.get("strength", 0.5))
-        src_rows = table("graph_nodes").select(
-            "id", filters={"user_id": f"eq.{user_id}", "concept_name": f"eq.{src_name}"}
-        )
-        tgt_rows = table("graph_nodes").select(
-            "id", filters={"user_id": f"eq.{user_id}", "concept_name": f"eq.{tgt_name}"}
+        row = by_key.get(key_of[name])
+        if row is None:
+            continue
+        if row["id"] not in changed_nodes:
+            stats_before[row["id"]] = dict(row)  # existed before this update
+        before = row["mastery_score"]
+        after = max(0.0, min(1.0, before + delta))
+        row["mastery_score"] = after
+        row["mastery_tier"] = get_mastery_tier(after)
+        row["times_studied"] = (row.get("times_studied") or 0) + 1
+        pending[row["id"]] = {
+            "id": row["id"],
+            "user_id": user_id,
+            "concept_name": row["concept_name"],
+            "concept_key": row["concept_key"],
+            "mastery_score": after,
+            "mastery_tier": row["mastery_tier"],
+            "times_studied": row["times_studied"],
+            "last_studied_at": studied_at,
+        }
+        changed_nodes[row["id"]] = row.get("subject")
+        mastery_changes.append({"concept": name, "before": before, "after": after})
+        subj = row.get("subject", "")
+        if subj and subj != "General":
+            touched_subjects.add(subj)
+    if pending:
+        table("graph_nodes").upsert(list(pending.values()), on_conflict="id")
+
+    # ── 4. Upsert new edges; existing (source, target) pairs are left as-is ───
+    edges: dict = {}
+    for new_edge in new_edges:
+        src = by_key.get(key_of[new_edge.get("source", "")])
+        tgt = by_key.get(key_of[new_edge.get("target", "")])
+        if src and tgt and (src["id"], tgt["id"]) not in edges:
+            edges[(src["id"], tgt["id"])] = {
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "source_node_id": src["id"],
+                "target_node_id": tgt["id"],
+                "strength": float(new_edge.get("strength", 0.5)),
+            }
+    if edges:
+        created = table("graph_edges").upsert(
+            list(edges.values()),
+            on_conflict="source_node_id,target_node_id",
+            ignore_duplicates=True,
         )
-        if src_rows and tgt_rows:
-            src_id = src_rows[0]["id"]
-            tgt_id = tgt_rows[0]["id"]
-            existing_edge = table("graph_edges").select(
-                "id",
-                filters={
-                    "user_id": f"eq.{user_id}",
-                    "source_node_id": f"eq.{src_id}",
-                    "target_node_id": f"eq.{tgt_id}",
-                },
-            )
-            if not existing_edge:
-                table("graph_edges").insert({
-                    "id": str(uuid.uuid4()),
-                    "user_id": user_id,
-                    "source_node_id": src_id,
-                    "target_node_id": tgt_id,
-                    "strength": strength,
-                })
+        new_edge_ids = [e["id"] for e in created or []]
+
+    graph_changes.record(user_id, nodes=changed_nodes.items(), edges=new_edge_ids)
+    subject_stats.apply(user_id, subject_stats.deltas(
+        stats_before.values(),
+        [row for row in by_key.values() if row["id"] in changed_nodes],
+    ))
 
     # Refresh shared course context for every subject touched in this update
     if touched_subjects:
@@ -267,24 +566,32 @@ def apply_graph_update(user_id: str, graph_update: dict) -> list:
     return mastery_changes
 
 
-def get_recommendations(user_id: str) -> list:
-    rows = table("graph_nodes").select(
-        "concept_name,mastery_score,mastery_tier",
-        filters={
-            "user_id": f"eq.{user_id}",
-            "mastery_tier": "in.(struggling,learning,unexplored)",
-        },
-        order="mastery_score.asc",
-        limit=5,
-    )
-    recs = []
-    for r in rows:
-        tier = r["mastery_tier"]
-        if tier == "unexplored":
-            reason = "You haven't studied this yet — a great place to start."
-        elif tier == "struggling":
-            reason = f"You're struggling here ({int(r['mastery_score']*100)}%) — focus here to improve."
-        else:
-            reason = f"You're making progress ({int(r['mastery_score']*100)}%) — keep going!"
-        recs.append({"concept_name": r["concept_name"], "reason": reason})
-    return recs
+async def apply_graph_update_async(user_id: str, graph_update: dict) -> list:
+    """
+    Async entry point for apply_graph_update. The write pipeline stays on the
+    sync client and runs in a worker thread so the event loop keeps serving.
+    """
+    return await asyncio.to_thread(apply_graph_update, user_id, graph_update)
+
+
+def get_knowledge_graph(user_id: str) -> KnowledgeGraph:
+    """The user's graph as a KnowledgeGraph, built once per graph version."""
+    kg = graph_cache.get_derived(user_id, "knowledge_graph")
+    if kg is None:
+        version = graph_cache.version(user_id)
+        kg = KnowledgeGraph.from_graph(user_id, get_graph(user_id))
+        graph_cache.put_derived(user_id, version, "knowledge_graph", kg)
+    return kg
+
+
+def get_recommendations(user_id: str, limit: int = 5) -> list:
+    """
+    Top concepts to study next (see recommendation_service). The ranking is
+    computed once per graph version and kept on the user's graph snapshot.
+    """
+    ranked = graph_cache.get_derived(user_id, "recommendations")
+    if ranked is None:
+        version = graph_cache.version(user_id)
+        ranked = recommendations.rank(get_knowledge_graph(user_id))
+        graph_cache.put_derived(user_id, version, "recommendations", ranked)
+    return [dict(r) for r in ranked[:limit]]
@@ -0,0 +1,217 @@
+"""
+knowledge_graph_service.py
+--------------------------
+Array-backed view of one user's knowledge graph for traversal and aggregates.
+
+KnowledgeGraph keeps node columns as NumPy arrays (mastery scores, tier codes,
+subject codes, times studied), concept names and subjects interned with O(1)
+lookup by id and by name, and edges in CSR form in both directions
+(indptr/indices/weights sorted by source, and the reverse by target). Tier
+counts and per-subject sums are single bincount calls; neighbour queries are
+slices; subgraph and shortest-path queries never touch the row dicts.
+
+    kg = KnowledgeGraph.from_rows(user_id, node_rows, edge_rows)   # DB rows
+    kg = KnowledgeGraph.from_graph(user_id, get_graph(user_id))    # API payload
+    i = kg.lookup("Recursion")
+    kg.names[j] for j in kg.successors(i)
+
+graph_service builds get_graph's stats and subject roots from it and caches
+one per graph version (graph_service.get_knowledge_graph); the recommendation
+and matching services take it as input.
+"""
+
+import sys
+from collections import deque
+from typing import Iterable, Optional
+
+import numpy as np
+
+TIERS = ("unexplored", "struggling", "learning", "mastered")
+TIER_CODES = {t: i for i, t in enumerate(TIERS)}
+OTHER_TIER = len(TIERS)  # code for a missing or unknown mastery_tier
+GENERAL_SUBJECT = "General"
+
+
+def _csr(n: int, keys: np.ndarray, values: np.ndarray):
+    """Sort edges by `keys` (stable) and return (indptr, order, values[order])."""
+    order = np.argsort(keys, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.intp)
+    np.cumsum(np.bincount(keys, minlength=n), out=indptr[1:])
+    return indptr, order, values[order]
+
+
+class KnowledgeGraph:
+    __slots__ = (
+        "user_id", "ids", "names", "subject_names", "subjects", "scores", "tiers",
+        "times_studied", "last_studied_at", "rows", "edge_ids",
+        "indptr", "indices", "weights", "_out_edges",
+        "rev_indptr", "rev_indices", "rev_weights",
+        "_id_index", "_name_index",
+    )
+
+    def __init__(self, user_id: str, nodes: list, edges: list):
+        """`nodes` are graph_nodes rows; `edges` are (edge_id, source_id, target_id, strength)."""
+        self.user_id = user_id
+        self.rows = nodes
+        n = len(nodes)
+        self.ids = [r["id"] for r in nodes]
+        self.names = [sys.intern(r.get("concept_name") or "") for r in nodes]
+        self._id_index = {node_id: i for i, node_id in enumerate(self.ids)}
+        self._name_index: dict = {}
+        for i, name in enumerate(self.names):
+            # Last row wins for a name that appears twice (graphs from before
+            # concept keys), as in the name → node dicts matching used to build
+            self._name_index[name] = i
+
+        subject_codes: dict = {}
+        self.subject_names: list = []
+        subjects = np.empty(n, dtype=np.int32)
+        for i, r in enumerate(nodes):
+            subject = r.get("subject") or GENERAL_SUBJECT
+            code = subject_codes.get(subject)
+            if code is None:
+                code = subject_codes[subject] = len(self.subject_names)
+                self.subject_names.append(sys.intern(subject))
+            subjects[i] = code
+        self.subjects = subjects
+        self.scores = np.array([r.get("mastery_score") or 0.0 for r in nodes], dtype=np.float64)
+        self.tiers = np.array(
+            [TIER_CODES.get(r.get("mastery_tier"), OTHER_TIER) for r in nodes], dtype=np.int8
+        )
+        self.times_studied = np.array([r.get("times_studied") or 0 for r in nodes], dtype=np.int64)
+        self.last_studied_at = [r.get("last_studied_at") for r in nodes]
+
+        index = self._id_index
+        kept = [(eid, index[s], index[t], w or 0.0) for eid, s, t, w in edges
+                if s in index and t in index]
+        src = np.array([e[1] for e in kept], dtype=np.intp)
+        tgt = np.array([e[2] for e in kept], dtype=np.intp)
+        weight = np.array([e[3] for e in kept], dtype=np.float64)
+        self.edge_ids = [e[0] for e in kept]
+
+        self.indptr, self._out_edges, self.indices = _csr(n, src, tgt)
+        self.weights = weight[self._out_edges]
+        self.rev_indptr, rev_order, self.rev_indices = _csr(n, tgt, src)
+        self.rev_weights = weight[rev_order]
+
+    @classmethod
+    def from_rows(cls, user_id: str, nodes: list, edges: list) -> "KnowledgeGraph":
+        """Build from graph_nodes / graph_edges rows."""
+        return cls(user_id, nodes, [
+            (e["id"], e["source_node_id"], e["target_node_id"], e.get("strength")) for e in edges
+        ])
+
+    @classmethod
+    def from_graph(cls, user_id: str, graph: dict) -> "KnowledgeGraph":
+        """Build from a get_graph payload (subject roots and subject edges are skipped)."""
+        return cls(
+            user_id,
+            [n for n in graph["nodes"] if not n.get("is_subject_root")],
+            [(e["id"], e["source"], e["target"], e.get("strength")) for e in graph["edges"]
+             if not e["id"].startswith("subject_edge__")],
+        )
+
+    # ── lookups ──
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.indices)
+
+    def index_of(self, node_id: str) -> Optional[int]:
+        return self._id_index.get(node_id)
+
+    def lookup(self, concept_name: str) -> Optional[int]:
+        return self._name_index.get(concept_name)
+
+    def concept_names(self):
+        """Set-like view of the distinct concept names."""
+        return self._name_index.keys()
+
+    def tier(self, i: int) -> Optional[str]:
+        code = self.tiers[i]
+        return TIERS[code] if code != OTHER_TIER else None
+
+    def subject(self, i: int) -> str:
+        return self.subject_names[self.subjects[i]]
+
+    # ── adjacency ──
+
+    def successors(self, i: int) -> np.ndarray:
+        """Concepts that build on node i (edge targets)."""
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def predecessors(self, i: int) -> np.ndarray:
+        """Concepts node i builds on (edge sources)."""
+        return self.rev_indices[self.rev_indptr[i]:self.rev_indptr[i + 1]]
+
+    def neighbors(self, i: int) -> np.ndarray:
+        return np.union1d(self.successors(i), self.predecessors(i))
+
+    def edge_arrays(self):
+        """(source, target, weight) arrays, one entry per edge, sorted by source."""
+        src = np.repeat(np.arange(len(self), dtype=np.intp), np.diff(self.indptr))
+        return src, self.indices, self.weights
+
+    # ── aggregates ──
+
+    def tier_counts(self) -> dict:
+        counts = np.bincount(self.tiers, minlength=OTHER_TIER + 1)
+        return {t: int(counts[code]) for t, code in TIER_CODES.items()}
+
+    def subject_members(self) -> list:
+        """Node indices per subject code, in row order (subjects in order of first appearance)."""
+        if not self.subject_names:
+            return []
+        order = np.argsort(self.subjects, kind="stable")
+        bounds = np.cumsum(np.bincount(self.subjects, minlength=len(self.subject_names)))[:-1]
+        return np.split(order, bounds)
+
+    def subject_totals(self):
+        """Per subject code: (node count, mastery sum, times_studied sum) arrays."""
+        k = len(self.subject_names)
+        return (
+            np.bincount(self.subjects, minlength=k),
+            np.bincount(self.subjects, weights=self.scores, minlength=k),
+            np.bincount(self.subjects, weights=self.times_studied, minlength=k),
+        )
+
+    # ── queries ──
+
+    def subgraph(self, indices: Iterable[int]) -> "KnowledgeGraph":
+        """The induced subgraph on `indices` (a new KnowledgeGraph, rows in the given order)."""
+        keep = np.fromiter(indices, dtype=np.intp)
+        inside = np.zeros(len(self), dtype=bool)
+        inside[keep] = True
+        src, tgt, weight = self.edge_arrays()
+        mask = inside[src] & inside[tgt]
+        ids = self.ids
+        edge_ids = [self.edge_ids[k] for k in self._out_edges[mask]]
+        return KnowledgeGraph(
+            self.user_id,
+            [self.rows[i] for i in keep],
+            [(eid, ids[s], ids[t], w)
+             for eid, s, t, w in zip(edge_ids, src[mask], tgt[mask], weight[mask])],
+        )
+
+    def shortest_path(self, start: int, goal: int, directed: bool = True) -> Optional[list]:
+        """Fewest-edges path from start to goal as node indices, or None (BFS over CSR)."""
+        if start == goal:
+            return [start]
+        parent = np.full(len(self), -1, dtype=np.intp)
+        parent[start] = start
+        queue = deque([start])
+        while queue:
+            i = queue.popleft()
+            nxt = self.successors(i) if directed else self.neighbors(i)
+            fresh = nxt[parent[nxt] < 0]
+            parent[fresh] = i
+            if goal in fresh:
+                path = [goal]
+                while path[-1] != start:
+                    path.append(int(parent[path[-1]]))
+                return path[::-1]
+            queue.extend(fresh.tolist())
+        return None
@@ -0,0 +1,156 @@
+"""
+llm_cache_service.py
+--------------------
+Cache of Gemini responses for generations that are pure functions of their
+prompt: room summaries, syllabus parsing, quiz generation. Call sites opt in
+with call_gemini(..., cache=True); tutoring replies never do.
+
+Entries are keyed by a hash of (model, prompt, json_mode, temperature), with
+the prompt normalized so that trailing whitespace and line-ending differences
+don't cause misses. Two tiers:
+
+    memory  LRU of up to GEMINI_CACHE_MAXSIZE responses (0 disables)
+    disk    optional SQLite file at GEMINI_CACHE_DB, shared by worker processes
+            and kept across restarts; a disk hit is promoted to memory
+
+Both expire entries after GEMINI_CACHE_TTL seconds. Expired disk rows are
+never served and are deleted in bulk when the file is opened and every
+PRUNE_EVERY stores after that (an index on expires_at keeps that cheap). Disk
+I/O has its own lock, so a slow disk never blocks memory hits. Hit rates per
+tier are reported by stats() at GET /api/debug/llm-cache.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+MAXSIZE = int(os.getenv("GEMINI_CACHE_MAXSIZE", "256"))
+TTL = float(os.getenv("GEMINI_CACHE_TTL", "86400"))
+DB_PATH = os.getenv("GEMINI_CACHE_DB", "")
+PRUNE_EVERY = 100
+
+
+def cache_key(model: str, prompt: str, json_mode: bool, temperature: float) -> str:
+    normalized = "\n".join(line.rstrip() for line in prompt.strip().splitlines())
+    payload = json.dumps([model, normalized, json_mode, temperature])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, maxsize: int = MAXSIZE, ttl: float = TTL, db_path: str = DB_PATH):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()  # key → (expires_at, response)
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._puts_since_prune = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.pruned = 0
+        if db_path:
+            # Wall-clock expiry on disk: entries outlive this process
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache "
+                "(key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_expires_at ON llm_cache (expires_at)")
+            self._prune()
+
+    def _remember(self, key: str, response: str) -> None:
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _prune(self) -> None:
+        with self._db_lock:
+            deleted = self._db.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),)).rowcount
+        with self._lock:
+            self.pruned += deleted
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return entry[1]
+            self._entries.pop(key, None)
+            if self._db is None:
+                self.misses += 1
+                return None
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT response FROM llm_cache WHERE key = ? AND expires_at >= ?",
+                (key, time.time()),
+            ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self._remember(key, row[0])
+            self.disk_hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        with self._lock:
+            self._remember(key, response)
+            self.stores += 1
+            if self._db is None:
+                return
+            self._puts_since_prune += 1
+            prune = self._puts_since_prune >= PRUNE_EVERY
+            if prune:
+                self._puts_since_prune = 0
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, expires_at) VALUES (?, ?, ?)",
+                (key, response, time.time() + self.ttl),
+            )
+        if prune:
+            self._prune()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "pruned": self.pruned,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "disk": self._db is not None,
+            }
+
+
+_cache = ResponseCache()
+
+get = _cache.get
+put = _cache.put
+clear = _cache.clear
+stats = _cache.stats
@@ -1,6 +1,10 @@
 from __future__ import annotations
 from typing import Any
 
+import numpy as np
+
+from services.knowledge_graph_service import GENERAL_SUBJECT, KnowledgeGraph
+
 
 def find_study_matches(
     user_id: str,
@@ -17,29 +21,28 @@ def find_study_matches(
         shared_struggles: [{ concept, your_mastery, their_mastery }],
     }
     Mastery values are 0.0–1.0 (the frontend multiplies by 100 for display).
+    Each member's "graph" is a KnowledgeGraph (graph_service.get_knowledge_graph)
+    or a get_graph payload.
     """
 
     me = next((m for m in members_with_graphs if m["user_id"] == user_id), None)
     if me is None:
         return []
 
+    def knowledge_graph(member: dict) -> KnowledgeGraph:
+        graph = member["graph"]
+        if isinstance(graph, KnowledgeGraph):
+            return graph
+        return KnowledgeGraph.from_graph(member["user_id"], graph)
+
     # Normalize mastery scores to 0.0–1.0 regardless of whether DB stores 0–100 or 0–1
-    def normalize(score: float) -> float:
-        if score is None:
-            return 0.0
-        return score / 100.0 if score > 1.0 else float(score)
-
-    def node_map(member: dict) -> dict[str, dict]:
-        return {
-            n["concept_name"]: n
-            for n in member["graph"]["nodes"]
-            if not n.get("is_subject_root") and n.get("mastery_tier") != "subject_root"
-        }
-
-    my_nodes = node_map(me)
-    my_subjects: set[str] = {
-        n["subject"] for n in me["graph"]["nodes"] if n.get("subject") and not n.get("is_subject_root")
-    }
+    def normalized_scores(kg: KnowledgeGraph) -> np.ndarray:
+        return np.where(kg.scores > 1.0, kg.scores / 100.0, kg.scores)
+
+    my_kg = knowledge_graph(me)
+    my_scores = normalized_scores(my_kg)
+    # Nodes without a subject are grouped under "General", which is no course
+    my_subjects: set[str] = set(my_kg.subject_names) - {GENERAL_SUBJECT}
 
     results = []
 
@@ -47,40 +50,34 @@ def find_study_matches(
         if member["user_id"] == user_id:
             continue
 
-        their_nodes = node_map(member)
-        their_subjects: set[str] = {
-            n["subject"] for n in member["graph"]["nodes"] if n.get("subject") and not n.get("is_subject_root")
-        }
+        their_kg = knowledge_graph(member)
+        their_scores = normalized_scores(their_kg)
+        their_subjects: set[str] = set(their_kg.subject_names) - {GENERAL_SUBJECT}
 
         shared_subjects = sorted(my_subjects & their_subjects)
-        common_concepts = set(my_nodes) & set(their_nodes)
-
-        you_can_teach = []
-        they_can_teach = []
-        shared_struggles = []
-
-        for concept in common_concepts:
-            my_m = normalize(my_nodes[concept].get("mastery_score", 0))
-            their_m = normalize(their_nodes[concept].get("mastery_score", 0))
-
-            if my_m > 0.70 and their_m < 0.50:
-                you_can_teach.append({
-                    "concept": concept,
-                    "your_mastery": round(my_m, 2),
-                    "their_mastery": round(their_m, 2),
-                })
-            elif their_m > 0.70 and my_m < 0.50:
-                they_can_teach.append({
-                    "concept": concept,
-                    "their_mastery": round(their_m, 2),
-                    "your_mastery": round(my_m, 2),
-                })
-            elif my_m < 0.50 and their_m < 0.50:
-                shared_struggles.append({
-                    "concept": concept,
-                    "your_mastery": round(my_m, 2),
-                    "their_mastery": round(their_m, 2),
-                })
+        common_concepts = sorted(my_kg.concept_names() & their_kg.concept_names())
+
+        my_m = my_scores[[my_kg.lookup(c) for c in common_concepts]]
+        their_m = their_scores[[their_kg.lookup(c) for c in common_concepts]]
+        you_teach = (my_m > 0.70) & (their_m < 0.50)
+        they_teach = ~you_teach & (their_m > 0.70) & (my_m < 0.50)
+        both_struggle = ~you_teach & ~they_teach & (my_m < 0.50) & (their_m < 0.50)
+
+        you_can_teach = [
+            {"concept": common_concepts[k], "your_mastery": round(float(my_m[k]), 2),
+             "their_mastery": round(float(their_m[k]), 2)}
+            for k in np.flatnonzero(you_teach)
+        ]
+        they_can_teach = [
+            {"concept": common_concepts[k], "their_mastery": round(float(their_m[k]), 2),
+             "your_mastery": round(float(my_m[k]), 2)}
+            for k in np.flatnonzero(they_teach)
+        ]
+        shared_struggles = [
+            {"concept": common_concepts[k], "your_mastery": round(float(my_m[k]), 2),
+             "their_mastery": round(float(their_m[k]), 2)}
+            for k in np.flatnonzero(both_struggle)
+        ]
 
         # Sort by gap size descending
         you_can_teach.sort(key=lambda t: t["your_mastery"] - t["their_mastery"], reverse=True)
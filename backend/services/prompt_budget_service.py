@@ -0,0 +1,284 @@
+"""
+prompt_budget_service.py
+------------------------
+Token budgets for the sections of learn and quiz prompts.
+
+A PromptBudget is created per Gemini call and renders each variable section
+through its budget (PROMPT_BUDGET_<SECTION>, in estimated tokens):
+
+    graph     the student's knowledge graph
+    shared    the shared course-context block
+    history   the conversation so far
+    message   the student's message
+    preamble  the static system prompt (measured only; it is cached, see
+              prompt_cache_service)
+
+A section that fits is rendered as before. One that doesn't is shrunk in this
+order, stopping as soon as it fits:
+
+    1. graph:   compact JSON - one row per concept, no subject-root nodes or
+                synthetic subject edges, no ids
+    2. graph:   drop the least relevant concepts (relevance: the session topic
+                and its neighbours, the session's course, struggling/learning
+                tiers, how much and how recently it was studied)
+    3. history: keep the last PROMPT_KEEP_TURNS messages verbatim and replace
+                older ones with a one-line extract each, dropping the oldest
+                extracts if needed
+
+Shared context and the message are cut to their budgets last. Tokens are
+estimated locally (estimate_tokens, ~4 characters per token) - no tokenizer
+round-trip. report() records the final size of every section; the most recent
+reports are served at GET /api/debug/prompts.
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import deque
+from datetime import datetime
+
+from services.concept_key_service import concept_key
+
+logger = logging.getLogger("sapling.prompts")
+
+CHARS_PER_TOKEN = 4
+BUDGETS = {
+    "preamble": int(os.getenv("PROMPT_BUDGET_PREAMBLE", "1500")),
+    "graph": int(os.getenv("PROMPT_BUDGET_GRAPH", "4000")),
+    "shared": int(os.getenv("PROMPT_BUDGET_SHARED", "800")),
+    "history": int(os.getenv("PROMPT_BUDGET_HISTORY", "4000")),
+    "message": int(os.getenv("PROMPT_BUDGET_MESSAGE", "1000")),
+}
+# Quiz generation only needs the quizzed concept's neighbourhood
+QUIZ_GRAPH_BUDGET = int(os.getenv("PROMPT_BUDGET_QUIZ_GRAPH", "800"))
+KEEP_TURNS = int(os.getenv("PROMPT_KEEP_TURNS", "6"))
+RECENT_REPORTS = int(os.getenv("PROMPT_RECENT_REPORTS", "50"))
+
+_TIER_WEIGHT = {"struggling": 3, "learning": 2.5, "unexplored": 1, "mastered": 0.5}
+_EXTRACT_CHARS = 160
+
+_recent: deque = deque(maxlen=RECENT_REPORTS)
+_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def _truncate(text: str, tokens: int) -> str:
+    """Keep the head and tail of `text` within `tokens`, marking the cut."""
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    marker = " […] "
+    keep = max(limit - len(marker), 0)
+    return text[: keep - keep // 3] + marker + text[len(text) - keep // 3:]
+
+
+def _extract(content: str) -> str:
+    """First sentence of a message, capped - the 'summary' of an old turn."""
+    first = re.split(r"(?<=[.!?])\s", " ".join(content.split()), maxsplit=1)[0]
+    return first if len(first) <= _EXTRACT_CHARS else first[: _EXTRACT_CHARS - 1] + "…"
+
+
+class PromptBudget:
+    def __init__(self, label: str, **budgets):
+        self.label = label
+        self.budgets = {**BUDGETS, **budgets}
+        self.sections: dict = {}
+
+    def _record(self, name: str, text: str, steps: list) -> str:
+        self.sections[name] = {
+            "tokens": estimate_tokens(text),
+            "budget": self.budgets.get(name),
+            "steps": steps,
+        }
+        return text
+
+    def measure(self, name: str, text: str) -> str:
+        """Record a section that is never shrunk."""
+        return self._record(name, text, [])
+
+    # ── graph ──
+
+    def graph(self, graph: dict, focus: tuple = (), course: str = "") -> str:
+        """
+        The knowledge graph as prompt text. `focus` holds concept names or
+        subjects the call is about (the session topic, the quizzed concept);
+        they and their neighbours are dropped last.
+        """
+        budget = self.budgets["graph"]
+        text = json.dumps(graph, indent=2)
+        if estimate_tokens(text) <= budget:
+            return self._record("graph", text, [])
+
+        steps = ["compact"]
+        nodes = [n for n in graph.get("nodes", []) if not n.get("is_subject_root")]
+        by_id = {n["id"]: n for n in nodes}
+        edges = [e for e in graph.get("edges", []) if e["source"] in by_id and e["target"] in by_id]
+        ranked = self._rank(nodes, edges, focus, course)
+
+        def render(kept: list) -> str:
+            kept_ids = {n["id"] for n in kept}
+            payload = {
+                "stats": graph.get("stats", {}),
+                "columns": ["concept", "subject", "mastery", "tier", "times_studied"],
+                "concepts": [
+                    [n["concept_name"], n.get("subject") or "General",
+                     round(n.get("mastery_score") or 0, 2), n.get("mastery_tier"),
+                     n.get("times_studied") or 0]
+                    for n in kept
+                ],
+                "edges": [
+                    [by_id[e["source"]]["concept_name"], by_id[e["target"]]["concept_name"]]
+                    for e in edges if e["source"] in kept_ids and e["target"] in kept_ids
+                ],
+            }
+            if len(kept) < len(nodes):
+                payload["omitted_concepts"] = len(nodes) - len(kept)
+            return _dumps(payload)
+
+        text = render(ranked)
+        if estimate_tokens(text) > budget:
+            # Largest prefix of the ranking that fits; rendering is linear, so bisect
+            lo, hi = 0, len(ranked)
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if estimate_tokens(render(ranked[:mid])) <= budget:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            text = render(ranked[:lo])
+            steps.append(f"dropped {len(ranked) - lo} of {len(ranked)} concepts")
+        return self._record("graph", text, steps)
+
+    @staticmethod
+    def _rank(nodes: list, edges: list, focus: tuple, course: str) -> list:
+        focus_keys = {concept_key(f) for f in focus if f}
+        focus_subjects = {f for f in focus if f} | ({course} if course else set())
+        focus_ids = {
+            n["id"] for n in nodes
+            if (n.get("concept_key") or concept_key(n["concept_name"])) in focus_keys
+        }
+        neighbours = set()
+        for e in edges:
+            if e["source"] in focus_ids:
+                neighbours.add(e["target"])
+            if e["target"] in focus_ids:
+                neighbours.add(e["source"])
+
+        def relevance(n: dict) -> tuple:
+            score = _TIER_WEIGHT.get(n.get("mastery_tier"), 1)
+            score += min(n.get("times_studied") or 0, 10) * 0.2
+            if n.get("subject") in focus_subjects:
+                score += 5
+            if n["id"] in neighbours:
+                score += 10
+            if n["id"] in focus_ids:
+                score += 100
+            return score, n.get("last_studied_at") or ""
+
+        return sorted(nodes, key=relevance, reverse=True)
+
+    # ── shared course context ──
+
+    def shared(self, ctx: dict) -> str:
+        budget = self.budgets["shared"]
+        text = json.dumps(ctx, indent=2)
+        if estimate_tokens(text) <= budget:
+            return self._record("shared", text, [])
+        steps = ["compact"]
+        text = _dumps(ctx)
+        trimmed = dict(ctx)
+        while estimate_tokens(text) > budget:
+            longest = max(
+                (k for k, v in trimmed.items() if isinstance(v, list) and v),
+                key=lambda k: len(trimmed[k]), default=None,
+            )
+            if longest is None:
+                text = _truncate(text, budget)
+                steps.append("truncated")
+                break
+            trimmed[longest] = trimmed[longest][: len(trimmed[longest]) // 2]
+            text = _dumps(trimmed)
+        else:
+            if trimmed != ctx:
+                steps.append("trimmed lists")
+        return self._record("shared", text, steps)
+
+    # ── conversation ──
+
+    def history(self, history: list) -> str:
+        budget = self.budgets["history"]
+        lines = [
+            f"{'Student' if m['role'] == 'user' else 'Sapling'}: {m['content']}"
+            for m in history
+        ]
+        text = "\n\n".join(lines)
+        if estimate_tokens(text) <= budget:
+            return self._record("history", text, [])
+
+        keep = min(KEEP_TURNS, len(lines))
+        recent = lines[len(lines) - keep:]
+        # The latest turns always stay verbatim, but never more than the whole budget
+        while keep > 1 and estimate_tokens("\n\n".join(recent)) > budget:
+            keep -= 1
+            recent = lines[len(lines) - keep:]
+        recent_text = _truncate("\n\n".join(recent), budget)
+        older = [
+            f"- {'Student' if m['role'] == 'user' else 'Sapling'}: {_extract(m['content'])}"
+            for m in history[: len(history) - keep]
+        ]
+        steps = [f"summarized {len(older)} older messages"]
+        remaining = budget - estimate_tokens(recent_text)
+        dropped = 0
+        while older and estimate_tokens("\n".join(older)) + 20 > remaining:
+            older.pop(0)
+            dropped += 1
+        if dropped:
+            steps.append(f"omitted {dropped} oldest messages")
+        parts = []
+        if older or dropped:
+            header = "EARLIER IN THIS SESSION (one line per message"
+            header += f", {dropped} earliest omitted):" if dropped else "):"
+            parts.append("\n".join([header, *older]))
+        parts.append(recent_text)
+        return self._record("history", "\n\n".join(parts), steps)
+
+    def message(self, text: str) -> str:
+        budget = self.budgets["message"]
+        if estimate_tokens(text) <= budget:
+            return self._record("message", text, [])
+        return self._record("message", _truncate(text, budget), ["truncated"])
+
+    # ── reporting ──
+
+    def report(self, prompt: str, system_prefix: str = "") -> dict:
+        """Record the final prompt size (and each section's) for this call."""
+        if system_prefix:
+            self.measure("preamble", system_prefix)
+        total = estimate_tokens(system_prefix) + estimate_tokens(prompt)
+        entry = {
+            "label": self.label,
+            "at": datetime.utcnow().isoformat(),
+            "total_tokens": total,
+            "sections": self.sections,
+        }
+        shrunk = [name for name, s in self.sections.items() if s["steps"]]
+        if shrunk:
+            logger.info("%s prompt: %d tokens, shrunk %s", self.label, total, ", ".join(shrunk))
+        with _lock:
+            _recent.append(entry)
+        return entry
+
+
+def recent_reports() -> list:
+    with _lock:
+        return list(reversed(_recent))
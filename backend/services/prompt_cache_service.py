@@ -0,0 +1,183 @@
+"""
+prompt_cache_service.py
+-----------------------
+Server-side caching of the static system-prompt prefix of learn calls.
+
+Every tutoring turn starts with the same text for its mode (preamble rules +
+socratic/expository/teachback prompt); only the student context and the
+conversation after it change. get() returns the name of a cached content
+holding that prefix, created on first use and re-created GEMINI_PROMPT_CACHE_TTL
+seconds later (a minute early, so in-flight calls never hit an expired cache).
+Gemini then bills the prefix at the cached rate and skips re-reading it.
+
+Caches are made by a backend with an async create(prefix, ttl, label) -> name:
+gemini_service installs one over client.aio.caches at import (admitted by the
+Gemini rate limiter like any other call), and tests use LocalCacheBackend, an
+in-process stand-in. Concurrent first requests for a prefix share one create.
+If creation fails (e.g. caching disabled for the key) get() returns None for
+the next few minutes and callers send the prefix inline as the system
+instruction.
+
+Gemini refuses to cache contents below a per-model minimum (1024 tokens for
+gemini-2.5-flash), so a prefix estimated below GEMINI_PROMPT_CACHE_MIN_TOKENS
+is sent inline without trying: a create that is bound to fail would still
+spend a rate-limiter token and log a warning every few minutes per mode.
+
+GEMINI_PROMPT_CACHE=0 disables caching. Counters are reported by stats() at
+GET /api/debug/prompt-cache.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+from services.prompt_budget_service import estimate_tokens
+
+logger = logging.getLogger("sapling.prompts")
+
+ENABLED = os.getenv("GEMINI_PROMPT_CACHE", "1") == "1"
+TTL = float(os.getenv("GEMINI_PROMPT_CACHE_TTL", "3600"))
+MIN_TOKENS = int(os.getenv("GEMINI_PROMPT_CACHE_MIN_TOKENS", "1024"))
+_REFRESH_MARGIN = 60.0
+_RETRY_AFTER = 300.0
+
+
+class LocalCacheBackend:
+    """In-process stand-in for tests: hands out names and remembers the prefixes."""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self.contents: dict = {}  # name → prefix
+
+    async def create(self, prefix: str, ttl: float, label: str) -> str:
+        name = f"cachedContents/local-{label}-{next(self._ids)}"
+        self.contents[name] = prefix
+        return name
+
+
+class PrefixCache:
+    def __init__(self, backend=None, ttl: float = TTL, enabled: bool = ENABLED,
+                 min_tokens: int = MIN_TOKENS, clock=time.monotonic):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+        self.min_tokens = min_tokens
+        self._clock = clock
+        # sha256(prefix) → (label, cached content name or None after a failure, refresh_at)
+        self._entries: dict = {}
+        # sha256(prefix) → future of the create in flight for it
+        self._creating: dict = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.joined = 0
+        self.created = 0
+        self.refreshed = 0
+        self.failures = 0
+        self.inline = 0
+        self.too_small = 0
+
+    async def get(self, prefix: str, label: str) -> Optional[str]:
+        """Name of a live cached content holding `prefix`, or None to send it inline."""
+        if not self.enabled or self.backend is None:
+            return None
+        if estimate_tokens(prefix) < self.min_tokens:
+            with self._lock:
+                self.too_small += 1
+            return None
+        key = hashlib.sha256(prefix.encode()).hexdigest()
+        now = self._clock()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > now:
+                if entry[1] is None:
+                    self.inline += 1
+                else:
+                    self.hits += 1
+                return entry[1]
+            pending = self._creating.get(key)
+            if pending is not None and pending.get_loop() is loop:
+                self.joined += 1
+            else:
+                pending = None
+                future = self._creating[key] = loop.create_future()
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        name = None
+        try:
+            name = await self._create(key, prefix, label, entry, now)
+            return name
+        finally:
+            with self._lock:
+                if self._creating.get(key) is future:
+                    del self._creating[key]
+            future.set_result(name)
+
+    async def _create(self, key: str, prefix: str, label: str, entry, now: float) -> Optional[str]:
+        try:
+            name = await self.backend.create(prefix, self.ttl, label)
+        except Exception as e:
+            logger.warning("Prompt cache for %r unavailable, sending inline: %s", label, e)
+            with self._lock:
+                self._entries[key] = (label, None, now + _RETRY_AFTER)
+                self.failures += 1
+                self.inline += 1
+            return None
+        with self._lock:
+            self._entries[key] = (label, name, now + max(self.ttl - _REFRESH_MARGIN, 0))
+            if entry is None:
+                self.created += 1
+            else:
+                self.refreshed += 1
+        return name
+
+    def invalidate(self, prefix: str) -> None:
+        """Forget the cache for `prefix` (e.g. Gemini no longer knows its name)."""
+        with self._lock:
+            self._entries.pop(hashlib.sha256(prefix.encode()).hexdigest(), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        now = self._clock()
+        with self._lock:
+            return {
+                "enabled": self.enabled and self.backend is not None,
+                "backend": type(self.backend).__name__ if self.backend else None,
+                "hits": self.hits,
+                "joined": self.joined,
+                "created": self.created,
+                "refreshed": self.refreshed,
+                "failures": self.failures,
+                "inline": self.inline,
+                "too_small": self.too_small,
+                "min_tokens": self.min_tokens,
+                "ttl": self.ttl,
+                "prefixes": [
+                    {"label": label, "cached": name is not None,
+                     "refresh_in": round(max(refresh_at - now, 0), 1)}
+                    for label, name, refresh_at in self._entries.values()
+                ],
+            }
+
+
+_cache = PrefixCache()
+
+
+def set_backend(backend) -> None:
+    _cache.backend = backend
+    _cache.clear()
+
+
+get = _cache.get
+invalidate = _cache.invalidate
+clear = _cache.clear
+stats = _cache.stats
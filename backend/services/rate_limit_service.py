@@ -0,0 +1,184 @@
+"""
+rate_limit_service.py
+---------------------
+Process-wide admission control in front of the Gemini client.
+
+Every Gemini request (sync or async, including each retry) first takes a
+token from one shared token bucket: GEMINI_RPM tokens per minute, up to
+GEMINI_BURST at once. Callers that find the bucket empty wait in a single
+admission queue ordered by priority class, then arrival:
+
+    CHAT        a student is waiting on a tutor reply (learn routes)
+    QUIZ        user-initiated generations (quiz questions, syllabus parsing)
+    BACKGROUND  work nobody is watching (quiz-context updates, room summaries)
+
+so a burst of background calls never delays a chat turn by more than one
+token interval. A 429 from Gemini empties the bucket (penalize()), which slows
+every caller instead of letting each one discover the limit on its own, and
+retries back off exponentially with full jitter (backoff_delay()).
+
+stats() reports queue depth and wait times per class for GET /api/debug/gemini.
+"""
+
+import asyncio
+import itertools
+import os
+import random
+import threading
+import time
+
+CHAT = 0
+QUIZ = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {CHAT: "chat", QUIZ: "quiz", BACKGROUND: "background"}
+
+RPM = float(os.getenv("GEMINI_RPM", "60"))
+BURST = float(os.getenv("GEMINI_BURST", "10"))
+QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "60"))
+# Default retries per call; 1 as before the limiter, raise it per call or here
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "1"))
+BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "1"))
+BACKOFF_CAP = float(os.getenv("GEMINI_BACKOFF_CAP", "20"))
+
+
+class GeminiBusyError(RuntimeError):
+    """Raised when a request waited longer than its queue timeout for admission."""
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for retry number `attempt` (0-based)."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+class RateLimiter:
+    """Token bucket with a priority admission queue, shared by threads and event loops."""
+
+    def __init__(self, rpm: float = RPM, burst: float = BURST, clock=time.monotonic):
+        self.rate = rpm / 60.0
+        self.burst = max(1.0, burst)
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._tokens = self.burst
+        self._refilled_at = clock()
+        self._seq = itertools.count()
+        self._waiting: list = []  # (priority, seq) tickets, kept sorted
+        self._stats = {
+            p: {"admitted": 0, "timeouts": 0, "cancelled": 0, "wait_total": 0.0, "wait_max": 0.0}
+            for p in PRIORITY_NAMES
+        }
+        self.penalties = 0
+
+    # ── bucket ──
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _try_admit(self, ticket: tuple) -> float:
+        """Admit `ticket` (returns 0.0) or return how long to wait before asking again."""
+        self._refill()
+        if self._waiting[0] == ticket and self._tokens >= 1:
+            self._tokens -= 1
+            self._waiting.pop(0)
+            self._cond.notify_all()  # the next ticket is now at the head
+            return 0.0
+        return max((1 - self._tokens) / self.rate, 0.005) if self.rate > 0 else 0.1
+
+    def _enqueue(self, priority: int) -> tuple:
+        ticket = (priority, next(self._seq))
+        self._waiting.append(ticket)
+        self._waiting.sort()
+        return ticket
+
+    def _leave(self, ticket: tuple, priority: int, waited: float, outcome: str) -> None:
+        """Count how `ticket` left the queue: admitted, timeouts or cancelled."""
+        stats = self._stats[priority]
+        stats[outcome] += 1
+        if outcome == "admitted":
+            stats["wait_total"] += waited
+            stats["wait_max"] = max(stats["wait_max"], waited)
+            return
+        if ticket in self._waiting:
+            self._waiting.remove(ticket)
+            self._cond.notify_all()
+
+    # ── admission ──
+
+    def acquire(self, priority: int = QUIZ, timeout: float = QUEUE_TIMEOUT) -> float:
+        """Block the calling thread until admitted; returns the seconds waited."""
+        started = self._clock()
+        with self._cond:
+            ticket = self._enqueue(priority)
+            outcome = "cancelled"
+            try:
+                while True:
+                    delay = self._try_admit(ticket)
+                    if delay == 0.0:
+                        outcome = "admitted"
+                        return self._clock() - started
+                    remaining = timeout - (self._clock() - started)
+                    if remaining <= 0:
+                        outcome = "timeouts"
+                        raise GeminiBusyError(
+                            f"Gemini admission queue timed out after {timeout:.0f}s"
+                        )
+                    self._cond.wait(min(delay, remaining))
+            finally:
+                self._leave(ticket, priority, self._clock() - started, outcome)
+
+    async def acquire_async(self, priority: int = QUIZ, timeout: float = QUEUE_TIMEOUT) -> float:
+        """acquire() for coroutines: waits with asyncio.sleep instead of blocking the loop."""
+        started = self._clock()
+        with self._cond:
+            ticket = self._enqueue(priority)
+        outcome = "cancelled"  # unless admitted or timed out, e.g. the request was cancelled
+        try:
+            while True:
+                with self._cond:
+                    delay = self._try_admit(ticket)
+                if delay == 0.0:
+                    outcome = "admitted"
+                    return self._clock() - started
+                remaining = timeout - (self._clock() - started)
+                if remaining <= 0:
+                    outcome = "timeouts"
+                    raise GeminiBusyError(f"Gemini admission queue timed out after {timeout:.0f}s")
+                await asyncio.sleep(min(delay, remaining))
+        finally:
+            with self._cond:
+                self._leave(ticket, priority, self._clock() - started, outcome)
+
+    def penalize(self) -> None:
+        """Gemini answered 429: empty the bucket so every caller slows down."""
+        with self._cond:
+            self._refill()
+            self._tokens = 0.0
+            self.penalties += 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            self._refill()
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _ in self._waiting:
+                depth[PRIORITY_NAMES[priority]] += 1
+            return {
+                "rpm": self.rate * 60,
+                "burst": self.burst,
+                "tokens": round(self._tokens, 2),
+                "queue_depth": depth,
+                "penalties": self.penalties,
+                "classes": {
+                    PRIORITY_NAMES[p]: {
+                        "admitted": s["admitted"],
+                        "timeouts": s["timeouts"],
+                        "cancelled": s["cancelled"],
+                        "avg_wait": round(s["wait_total"] / s["admitted"], 4) if s["admitted"] else 0.0,
+                        "max_wait": round(s["wait_max"], 4),
+                    }
+                    for p, s in self._stats.items()
+                },
+            }
+
+
+limiter = RateLimiter()
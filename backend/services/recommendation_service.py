@@ -0,0 +1,154 @@
+"""
+recommendation_service.py
+-------------------------
+Ranks what a student should study next from their knowledge graph.
+
+Edges are read as prerequisites: source → target means the target builds on
+the source. Each concept in a RECOMMENDABLE_TIERS tier (struggling, learning
+or unexplored - never mastered, nor a node without a known tier) gets
+
+    score = (READY_FLOOR + (1 - READY_FLOOR) * readiness)
+            * (W_NEED * (1 - mastery) + W_CENTRALITY * centrality + W_STALENESS * staleness)
+
+readiness   strength-weighted mean mastery of its prerequisites (1.0 with none),
+            so concepts whose prerequisites are still unexplored sink;
+centrality  PageRank over the reversed, strength-weighted edges, scaled to
+            [0, 1]: concepts many others build on rank higher;
+staleness   1 - 0.5 ** (days since last_studied_at / STALENESS_HALF_LIFE_DAYS),
+            1.0 if never studied.
+
+Everything runs on the KnowledgeGraph arrays (bincount for the sparse
+products), so a few thousand nodes rank in milliseconds. graph_service caches
+the ranking on the user's graph snapshot, so /recommendations only recomputes
+after the graph changes.
+"""
+
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+
+from services.knowledge_graph_service import TIER_CODES, KnowledgeGraph
+
+W_NEED = 0.45
+W_CENTRALITY = 0.35
+W_STALENESS = 0.20
+READY_FLOOR = 0.05
+STALENESS_HALF_LIFE_DAYS = 7.0
+
+PAGERANK_DAMPING = 0.85
+PAGERANK_TOL = 1e-8
+PAGERANK_MAX_ITER = 100
+
+# How many ranked concepts are kept per graph version
+MAX_RANKED = 50
+
+# Only these tiers are recommended; everything else just shapes the graph
+RECOMMENDABLE_TIERS = ("struggling", "learning", "unexplored")
+
+
+def pagerank(n: int, src: np.ndarray, tgt: np.ndarray, weight: np.ndarray) -> np.ndarray:
+    """Weighted PageRank by power iteration; rank flows src → tgt."""
+    if n == 0:
+        return np.zeros(0)
+    out_weight = np.bincount(src, weights=weight, minlength=n)
+    dangling = out_weight == 0
+    # Share of each edge in its source's outgoing weight
+    share = np.divide(
+        weight, out_weight[src], out=np.zeros_like(weight), where=out_weight[src] > 0
+    )
+    rank = np.full(n, 1.0 / n)
+    for _ in range(PAGERANK_MAX_ITER):
+        inflow = np.bincount(tgt, weights=rank[src] * share, minlength=n)
+        new = (1 - PAGERANK_DAMPING) / n + PAGERANK_DAMPING * (inflow + rank[dangling].sum() / n)
+        done = np.abs(new - rank).sum() < PAGERANK_TOL
+        rank = new
+        if done:
+            break
+    return rank
+
+
+def _days_since(timestamps: list, now: datetime) -> np.ndarray:
+    days = np.full(len(timestamps), np.nan)
+    for i, ts in enumerate(timestamps):
+        if not ts:
+            continue
+        try:
+            t = datetime.fromisoformat(ts)
+        except (TypeError, ValueError):
+            continue
+        if t.tzinfo is None:
+            t = t.replace(tzinfo=timezone.utc)
+        days[i] = max(0.0, (now - t).total_seconds() / 86400)
+    return days
+
+
+def _reason(tier: str, mastery: float, readiness: float, has_prereqs: bool,
+            central: bool, days: float) -> str:
+    if tier == "unexplored":
+        reason = "You haven't studied this yet — a great place to start."
+    elif tier == "struggling":
+        reason = f"You're struggling here ({int(mastery * 100)}%) — focus here to improve."
+    else:
+        reason = f"You're making progress ({int(mastery * 100)}%) — keep going!"
+    if has_prereqs and readiness >= 0.75:
+        reason += " You've got the prerequisites down."
+    if central:
+        reason += " Many other concepts build on it."
+    if not np.isnan(days) and days >= STALENESS_HALF_LIFE_DAYS:
+        reason += f" Last studied {int(days)} days ago."
+    return reason
+
+
+def rank(kg: KnowledgeGraph, now: Optional[datetime] = None, limit: int = MAX_RANKED) -> list:
+    """
+    Score the recommendable concepts of a user's graph and return the top
+    `limit`, best first, as {id, concept_name, subject, score, reason}.
+    """
+    now = now or datetime.now(timezone.utc)
+    n = len(kg)
+    if n == 0:
+        return []
+    src, tgt, weight = kg.edge_arrays()
+    mastery = kg.scores
+    candidates = np.isin(kg.tiers, [TIER_CODES[t] for t in RECOMMENDABLE_TIERS])
+
+    prereq_weight = np.bincount(tgt, weights=weight, minlength=n)
+    prereq_mastery = np.bincount(tgt, weights=weight * mastery[src], minlength=n)
+    has_prereqs = prereq_weight > 0
+    readiness = np.divide(prereq_mastery, prereq_weight, out=np.ones(n), where=has_prereqs)
+
+    # Reverse the edges so rank flows from dependents to the concepts they build on
+    centrality = pagerank(n, tgt, src, weight)
+    centrality = centrality / centrality.max()
+
+    days = _days_since(kg.last_studied_at, now)
+    half_lives = np.nan_to_num(days) / STALENESS_HALF_LIFE_DAYS
+    staleness = np.where(np.isnan(days), 1.0, 1 - 0.5 ** half_lives)
+
+    score = (READY_FLOOR + (1 - READY_FLOOR) * readiness) * (
+        W_NEED * (1 - mastery) + W_CENTRALITY * centrality + W_STALENESS * staleness
+    )
+    score[~candidates] = -np.inf
+
+    k = min(limit, int(candidates.sum()))
+    if k == 0:
+        return []
+    top = np.argpartition(-score, k - 1)[:k]
+    # Ties (common on fresh graphs) go to the lower mastery, then the older node
+    top = top[np.lexsort((top, mastery[top], -score[top]))]
+    central_cut = np.quantile(centrality, 0.8) if n >= 5 else np.inf
+
+    return [
+        {
+            "id": kg.ids[i],
+            "concept_name": kg.names[i],
+            "subject": kg.subject(i),
+            "score": round(float(score[i]), 4),
+            "reason": _reason(
+                kg.tier(i), float(mastery[i]), float(readiness[i]),
+                bool(has_prereqs[i]), bool(centrality[i] > central_cut), float(days[i]),
+            ),
+        }
+        for i in top
+    ]
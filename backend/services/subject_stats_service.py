@@ -0,0 +1,163 @@
+"""
+subject_stats_service.py
+------------------------
+Materialized per-(user, subject) mastery summaries in the subject_stats table:
+node count, mastery sum, times_studied and a tier histogram.
+
+Writers never recompute a summary. They pass the rows they changed, as read
+before and as written, to apply(), which adds the difference in one atomic
+upsert (the apply_subject_stats_deltas SQL function):
+
+    before = dict(row)                      # as selected
+    row.update(mastery_score=..., mastery_tier=..., times_studied=...)
+    table("graph_nodes").update(...)
+    subject_stats.apply(user_id, subject_stats.deltas([before], [row]))
+
+Readers (user_tier_counts, courses_with_node_counts, GET
+/api/graph/{user_id}/subjects) then aggregate a handful of summary rows per
+user instead of every graph_nodes row. rebuild() recomputes one user's rows
+from their nodes if a summary is ever suspected of drifting.
+
+A delta that cannot be applied marks the user dirty (mark_dirty), and
+readers call repair() first, which rebuilds dirty users before their
+summaries are served. The dirty set lives in this process, like the graph
+snapshot cache.
+"""
+
+import logging
+import threading
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from db.connection import RpcNotFoundError, in_filter, rpc, table
+from services.knowledge_graph_service import GENERAL_SUBJECT, TIERS
+
+logger = logging.getLogger("sapling.db")
+
+COUNTERS = ("node_count", "mastery_sum", "times_studied", *TIERS)
+
+# Users whose stored summaries missed a delta; rebuilt by the next repair()
+_dirty: set = set()
+_dirty_lock = threading.Lock()
+
+
+def _add(totals: dict, row: dict, sign: int) -> None:
+    stats = totals[row.get("subject") or GENERAL_SUBJECT]
+    stats["node_count"] += sign
+    stats["mastery_sum"] += sign * (row.get("mastery_score") or 0.0)
+    stats["times_studied"] += sign * (row.get("times_studied") or 0)
+    if row.get("mastery_tier") in TIERS:
+        stats[row["mastery_tier"]] += sign
+
+
+def deltas(before: Iterable[dict], after: Iterable[dict]) -> list:
+    """
+    Per-subject differences between two states of the same nodes. `before`
+    holds the rows as they were (omit nodes that did not exist), `after` as
+    they are now (omit deleted nodes). Subjects that net to zero are dropped.
+    """
+    totals: dict = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    for row in before:
+        _add(totals, row, -1)
+    for row in after:
+        _add(totals, row, 1)
+    return [
+        {"subject": subject, **stats}
+        for subject, stats in totals.items()
+        if any(stats.values())
+    ]
+
+
+def apply(user_id: str, changes: list) -> None:
+    """
+    Add `changes` (from deltas()) to the user's summaries. Never raises, like
+    graph_changes.record: if the delta is lost the user is marked dirty and
+    the next read rebuilds their summaries.
+    """
+    if not changes:
+        return
+    try:
+        try:
+            rpc("apply_subject_stats_deltas", {"p_user_id": user_id, "p_deltas": changes},
+                writes=("subject_stats",))
+        except RpcNotFoundError:
+            _apply_per_table(user_id, changes)
+    except Exception as e:
+        logger.warning("subject_stats delta for %s lost, rebuilding on next read: %s", user_id, e)
+        mark_dirty(user_id)
+
+
+def mark_dirty(user_id: str) -> None:
+    with _dirty_lock:
+        _dirty.add(user_id)
+
+
+def repair(user_id: Optional[str] = None) -> None:
+    """
+    Rebuild the summaries of `user_id` (or, with no argument, of every user)
+    if they are marked dirty. A failed rebuild leaves the user dirty.
+    """
+    with _dirty_lock:
+        if user_id is None:
+            users = list(_dirty)
+            _dirty.clear()
+        elif user_id in _dirty:
+            users = [user_id]
+            _dirty.discard(user_id)
+        else:
+            return
+    for uid in users:
+        try:
+            rebuild(uid)
+        except Exception as e:
+            logger.warning("subject_stats rebuild for %s failed: %s", uid, e)
+            mark_dirty(uid)
+
+
+def _apply_per_table(user_id: str, changes: list) -> None:
+    """Fallback when the SQL function is not deployed: read, add, upsert (not atomic)."""
+    current = {
+        r["subject"]: r
+        for r in table("subject_stats").select(
+            ",".join(("subject", *COUNTERS)),
+            filters={"user_id": f"eq.{user_id}",
+                     "subject": in_filter([c["subject"] for c in changes])},
+        )
+    }
+    table("subject_stats").upsert(
+        [
+            {
+                "user_id": user_id,
+                "subject": c["subject"],
+                **{k: (current.get(c["subject"], {}).get(k) or 0) + c[k] for k in COUNTERS},
+            }
+            for c in changes
+        ],
+        on_conflict="user_id,subject",
+    )
+
+
+def get(user_id: str) -> list:
+    """The user's summaries, one per subject, with avg_mastery (0-100) added."""
+    repair(user_id)
+    rows = table("subject_stats").select(
+        ",".join(("subject", *COUNTERS, "updated_at")),
+        filters={"user_id": f"eq.{user_id}"},
+        order="subject.asc",
+    )
+    for r in rows:
+        r["avg_mastery"] = round(r["mastery_sum"] / r["node_count"] * 100) if r["node_count"] else 0
+    return rows
+
+
+def rebuild(user_id: str) -> list:
+    """Recompute the user's summaries from graph_nodes and replace the stored rows."""
+    nodes = table("graph_nodes").select(
+        "subject,mastery_score,mastery_tier,times_studied",
+        filters={"user_id": f"eq.{user_id}"},
+    )
+    fresh = deltas([], nodes)
+    table("subject_stats").delete({"user_id": f"eq.{user_id}"})
+    if fresh:
+        table("subject_stats").insert([{"user_id": user_id, **row} for row in fresh])
+    return fresh
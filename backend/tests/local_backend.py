@@ -0,0 +1,47 @@
+"""
+Shared test fixture: run db.connection against the in-process SQLite
+PostgREST stand-in (db/local_postgrest.py) instead of Supabase.
+"""
+import sys
+import os
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import connection
+from services import graph_cache_service, graph_changes_service, subject_stats_service
+from services.concept_key_service import concept_key
+
+
+class LocalBackendTestCase(unittest.TestCase):
+    """Gives each test a fresh in-memory database as `self.db`."""
+
+    def setUp(self):
+        self._saved = (connection._client, connection._async_client, connection.REST_URL)
+        self.db = connection.use_local_backend(":memory:")
+        graph_cache_service.clear()  # snapshots from another test's database
+        subject_stats_service._dirty.clear()
+        graph_changes_service._resync.clear()
+
+    def tearDown(self):
+        connection._client, connection._async_client, connection.REST_URL = self._saved
+
+    def seed_user(self, user_id: str = "u1", name: str = "Ada") -> None:
+        connection.table("users").insert({"id": user_id, "name": name, "streak_count": 0})
+
+    def seed_node(self, node_id: str, user_id: str = "u1", concept_name: str = "",
+                  subject: str = "CS101", mastery_score: float = 0.0,
+                  mastery_tier: str = "unexplored", times_studied: int = 0) -> None:
+        row = {
+            "id": node_id,
+            "user_id": user_id,
+            "concept_name": concept_name or node_id,
+            "concept_key": concept_key(concept_name or node_id),
+            "subject": subject,
+            "mastery_score": mastery_score,
+            "mastery_tier": mastery_tier,
+            "times_studied": times_studied,
+        }
+        connection.table("graph_nodes").insert(row)
+        # Keep subject_stats in step, as the app's write paths do
+        subject_stats_service.apply(user_id, subject_stats_service.deltas([], [row]))
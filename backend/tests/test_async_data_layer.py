@@ -0,0 +1,135 @@
+"""
+Unit tests for the async Supabase data layer.
+
+Tests: db.connection.AsyncSupabaseTable (request shape against a mock transport),
+       graph_service.get_graph_async (same payload as the sync get_graph).
+
+Run from backend/:
+    python -m pytest tests/test_async_data_layer.py -v
+"""
+import sys
+import os
+import asyncio
+import unittest
+from unittest.mock import patch, MagicMock
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+REST_URL = "http://supabase.test/rest/v1"
+
+
+def _mock_async_client(handler):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+class TestAsyncSupabaseTable(unittest.TestCase):
+
+    def test_select_sends_postgrest_params(self):
+        seen = {}
+
+        def handler(request: httpx.Request):
+            seen["method"] = request.method
+            seen["params"] = dict(request.url.params)
+            return httpx.Response(200, json=[{"id": "n1"}])
+
+        from db import connection
+        with patch.object(connection, "_async_client", _mock_async_client(handler)), \
+             patch.object(connection, "REST_URL", REST_URL):
+            rows = asyncio.run(connection.async_table("graph_nodes").select(
+                "id", filters={"user_id": "eq.u1"}, order="created_at.asc", limit=3,
+            ))
+
+        self.assertEqual(rows, [{"id": "n1"}])
+        self.assertEqual(seen["method"], "GET")
+        self.assertEqual(seen["params"], {
+            "select": "id", "user_id": "eq.u1", "order": "created_at.asc", "limit": "3",
+        })
+
+    def test_upsert_sets_merge_duplicates(self):
+        seen = {}
+
+        def handler(request: httpx.Request):
+            seen["prefer"] = request.headers.get("Prefer")
+            seen["on_conflict"] = request.url.params.get("on_conflict")
+            return httpx.Response(201, json=[])
+
+        from db import connection
+        with patch.object(connection, "_async_client", _mock_async_client(handler)), \
+             patch.object(connection, "REST_URL", REST_URL):
+            asyncio.run(connection.async_table("course_context").upsert(
+                {"course_name": "CS101"}, on_conflict="course_name",
+            ))
+
+        self.assertIn("resolution=merge-duplicates", seen["prefer"])
+        self.assertEqual(seen["on_conflict"], "course_name")
+
+    def test_http_error_raises(self):
+        def handler(request: httpx.Request):
+            return httpx.Response(500, json={"message": "boom"})
+
+        from db import connection
+        with patch.object(connection, "_async_client", _mock_async_client(handler)), \
+             patch.object(connection, "REST_URL", REST_URL):
+            with self.assertRaises(httpx.HTTPStatusError):
+                asyncio.run(connection.async_table("users").delete({"id": "eq.u1"}))
+
+
+class TestGetGraphAsync(unittest.TestCase):
+
+    ROWS = {
+        "users": [{"id": "u1", "streak_count": 4}],
+        "graph_nodes": [
+            {"id": "n1", "user_id": "u1", "concept_name": "Loops", "mastery_score": 0.8,
+             "mastery_tier": "mastered", "subject": "CS101", "times_studied": 2},
+            {"id": "n2", "user_id": "u1", "concept_name": "Recursion", "mastery_score": 0.2,
+             "mastery_tier": "struggling", "subject": "CS101", "times_studied": 1},
+        ],
+        "graph_edges": [
+            {"id": "e1", "source_node_id": "n1", "target_node_id": "n2", "strength": 0.5},
+        ],
+        "courses": [{"course_name": "CS101"}, {"course_name": "MATH200"}],
+    }
+
+    def _sync_table(self, name):
+        m = MagicMock()
+        m.select.return_value = self.ROWS.get(name, [])
+        return m
+
+    def _async_table(self, name):
+        rows = self.ROWS.get(name, [])
+
+        class _T:
+            async def select(self, *args, **kwargs):
+                return rows
+
+            async def insert(self, data):
+                return [data]
+
+        return _T()
+
+    def test_matches_sync_payload(self):
+        from db.connection import RpcNotFoundError
+        from services import graph_service
+        unavailable = RpcNotFoundError("get_graph_bundle")
+        with patch.object(graph_service, "table", side_effect=self._sync_table), \
+             patch.object(graph_service, "async_table", side_effect=self._async_table), \
+             patch.object(graph_service, "rpc", side_effect=unavailable), \
+             patch.object(graph_service, "rpc_async", side_effect=unavailable), \
+             patch.object(graph_service.graph_cache, "get", return_value=None), \
+             patch.object(graph_service.graph_changes, "latest_version", return_value=7), \
+             patch.object(graph_service.graph_changes, "latest_version_async", return_value=7):
+            expected = graph_service.get_graph("u1")
+            actual = asyncio.run(graph_service.get_graph_async("u1"))
+
+        self.assertEqual(actual, expected)
+        self.assertEqual(actual["stats"]["streak"], 4)
+        self.assertEqual(actual["version"], 7)
+        root_ids = {n["id"] for n in actual["nodes"] if n.get("is_subject_root")}
+        self.assertEqual(root_ids, {"subject_root__CS101", "subject_root__MATH200"})
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,121 @@
+"""
+Unit tests for automatic chunking in SupabaseTable.
+
+Tests: oversized in.() filters (all of them, in one pass) and bulk payloads
+       are split into bounded requests, run concurrently without nesting on
+       the shared pool, and merged (against the SQLite stand-in).
+
+Run from backend/:
+    python -m pytest tests/test_chunked_requests.py -v
+"""
+import sys
+import os
+import asyncio
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import connection, instrumentation
+from db.connection import async_table, table
+from local_backend import LocalBackendTestCase
+
+
+class TestChunkFilters(unittest.TestCase):
+
+    def test_small_filter_untouched(self):
+        self.assertIsNone(connection._chunk_filters({"id": "in.(a,b,c)"}))
+
+    def test_splits_by_item_count(self):
+        with patch.object(connection, "MAX_IN_ITEMS", 2):
+            chunks = connection._chunk_filters({"id": "in.(a,b,c,d,e)", "user_id": "eq.u1"})
+        self.assertEqual([c["id"] for c in chunks], ["in.(a,b)", "in.(c,d)", "in.(e)"])
+        self.assertTrue(all(c["user_id"] == "eq.u1" for c in chunks))
+
+    def test_quoted_values_survive(self):
+        with patch.object(connection, "MAX_IN_ITEMS", 1):
+            chunks = connection._chunk_filters({"name": 'in.("Graphs, trees",Loops)'})
+        self.assertEqual([c["name"] for c in chunks], ['in.("Graphs, trees")', "in.(Loops)"])
+
+    def test_every_oversized_filter_split_in_one_pass(self):
+        with patch.object(connection, "MAX_IN_ITEMS", 2):
+            chunks = connection._chunk_filters({"source_node_id": "in.(a,b,c)",
+                                                "target_node_id": "in.(x,y,z)"})
+        self.assertEqual(len(chunks), 4)
+        for chunk in chunks:
+            self.assertIsNone(connection._chunk_filters(chunk))
+        pairs = {(s, t) for c in chunks
+                 for s in c["source_node_id"][4:-1].split(",")
+                 for t in c["target_node_id"][4:-1].split(",")}
+        self.assertEqual(len(pairs), 9)
+
+    def test_nested_fan_out_runs_inline(self):
+        # One worker: a nested fan-out waiting on the pool would never finish
+        pool = connection.ThreadPoolExecutor(max_workers=1,
+                                             thread_name_prefix=connection._FANOUT_THREAD_PREFIX)
+        self.addCleanup(pool.shutdown)
+
+        def outer(i):
+            return connection._fan_out(lambda j: (i, j), [1, 2])
+
+        with patch.object(connection, "_executor", pool):
+            self.assertEqual(connection._fan_out(outer, ["a", "b"]),
+                             [[("a", 1), ("a", 2)], [("b", 1), ("b", 2)]])
+
+    def test_not_in_is_never_split(self):
+        with patch.object(connection, "MAX_IN_ITEMS", 1):
+            self.assertIsNone(connection._chunk_filters({"id": "not.in.(a,b,c)"}))
+
+
+class TestChunkedRequests(LocalBackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seed_user("u1")
+        self._limits = patch.multiple(connection, MAX_IN_ITEMS=3, BULK_BATCH_SIZE=4)
+        self._limits.start()
+
+    def tearDown(self):
+        self._limits.stop()
+        super().tearDown()
+
+    def _nodes(self, n):
+        return [{"id": f"n{i:02d}", "user_id": "u1", "concept_name": f"C{i}",
+                 "mastery_score": i / 100} for i in range(n)]
+
+    def test_bulk_insert_is_batched(self):
+        trace = instrumentation.start_trace("bulk")
+        rows = table("graph_nodes").insert(self._nodes(10))
+        self.assertEqual(len(rows), 10)
+        self.assertEqual([q["verb"] for q in trace.queries], ["insert"] * 3)
+
+    def test_select_merges_chunks_with_order_and_limit(self):
+        table("graph_nodes").insert(self._nodes(10))
+        ids = ",".join(f"n{i:02d}" for i in range(10))
+        rows = table("graph_nodes").select(
+            "id", filters={"id": f"in.({ids})"}, order="mastery_score.desc", limit=4,
+        )
+        self.assertEqual([r["id"] for r in rows], ["n09", "n08", "n07", "n06"])
+
+    def test_delete_chunks_and_counts(self):
+        table("graph_nodes").insert(self._nodes(10))
+        ids = ",".join(f"n{i:02d}" for i in range(8))
+        deleted = table("graph_nodes").delete({"id": f"in.({ids})"})
+        self.assertEqual(len(deleted), 8)
+        self.assertEqual(len(table("graph_nodes").select("id")), 2)
+
+    def test_async_upsert_and_update(self):
+        async def run():
+            await async_table("graph_nodes").upsert(self._nodes(9))
+            ids = ",".join(f"n{i:02d}" for i in range(9))
+            return await async_table("graph_nodes").update(
+                {"mastery_tier": "learning"}, {"id": f"in.({ids})"}
+            )
+
+        self.assertEqual(len(asyncio.run(run())), 9)
+        tiers = {r["mastery_tier"] for r in table("graph_nodes").select("mastery_tier")}
+        self.assertEqual(tiers, {"learning"})
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,136 @@
+"""
+Unit tests for the columnar graph wire format (?format=compact).
+
+Tests: services.compact_graph_service encode/decode round-trip, index-pair
+       edges and omitted subject edges; GET /api/graph/{user_id} and the room
+       overview with format=compact, and gzip on large responses.
+
+Run from backend/:
+    python -m pytest tests/test_compact_graph.py -v
+"""
+import sys
+import os
+import gzip
+import json
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.connection import table
+from services import compact_graph_service as compact_graph
+from services.graph_service import _assemble_graph, apply_graph_update, get_graph
+from local_backend import LocalBackendTestCase
+
+FRONTEND_NODE_KEYS = (
+    "id", "concept_name", "mastery_score", "mastery_tier", "subject",
+    "times_studied", "last_studied_at", "is_subject_root",
+)
+
+
+def _node_view(graph: dict) -> list:
+    # The compact format sends a missing subject as "General", as the graph view shows it
+    return [
+        {**{k: n.get(k) for k in FRONTEND_NODE_KEYS}, "subject": n.get("subject") or "General"}
+        for n in graph["nodes"]
+    ]
+
+
+class TestEncodeDecode(unittest.TestCase):
+
+    def setUp(self):
+        nodes = [
+            {"id": "n1", "user_id": "u1", "concept_name": "Loops", "mastery_score": 0.8,
+             "mastery_tier": "mastered", "subject": "CS101", "times_studied": 3,
+             "last_studied_at": "2026-03-01T12:00:00+00:00", "created_at": "2026-02-01"},
+            {"id": "n2", "user_id": "u1", "concept_name": "Limits", "mastery_score": 0.2,
+             "mastery_tier": "struggling", "subject": "MATH", "times_studied": 1,
+             "last_studied_at": None, "created_at": "2026-02-01"},
+            {"id": "n3", "user_id": "u1", "concept_name": "Sets", "mastery_score": 0.0,
+             "mastery_tier": "unexplored", "subject": None, "times_studied": 0,
+             "last_studied_at": None, "created_at": "2026-02-01"},
+        ]
+        edges = [{"id": "e1", "source_node_id": "n1", "target_node_id": "n2", "strength": 0.4}]
+        self.graph = _assemble_graph("u1", nodes, edges, 2, {"CS101", "BIO"}, version=5)
+
+    def test_columns(self):
+        c = compact_graph.encode("u1", self.graph)
+        self.assertEqual(c["nodes"]["id"][:3], ["n1", "n2", "n3"])
+        self.assertEqual(c["subjects"][:3], ["CS101", "MATH", "General"])
+        self.assertEqual(c["nodes"]["subject"][:3], [0, 1, 2])
+        self.assertEqual([c["tiers"][t] for t in c["nodes"]["tier"][:3]],
+                         ["mastered", "struggling", "unexplored"])
+        self.assertEqual(c["edges"], {"id": ["e1"], "source": [0], "target": [1], "strength": [0.4]})
+        self.assertEqual((c["version"], c["stats"]), (5, self.graph["stats"]))
+
+    def test_round_trip(self):
+        wire = compact_graph.dumps(compact_graph.encode("u1", self.graph))
+        decoded = compact_graph.decode(json.loads(wire))
+        self.assertEqual(_node_view(decoded), _node_view(self.graph))
+        self.assertEqual(decoded["edges"], self.graph["edges"])
+        self.assertEqual(decoded["version"], 5)
+
+    def test_smaller_than_full_payload(self):
+        graph = compact_graph._sample_graph(300)
+        full = json.dumps(graph).encode()
+        compact = compact_graph.dumps(compact_graph.encode("user_andres", graph))
+        self.assertLess(len(compact) * 3, len(full))
+        self.assertLess(len(gzip.compress(compact)), len(gzip.compress(full)))
+
+
+class TestCompactRoutes(LocalBackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        from fastapi.testclient import TestClient
+        import main
+
+        self.client = TestClient(main.app)
+        self.seed_user("u1")
+        for i in range(60):
+            self.seed_node(f"n{i}", concept_name=f"Concept {i}", mastery_score=i / 60)
+        table("graph_edges").insert(
+            [{"id": f"e{i}", "user_id": "u1", "source_node_id": f"n{i}",
+              "target_node_id": f"n{i + 1}", "strength": 0.5} for i in range(59)]
+        )
+
+    def test_graph_route(self):
+        response = self.client.get("/api/graph/u1", params={"format": "compact"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        body = response.json()
+        self.assertEqual(body["format"], "compact")
+        self.assertEqual(_node_view(compact_graph.decode(body)), _node_view(get_graph("u1")))
+
+    def test_default_format_unchanged(self):
+        body = self.client.get("/api/graph/u1").json()
+        self.assertNotIn("format", body)
+        self.assertEqual(len(body["edges"]), 59 + 60)
+
+    def test_unknown_format_rejected(self):
+        self.assertEqual(self.client.get("/api/graph/u1", params={"format": "xml"}).status_code, 422)
+
+    @patch("services.course_context_service.update_course_context")
+    def test_since_returns_plain_delta(self, _ctx):
+        version = get_graph("u1")["version"]
+        apply_graph_update("u1", {"updated_nodes": [{"concept_name": "Concept 1", "mastery_delta": 0.1}]})
+        body = self.client.get("/api/graph/u1", params={"since": version, "format": "compact"}).json()
+        self.assertFalse(body["full"])
+        self.assertIn("n1", {n["id"] for n in body["nodes"]})
+
+        full = self.client.get("/api/graph/u1", params={"since": 10_000, "format": "compact"}).json()
+        self.assertEqual((full["format"], full["full"]), ("compact", True))
+
+    @patch("routes.social.get_cached_summary", return_value="Summary.")
+    def test_room_overview(self, _summary):
+        table("rooms").insert({"id": "r1", "name": "Study", "invite_code": "ABC123", "created_by": "u1"})
+        table("room_members").insert({"room_id": "r1", "user_id": "u1"})
+        body = self.client.get("/api/social/rooms/r1/overview", params={"format": "compact"}).json()
+        graph = body["members"][0]["graph"]
+        self.assertEqual(graph["format"], "compact")
+        self.assertEqual(len(graph["nodes"]["id"]), 61)
+        self.assertEqual(body["ai_summary"], "Summary.")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,155 @@
+"""
+Unit tests for normalized concept keys (graph_nodes.concept_key).
+
+Tests: services.concept_key_service (concept_key normalization, fuzzy
+       resolve_keys), write-time resolution in apply_graph_update (variant
+       spellings, the unique index, a concurrent insert, fuzzy matching),
+       learn._resolve_course_async by key, and the one-time backfill script.
+
+Run from backend/:
+    python -m pytest tests/test_concept_keys.py -v
+"""
+import sys
+import os
+import asyncio
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.backfill_concept_keys import backfill
+from db.connection import table
+from services import graph_service, subject_stats_service
+from services.concept_key_service import concept_key, resolve_keys
+from local_backend import LocalBackendTestCase
+
+
+class TestConceptKey(unittest.TestCase):
+
+    def test_variants_share_a_key(self):
+        for variant in ("Linked Lists", "linked list", "Linked-List", "  LINKED   lists "):
+            self.assertEqual(concept_key(variant), "linked list")
+        self.assertEqual(concept_key("Binary Search Trees"), concept_key("binary search tree"))
+        self.assertEqual(concept_key("Dependencies"), "dependency")
+        self.assertEqual(concept_key("Hash Maps (Dictionaries)"), "hash map dictionary")
+
+    def test_distinct_concepts_stay_distinct(self):
+        self.assertNotEqual(concept_key("C++"), concept_key("C"))
+        self.assertNotEqual(concept_key("C#"), concept_key("C"))
+        for word in ("Analysis", "Status", "Process", "Series", "Gas"):
+            self.assertEqual(concept_key(word), word.lower())
+        self.assertEqual(concept_key("Processes"), "process")
+        self.assertEqual(concept_key("Vertices"), "vertex")
+        self.assertEqual(concept_key("???"), "???")
+
+    def test_resolve_keys(self):
+        resolved = resolve_keys(
+            ["binary serch tree", "graph", "heap", "linked lisst", "linked lisst"],
+            ["binary search tree", "heat"],
+            0.9,
+        )
+        self.assertEqual(resolved["binary serch tree"], "binary search tree")
+        self.assertEqual(resolved["heap"], "heap")           # 0.75 similar: below the cutoff
+        self.assertEqual(resolved["graph"], "graph")
+        self.assertEqual(resolved["linked lisst"], "linked lisst")
+        # New keys in one batch collapse onto each other
+        self.assertEqual(resolve_keys(["queue", "queues"], [], 0.9)["queues"], "queue")
+
+
+@patch("services.course_context_service.update_course_context")
+class TestWriteTimeResolution(LocalBackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seed_user("u1")
+        self.seed_node("ll", concept_name="Linked Lists", mastery_score=0.2,
+                       mastery_tier="struggling", times_studied=1)
+
+    def _nodes(self) -> list:
+        return table("graph_nodes").select("*", filters={"user_id": "eq.u1"})
+
+    def test_variant_spellings_update_existing_node(self, _ctx):
+        changes = graph_service.apply_graph_update("u1", {
+            "new_nodes": [{"concept_name": "linked list", "subject": "CS101"},
+                          {"concept_name": "Stacks", "subject": "CS101"},
+                          {"concept_name": "stack", "subject": "CS101"}],
+            "updated_nodes": [{"concept_name": "Linked-List", "mastery_delta": 0.3}],
+            "new_edges": [{"source": "LINKED LISTS", "target": "stack"}],
+        })
+        nodes = {n["concept_key"]: n for n in self._nodes()}
+        self.assertEqual(sorted(nodes), ["linked list", "stack"])
+        self.assertEqual(nodes["linked list"]["concept_name"], "Linked Lists")  # name as first written
+        self.assertAlmostEqual(nodes["linked list"]["mastery_score"], 0.5)
+        self.assertEqual(nodes["stack"]["concept_name"], "Stacks")
+        self.assertEqual(changes[0]["concept"], "Linked-List")
+        (edge,) = table("graph_edges").select("*")
+        self.assertEqual((edge["source_node_id"], edge["target_node_id"]), ("ll", nodes["stack"]["id"]))
+
+    def test_unique_index(self, _ctx):
+        with self.assertRaises(Exception):
+            table("graph_nodes").insert({"id": "dup", "user_id": "u1", "concept_name": "linked list",
+                                         "concept_key": "linked list"})
+
+    def test_concurrent_insert_is_read_back(self, _ctx):
+        real_table = graph_service.table
+        reads = []
+
+        def racing_table(name, *args, **kwargs):
+            t = real_table(name, *args, **kwargs)
+            if name == "graph_nodes" and not reads:
+                reads.append(name)
+                t.select = lambda *a, **k: []  # step 1 misses: another writer inserts next
+                self.seed_node("other", concept_name="Queues")
+            return t
+
+        with patch.object(graph_service, "table", side_effect=racing_table):
+            graph_service.apply_graph_update("u1", {
+                "new_nodes": [{"concept_name": "queue", "subject": "CS101"}],
+                "updated_nodes": [{"concept_name": "queue", "mastery_delta": 0.5}],
+            })
+        queues = [n for n in self._nodes() if n["concept_key"] == "queue"]
+        self.assertEqual([(n["id"], n["mastery_score"]) for n in queues], [("other", 0.5)])
+
+    def test_fuzzy_matching_is_opt_in(self, _ctx):
+        update = {"updated_nodes": [{"concept_name": "Linkd Lists", "mastery_delta": 0.1}],
+                  "new_nodes": [{"concept_name": "Linkd Lists", "subject": "CS101"}]}
+        with patch.object(graph_service, "CONCEPT_FUZZY_THRESHOLD", 0.9):
+            graph_service.apply_graph_update("u1", update)
+        self.assertEqual(len(self._nodes()), 1)
+        self.assertAlmostEqual(self._nodes()[0]["mastery_score"], 0.3)
+
+        graph_service.apply_graph_update("u1", update)
+        self.assertEqual(len(self._nodes()), 2)
+
+    def test_resolve_course_by_key(self, _ctx):
+        from routes.learn import _resolve_course_async
+        self.assertEqual(asyncio.run(_resolve_course_async("linked list", "u1")), "CS101")
+
+
+class TestBackfill(LocalBackendTestCase):
+
+    def test_merges_duplicates_and_sets_keys(self):
+        self.seed_user("u1")
+        # Rows written before the concept_key column existed
+        table("graph_nodes").insert([
+            {"id": "a", "user_id": "u1", "concept_name": "Linked Lists", "mastery_score": 0.6,
+             "mastery_tier": "learning", "subject": "CS101"},
+            {"id": "b", "user_id": "u1", "concept_name": "linked list", "mastery_score": 0.2,
+             "mastery_tier": "struggling", "subject": "CS101"},
+            {"id": "c", "user_id": "u1", "concept_name": "Recursion", "subject": "CS101"},
+        ])
+        table("graph_edges").insert({"id": "e1", "user_id": "u1", "source_node_id": "b",
+                                     "target_node_id": "c"})
+        subject_stats_service.rebuild("u1")
+        with patch("builtins.print"):
+            backfill()
+            backfill()  # re-running is a no-op
+        nodes = {n["id"]: n["concept_key"] for n in table("graph_nodes").select("id,concept_key")}
+        self.assertEqual(nodes, {"a": "linked list", "c": "recursion"})
+        self.assertEqual(table("graph_edges").select("id"), [])
+        (cs,) = subject_stats_service.get("u1")
+        self.assertEqual((cs["node_count"], cs["struggling"]), (2, 0))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,110 @@
+"""
+Unit tests for per-request PostgREST instrumentation.
+
+Tests: db.instrumentation (query shapes, N+1 warning), the trace middleware
+       in main.py (X-DB-Queries header, streamed bodies traced to the end)
+       against the local SQLite stand-in, and the DEBUG_ENDPOINTS gate.
+
+Run from backend/:
+    python -m pytest tests/test_db_instrumentation.py -v
+"""
+import sys
+import os
+import asyncio
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import instrumentation
+from db.connection import table
+from local_backend import LocalBackendTestCase
+
+
+class TestQueryShape(unittest.TestCase):
+
+    def test_values_are_ignored(self):
+        a = instrumentation.query_shape("graph_nodes", "select", {"select": "id", "subject": "eq.CS101"})
+        b = instrumentation.query_shape("graph_nodes", "select", {"select": "*", "subject": "eq.MATH"})
+        self.assertEqual(a, b)
+
+    def test_operator_is_part_of_shape(self):
+        a = instrumentation.query_shape("users", "select", {"id": "eq.u1"})
+        b = instrumentation.query_shape("users", "select", {"id": "in.(u1,u2)"})
+        self.assertNotEqual(a, b)
+
+
+class TestRequestTrace(LocalBackendTestCase):
+
+    def test_records_calls_in_active_trace(self):
+        self.seed_user("u1")
+        trace = instrumentation.start_trace("test")
+        table("users").select("id", filters={"id": "eq.u1"})
+        table("users").update({"name": "Grace"}, filters={"id": "eq.u1"})
+        self.assertEqual([q["verb"] for q in trace.queries], ["select", "update"])
+        self.assertEqual(trace.queries[0]["rows"], 1)
+        self.assertEqual(trace.round_trips, 2)
+
+    def test_warns_on_repeated_shape(self):
+        self.seed_user("u1")
+        instrumentation.start_trace("loop")
+        with self.assertLogs("sapling.db", level="WARNING") as logs:
+            for i in range(instrumentation.N1_THRESHOLD + 2):
+                table("graph_nodes").select("id", filters={"subject": f"eq.S{i}"})
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("graph_nodes", logs.output[0])
+
+
+class TestTraceMiddleware(LocalBackendTestCase):
+
+    def test_header_counts_round_trips(self):
+        from fastapi.testclient import TestClient
+        import main
+
+        self.seed_user("u1")
+        client = TestClient(main.app)
+        response = client.get("/api/graph/u1/recommendations")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["X-DB-Queries"], "1")
+
+        with patch("routes.debug.DEBUG_ENDPOINTS", True):
+            debug = client.get("/api/debug/queries", params={"limit": 5}).json()
+        paths = [r["request"] for r in debug["requests"]]
+        self.assertIn("GET /api/graph/u1/recommendations", paths)
+
+    @patch("services.course_context_service.update_course_context")
+    def test_streamed_body_is_traced_to_the_end(self, _ctx):
+        from fastapi.testclient import TestClient
+        import main
+
+        async def reply(prompt, **kwargs):
+            yield "Hello."
+            await asyncio.sleep(0.05)   # still generating after the headers are sent
+            yield " Next question?"
+
+        self.seed_user("u1")
+        table("sessions").insert({"id": "s1", "user_id": "u1", "mode": "socratic", "topic": ""})
+        finished = []
+        real_finish = instrumentation.finish_trace
+        with patch("routes.learn.stream_gemini_async", side_effect=reply), \
+             patch.object(instrumentation, "finish_trace",
+                          side_effect=lambda t: finished.append(list(t.queries)) or real_finish(t)):
+            TestClient(main.app).post(
+                "/api/learn/chat", params={"stream": "true"},
+                json={"session_id": "s1", "user_id": "u1", "message": "Hi", "mode": "socratic"},
+            )
+        (queries,) = finished
+        # The user's message is saved before streaming, the reply after it
+        self.assertEqual([q["verb"] for q in queries if q["table"] == "messages"],
+                         ["insert", "select", "insert"])
+
+    def test_debug_routes_off_by_default(self):
+        from fastapi.testclient import TestClient
+        import main
+
+        with patch("routes.debug.DEBUG_ENDPOINTS", False):
+            self.assertEqual(TestClient(main.app).get("/api/debug/queries").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,142 @@
+"""
+Unit tests for the versioned per-user graph snapshot cache.
+
+Tests: services.graph_cache_service.GraphSnapshotCache (versions, LRU, TTL,
+       stats) and get_graph served from snapshots until a writer bumps the
+       user's version.
+
+Run from backend/:
+    python -m pytest tests/test_graph_cache.py -v
+"""
+import sys
+import os
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import instrumentation
+from services import graph_cache_service, graph_service
+from services.graph_cache_service import GraphSnapshotCache
+from local_backend import LocalBackendTestCase
+
+
+def _graph(label: str = "A") -> dict:
+    return {
+        "nodes": [{"id": "n1", "concept_name": label}],
+        "edges": [],
+        "stats": {"total_nodes": 1},
+    }
+
+
+class TestGraphSnapshotCache(unittest.TestCase):
+
+    def test_hit_until_bumped(self):
+        c = GraphSnapshotCache(maxsize=4, ttl=60)
+        c.put("u1", c.version("u1"), _graph())
+        self.assertEqual(c.get("u1"), _graph())
+        c.bump("u1")
+        self.assertIsNone(c.get("u1"))
+        self.assertEqual((c.hits, c.misses), (1, 1))
+
+    def test_build_racing_a_write_is_not_stored(self):
+        c = GraphSnapshotCache(maxsize=4, ttl=60)
+        version = c.version("u1")     # reader starts
+        c.bump("u1")                  # writer commits meanwhile
+        c.put("u1", version, _graph("stale"))
+        self.assertIsNone(c.get("u1"))
+
+    def test_derived_values_follow_the_snapshot(self):
+        c = GraphSnapshotCache(maxsize=4, ttl=60)
+        version = c.version("u1")
+        c.put_derived("u1", version, "recs", ["a"])   # no snapshot yet: dropped
+        self.assertIsNone(c.get_derived("u1", "recs"))
+        c.put("u1", version, _graph())
+        c.put_derived("u1", version, "recs", ["a"])
+        self.assertEqual(c.get_derived("u1", "recs"), ["a"])
+        c.bump("u1")
+        self.assertIsNone(c.get_derived("u1", "recs"))
+
+    def test_lru_eviction(self):
+        c = GraphSnapshotCache(maxsize=2, ttl=60)
+        for uid in ("a", "b"):
+            c.put(uid, 0, _graph())
+        c.get("a")
+        c.put("c", 0, _graph())
+        self.assertIsNone(c.get("b"))
+        self.assertIsNotNone(c.get("a"))
+        self.assertEqual(c.evictions, 1)
+
+    def test_ttl_expiry(self):
+        c = GraphSnapshotCache(maxsize=2, ttl=10)
+        with patch("services.graph_cache_service.time.monotonic", return_value=100.0):
+            c.put("u1", 0, _graph())
+        with patch("services.graph_cache_service.time.monotonic", return_value=111.0):
+            self.assertIsNone(c.get("u1"))
+
+    def test_callers_get_copies(self):
+        c = GraphSnapshotCache(maxsize=2, ttl=60)
+        c.put("u1", 0, _graph())
+        c.get("u1")["nodes"][0]["concept_name"] = "mutated"
+        self.assertEqual(c.get("u1")["nodes"][0]["concept_name"], "A")
+
+    def test_disabled_with_zero_maxsize(self):
+        c = GraphSnapshotCache(maxsize=0, ttl=60)
+        c.put("u1", 0, _graph())
+        self.assertIsNone(c.get("u1"))
+
+    def test_stats_report_memory(self):
+        c = GraphSnapshotCache(maxsize=2, ttl=60)
+        c.put("u1", 0, _graph())
+        c.get("u1")
+        stats = c.stats()
+        self.assertEqual(stats["hit_rate"], 1.0)
+        self.assertGreater(stats["memory_bytes"], 0)
+
+
+class TestGetGraphSnapshots(LocalBackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seed_user("u1")
+        self.seed_node("n1", concept_name="Loops", mastery_score=0.5, mastery_tier="learning")
+
+    def _round_trips(self, fn, *args) -> int:
+        trace = instrumentation.start_trace("test")
+        fn(*args)
+        return trace.round_trips
+
+    def test_repeated_reads_are_free(self):
+        first = graph_service.get_graph("u1")
+        self.assertEqual(self._round_trips(graph_service.get_graph, "u1"), 0)
+        self.assertEqual(graph_service.get_graph("u1"), first)
+        self.assertGreaterEqual(graph_cache_service.stats()["hits"], 2)
+
+    def test_writers_bump_version(self):
+        graph_service.get_graph("u1")
+        graph_service.add_course("u1", "HIST")
+        roots = {n["id"] for n in graph_service.get_graph("u1")["nodes"] if n.get("is_subject_root")}
+        self.assertIn("subject_root__HIST", roots)
+
+        graph_service.apply_graph_update("u1", {"updated_nodes": [{"concept_name": "Loops", "mastery_delta": 0.3}]})
+        loops = next(n for n in graph_service.get_graph("u1")["nodes"] if n["id"] == "n1")
+        self.assertAlmostEqual(loops["mastery_score"], 0.8)
+
+        for writer, args in [
+            (graph_service.update_course_color, ("u1", "HIST", "#fff")),
+            (graph_service.delete_course, ("u1", "HIST")),
+        ]:
+            before = graph_cache_service.version("u1")
+            writer(*args)
+            self.assertEqual(graph_cache_service.version("u1"), before + 1)
+
+    def test_other_users_stay_cached(self):
+        self.seed_user("u2", "Grace")
+        graph_service.get_graph("u1")
+        graph_service.get_graph("u2")
+        graph_service.add_course("u2", "HIST")
+        self.assertEqual(self._round_trips(graph_service.get_graph, "u1"), 0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
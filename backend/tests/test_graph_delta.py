@@ -0,0 +1,168 @@
+"""
+Unit tests for incremental graph fetches (GET /api/graph/{user_id}?since=).
+
+Tests: services.graph_changes_service.diff_graph, and
+       services.graph_service.get_graph_delta against the local stand-in
+       after apply_graph_update, add_course and delete_course (changed
+       entities only, deletions, unknown versions, no-change round-trips,
+       a full graph after change-log rows are lost).
+
+Run from backend/:
+    python -m pytest tests/test_graph_delta.py -v
+"""
+import sys
+import os
+import asyncio
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import instrumentation
+from db.connection import table
+from services import graph_changes_service
+from services.graph_changes_service import diff_graph
+from services.graph_service import (
+    add_course, apply_graph_update, delete_course, get_graph, get_graph_delta,
+    get_graph_delta_async,
+)
+from local_backend import LocalBackendTestCase
+
+
+class TestDiffGraph(unittest.TestCase):
+
+    GRAPH = {
+        "version": 9,
+        "nodes": [
+            {"id": "subject_root__CS101", "is_subject_root": True},
+            {"id": "n1", "subject": "CS101"},
+            {"id": "n2", "subject": "CS101"},
+        ],
+        "edges": [
+            {"id": "e1", "source": "n1", "target": "n2"},
+            {"id": "subject_edge__subject_root__CS101__n1"},
+            {"id": "subject_edge__subject_root__CS101__n2"},
+        ],
+        "stats": {"total_nodes": 2},
+    }
+
+    def test_changed_node_brings_root_and_subject_edge(self):
+        delta = diff_graph(self.GRAPH, 4, [{"id": 5, "entity": "node", "entity_id": "n1", "subject": "CS101"}])
+        self.assertFalse(delta["full"])
+        self.assertEqual((delta["since"], delta["version"]), (4, 9))
+        self.assertEqual({n["id"] for n in delta["nodes"]}, {"n1", "subject_root__CS101"})
+        self.assertEqual([e["id"] for e in delta["edges"]], ["subject_edge__subject_root__CS101__n1"])
+        self.assertEqual((delta["deleted_nodes"], delta["deleted_edges"]), ([], []))
+
+    def test_missing_entities_are_deletions(self):
+        changes = [
+            {"id": 6, "entity": "node", "entity_id": "gone", "subject": "MATH"},
+            {"id": 7, "entity": "edge", "entity_id": "e_gone", "subject": None},
+            {"id": 8, "entity": "edge", "entity_id": "e1", "subject": None},
+        ]
+        delta = diff_graph(self.GRAPH, 5, changes)
+        self.assertEqual(delta["deleted_nodes"], ["gone", "subject_root__MATH"])
+        self.assertEqual(
+            delta["deleted_edges"], ["e_gone", "subject_edge__subject_root__MATH__gone"]
+        )
+        self.assertEqual([e["id"] for e in delta["edges"]], ["e1"])
+
+
+@patch("services.course_context_service.update_course_context")
+class TestGraphDelta(LocalBackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seed_user("u1")
+        self.seed_node("n1", concept_name="Loops")
+        self.seed_node("n2", concept_name="Arrays")
+
+    def test_full_fetch_carries_version(self, _ctx):
+        self.assertEqual(get_graph("u1")["version"], 0)
+        apply_graph_update("u1", {"updated_nodes": [{"concept_name": "Loops", "mastery_delta": 0.1}]})
+        self.assertGreater(get_graph("u1")["version"], 0)
+
+    def test_delta_after_update(self, _ctx):
+        since = get_graph("u1")["version"]
+        apply_graph_update("u1", {
+            "new_nodes": [{"concept_name": "Recursion", "subject": "CS101", "initial_mastery": 0.2}],
+            "updated_nodes": [{"concept_name": "Loops", "mastery_delta": 0.3}],
+            "new_edges": [{"source": "Loops", "target": "Recursion", "strength": 0.6}],
+        })
+        delta = get_graph_delta("u1", since)
+
+        node_names = {n["concept_name"] for n in delta["nodes"]}
+        self.assertEqual(node_names, {"Loops", "Recursion", "CS101"})
+        self.assertNotIn("Arrays", node_names)
+        self.assertEqual(len([e for e in delta["edges"] if not e["id"].startswith("subject_edge__")]), 1)
+        self.assertEqual(delta["version"], get_graph("u1")["version"])
+        self.assertEqual((delta["deleted_nodes"], delta["deleted_edges"]), ([], []))
+
+        self.assertEqual(get_graph_delta("u1", delta["version"])["nodes"], [])
+
+    def test_delete_course_lists_deletions(self, _ctx):
+        apply_graph_update("u1", {"new_edges": [{"source": "Loops", "target": "Arrays"}]})
+        since = get_graph("u1")["version"]
+        delete_course("u1", "CS101")
+        delta = get_graph_delta("u1", since)
+        self.assertEqual(delta["nodes"], [])
+        self.assertEqual(delta["deleted_nodes"], ["n1", "n2", "subject_root__CS101"])
+        self.assertEqual(len([e for e in delta["deleted_edges"] if not e.startswith("subject_edge__")]), 1)
+
+    def test_add_course_sends_new_root(self, _ctx):
+        since = get_graph("u1")["version"]
+        add_course("u1", "MATH200")
+        delta = get_graph_delta("u1", since)
+        self.assertEqual([n["id"] for n in delta["nodes"]], ["subject_root__MATH200"])
+
+    def test_current_version_skips_change_log(self, _ctx):
+        version = get_graph("u1")["version"]
+        trace = instrumentation.start_trace("delta")
+        delta = get_graph_delta("u1", version)
+        self.assertEqual(trace.round_trips, 0)  # served from the graph snapshot
+        self.assertEqual((delta["nodes"], delta["edges"]), ([], []))
+
+    def test_unknown_version_falls_back_to_full(self, _ctx):
+        delta = get_graph_delta("u1", 10_000)
+        self.assertTrue(delta["full"])
+        self.assertEqual(len(delta["nodes"]), 3)
+
+    def test_too_many_changes_falls_back_to_full(self, _ctx):
+        apply_graph_update("u1", {"updated_nodes": [{"concept_name": "Loops", "mastery_delta": 0.1}]})
+        with patch.object(graph_changes_service, "MAX_DELTA_CHANGES", 0):
+            delta = get_graph_delta("u1", 0)
+        self.assertTrue(delta["full"])
+
+    def test_async_matches_sync(self, _ctx):
+        apply_graph_update("u1", {"updated_nodes": [{"concept_name": "Arrays", "mastery_delta": 0.1}]})
+        self.assertEqual(asyncio.run(get_graph_delta_async("u1", 0)), get_graph_delta("u1", 0))
+
+    def test_record_writes_one_row_per_entity(self, _ctx):
+        graph_changes_service.record("u1", nodes=[("n2", "CS101")])
+        rows = table("graph_changes").select("entity,entity_id,subject", filters={"user_id": "eq.u1"})
+        self.assertEqual(rows, [{"entity": "node", "entity_id": "n2", "subject": "CS101"}])
+
+    def test_lost_change_rows_force_a_full_graph(self, _ctx):
+        since = get_graph("u1")["version"]
+        with patch.object(graph_changes_service, "table", side_effect=RuntimeError("down")), \
+             self.assertLogs("sapling.db", "WARNING"):
+            apply_graph_update("u1", {"updated_nodes": [{"concept_name": "Loops", "mastery_delta": 0.2}]})
+        delta = get_graph_delta("u1", since)
+        self.assertTrue(delta["full"])
+        self.assertEqual(len(delta["nodes"]), 3)
+        self.assertFalse(get_graph_delta("u1", delta["version"])["full"])  # only once
+
+    def test_route_since_param(self, _ctx):
+        from fastapi.testclient import TestClient
+        import main
+
+        client = TestClient(main.app)
+        version = client.get("/api/graph/u1").json()["version"]
+        apply_graph_update("u1", {"updated_nodes": [{"concept_name": "Loops", "mastery_delta": 0.1}]})
+        delta = client.get("/api/graph/u1", params={"since": version}).json()
+        self.assertFalse(delta["full"])
+        self.assertIn("n1", {n["id"] for n in delta["nodes"]})
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
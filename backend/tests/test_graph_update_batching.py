@@ -0,0 +1,147 @@
+"""
+Unit tests for the batched apply_graph_update pipeline.
+
+Tests: services.graph_service.apply_graph_update against the local stand-in
+       (round-trip count, insert/update/edge semantics, mastery_changes), and
+       db.connection.in_filter quoting for awkward concept names.
+
+Run from backend/:
+    python -m pytest tests/test_graph_update_batching.py -v
+"""
+import sys
+import os
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import connection, instrumentation
+from db.connection import in_filter, table
+from db.postgrest_syntax import split_in_list
+from services.graph_service import apply_graph_update
+from local_backend import LocalBackendTestCase
+
+
+class TestInFilter(LocalBackendTestCase):
+
+    def test_round_trips_awkward_names(self):
+        self.seed_user("u1")
+        names = ["Big O (time)", "Sets, maps", 'The "halting" problem', "back\\slash", "plain"]
+        for i, name in enumerate(names):
+            self.seed_node(f"n{i}", concept_name=name)
+        rows = table("graph_nodes").select("concept_name", filters={"concept_name": in_filter(names)})
+        self.assertEqual(sorted(r["concept_name"] for r in rows), sorted(names))
+
+    def test_chunked_filter_keeps_escapes(self):
+        names = [f'C"{i}", part' for i in range(7)]
+        with patch.object(connection, "MAX_IN_ITEMS", 3):
+            chunks = connection._chunk_filters({"concept_name": in_filter(names)})
+        parsed = [v for c in chunks for v in split_in_list(c["concept_name"][4:-1])]
+        self.assertEqual(parsed, names)
+
+
+@patch("services.course_context_service.update_course_context")
+class TestBatchedApplyGraphUpdate(LocalBackendTestCase):
+
+    UPDATE = {
+        "new_nodes": [
+            {"concept_name": "Loops", "subject": "CS101", "initial_mastery": 0.9},   # exists
+            {"concept_name": "Recursion", "subject": "CS101", "initial_mastery": 0.3},
+            {"concept_name": "Recursion", "subject": "CS101", "initial_mastery": 0.7},  # repeat
+            {"concept_name": "Graphs, trees", "subject": "MATH", "initial_mastery": 0.0},
+        ],
+        "updated_nodes": [
+            {"concept_name": "Loops", "mastery_delta": 0.2},
+            {"concept_name": "Loops", "mastery_delta": 0.2},       # compounds, clamps at 1.0
+            {"concept_name": "Recursion", "mastery_delta": -0.5},  # clamps at 0.0
+            {"concept_name": "Unknown", "mastery_delta": 0.1},     # ignored
+        ],
+        "new_edges": [
+            {"source": "Loops", "target": "Recursion", "strength": 0.8},
+            {"source": "Loops", "target": "Recursion", "strength": 0.1},   # duplicate in batch
+            {"source": "Loops", "target": "Arrays", "strength": 0.9},      # existing edge
+            {"source": "Recursion", "target": "Graphs, trees"},
+            {"source": "Loops", "target": "Missing"},                      # unresolved
+        ],
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.seed_user("u1")
+        self.seed_node("loops", concept_name="Loops", mastery_score=0.7,
+                       mastery_tier="learning", times_studied=3)
+        self.seed_node("arrays", concept_name="Arrays", mastery_score=0.5)
+        table("graph_edges").insert({"id": "e0", "user_id": "u1", "source_node_id": "loops",
+                                     "target_node_id": "arrays", "strength": 0.4})
+
+    def _nodes(self) -> dict:
+        return {r["concept_name"]: r for r in table("graph_nodes").select("*", filters={"user_id": "eq.u1"})}
+
+    def test_round_trips(self, _ctx):
+        trace = instrumentation.start_trace("update")
+        apply_graph_update("u1", self.UPDATE)
+        verbs = [q["verb"] for q in trace.queries if q["table"] in ("graph_nodes", "graph_edges")]
+        # The second select looks for the unmatched names among nodes with no key
+        self.assertEqual(verbs, ["select", "select", "upsert", "upsert", "upsert"])
+
+    def test_one_select_when_every_name_resolves(self, _ctx):
+        trace = instrumentation.start_trace("update")
+        apply_graph_update("u1", {"updated_nodes": [{"concept_name": "loop", "mastery_delta": 0.1}]})
+        verbs = [q["verb"] for q in trace.queries if q["table"] == "graph_nodes"]
+        self.assertEqual(verbs, ["select", "upsert"])
+
+    def test_node_without_key_matched_by_name(self, _ctx):
+        table("graph_nodes").insert({"id": "ll", "user_id": "u1", "concept_name": "Linked Lists",
+                                     "concept_key": None, "mastery_score": 0.2})
+        changes = apply_graph_update("u1", {
+            "new_nodes": [{"concept_name": "linked list", "subject": "CS101"}],
+            "updated_nodes": [{"concept_name": "Linked-List", "mastery_delta": 0.3}],
+        })
+        self.assertAlmostEqual(changes[0]["before"], 0.2)
+        rows = [r for r in self._nodes().values() if r["concept_name"].lower().startswith("linked")]
+        self.assertEqual(len(rows), 1)
+        self.assertAlmostEqual(rows[0]["mastery_score"], 0.5)
+        self.assertEqual(rows[0]["concept_key"], "linked list")   # written back
+
+    def test_mastery_changes_and_node_state(self, _ctx):
+        changes = apply_graph_update("u1", self.UPDATE)
+        self.assertEqual([c["concept"] for c in changes], ["Loops", "Loops", "Recursion"])
+        self.assertAlmostEqual(changes[0]["after"], 0.9)
+        self.assertEqual(changes[1]["before"], changes[0]["after"])
+        self.assertEqual(changes[1]["after"], 1.0)
+        self.assertEqual((changes[2]["before"], changes[2]["after"]), (0.3, 0.0))
+
+        nodes = self._nodes()
+        self.assertEqual(len(nodes), 4)
+        self.assertEqual(nodes["Loops"]["times_studied"], 5)
+        self.assertEqual(nodes["Loops"]["mastery_tier"], "mastered")
+        self.assertEqual(nodes["Loops"]["subject"], "CS101")          # untouched by the upsert
+        self.assertEqual(nodes["Recursion"]["times_studied"], 1)
+        self.assertIsNotNone(nodes["Recursion"]["last_studied_at"])
+        self.assertEqual(nodes["Graphs, trees"]["subject"], "MATH")
+
+    def test_edges(self, _ctx):
+        apply_graph_update("u1", self.UPDATE)
+        ids = {n["id"]: name for name, n in self._nodes().items()}
+        edges = {
+            (ids[e["source_node_id"]], ids[e["target_node_id"]]): e["strength"]
+            for e in table("graph_edges").select("*", filters={"user_id": "eq.u1"})
+        }
+        self.assertEqual(edges, {
+            ("Loops", "Arrays"): 0.4,           # existing strength kept
+            ("Loops", "Recursion"): 0.8,        # first occurrence wins
+            ("Recursion", "Graphs, trees"): 0.5,
+        })
+
+    def test_touched_subjects_refreshed(self, update_ctx):
+        apply_graph_update("u1", self.UPDATE)
+        self.assertEqual(sorted(c.args[0] for c in update_ctx.call_args_list), ["CS101", "MATH"])
+
+    def test_empty_update_makes_no_requests(self, _ctx):
+        trace = instrumentation.start_trace("empty")
+        self.assertEqual(apply_graph_update("u1", {}), [])
+        self.assertEqual(trace.round_trips, 0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
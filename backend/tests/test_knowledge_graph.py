@@ -0,0 +1,157 @@
+"""
+Unit tests for the array-backed KnowledgeGraph engine.
+
+Tests: services.knowledge_graph_service.KnowledgeGraph (lookups, CSR
+       neighbours, tier/subject aggregates, subgraph, shortest path),
+       graph_service.get_knowledge_graph caching, and find_study_matches on
+       KnowledgeGraph input (no "General" subject overlap, last row wins for
+       duplicate concept names).
+
+Run from backend/:
+    python -m pytest tests/test_knowledge_graph.py -v
+"""
+import sys
+import os
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import instrumentation
+from services.graph_service import _assemble_graph, get_knowledge_graph
+from services.knowledge_graph_service import KnowledgeGraph
+from services.matching_service import find_study_matches
+from local_backend import LocalBackendTestCase
+
+NODES = [
+    {"id": "a", "concept_name": "Sets", "mastery_score": 0.9, "mastery_tier": "mastered",
+     "subject": "MATH", "times_studied": 4},
+    {"id": "b", "concept_name": "Functions", "mastery_score": 0.5, "mastery_tier": "learning",
+     "subject": "MATH", "times_studied": 2},
+    {"id": "c", "concept_name": "Loops", "mastery_score": 0.2, "mastery_tier": "struggling",
+     "subject": "CS101", "times_studied": 1},
+    {"id": "d", "concept_name": "Recursion", "mastery_score": 0.0, "mastery_tier": "unexplored",
+     "subject": None, "times_studied": 0},
+]
+EDGES = [
+    {"id": "e1", "source_node_id": "a", "target_node_id": "b", "strength": 0.9},
+    {"id": "e2", "source_node_id": "b", "target_node_id": "d", "strength": 0.4},
+    {"id": "e3", "source_node_id": "c", "target_node_id": "d", "strength": 0.6},
+    {"id": "e4", "source_node_id": "a", "target_node_id": "missing", "strength": 0.1},
+]
+
+
+class TestKnowledgeGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.kg = KnowledgeGraph.from_rows("u1", NODES, EDGES)
+
+    def test_lookups(self):
+        kg = self.kg
+        self.assertEqual((len(kg), kg.edge_count), (4, 3))  # dangling e4 dropped
+        self.assertEqual(kg.lookup("Loops"), 2)
+        self.assertIsNone(kg.lookup("Graphs"))
+        self.assertEqual(kg.index_of("d"), 3)
+        self.assertEqual((kg.tier(2), kg.subject(3)), ("struggling", "General"))
+        self.assertIs(kg.names[2], sys.intern("Loops"))
+
+    def test_neighbours(self):
+        kg = self.kg
+        self.assertEqual(kg.successors(0).tolist(), [1])
+        self.assertEqual(sorted(kg.predecessors(3).tolist()), [1, 2])
+        self.assertEqual(kg.neighbors(1).tolist(), [0, 3])
+        src, tgt, weight = kg.edge_arrays()
+        self.assertEqual(list(zip(src.tolist(), tgt.tolist(), weight.tolist())),
+                         [(0, 1, 0.9), (1, 3, 0.4), (2, 3, 0.6)])
+
+    def test_aggregates(self):
+        kg = self.kg
+        self.assertEqual(kg.tier_counts(),
+                         {"unexplored": 1, "struggling": 1, "learning": 1, "mastered": 1})
+        self.assertEqual(kg.subject_names, ["MATH", "CS101", "General"])
+        self.assertEqual([m.tolist() for m in kg.subject_members()], [[0, 1], [2], [3]])
+        counts, scores, studied = kg.subject_totals()
+        self.assertEqual(counts.tolist(), [2, 1, 1])
+        self.assertAlmostEqual(scores[0], 1.4)
+        self.assertEqual(studied.tolist(), [6, 1, 0])
+
+    def test_subgraph(self):
+        sub = self.kg.subgraph([1, 3, 2])
+        self.assertEqual(sub.ids, ["b", "d", "c"])
+        self.assertEqual(sorted(sub.edge_ids), ["e2", "e3"])
+        self.assertEqual(sub.predecessors(sub.index_of("d")).tolist(), [0, 2])
+
+    def test_shortest_path(self):
+        kg = self.kg
+        self.assertEqual(kg.shortest_path(0, 3), [0, 1, 3])
+        self.assertEqual(kg.shortest_path(2, 2), [2])
+        self.assertIsNone(kg.shortest_path(2, 0))
+        self.assertEqual(kg.shortest_path(2, 0, directed=False), [2, 3, 1, 0])
+
+    def test_empty(self):
+        kg = KnowledgeGraph.from_rows("u1", [], [])
+        self.assertEqual((len(kg), kg.subject_members()), (0, []))
+        self.assertEqual(kg.tier_counts()["mastered"], 0)
+
+    def test_round_trips_through_get_graph_payload(self):
+        graph = _assemble_graph("u1", NODES, EDGES, 0, {"HIST"})
+        kg = KnowledgeGraph.from_graph("u1", graph)
+        self.assertEqual(kg.ids, self.kg.ids)
+        self.assertEqual(kg.edge_ids, ["e1", "e2", "e3"])
+        self.assertEqual(graph["stats"]["struggling"], 1)
+
+
+class TestGetKnowledgeGraph(LocalBackendTestCase):
+
+    def test_built_once_per_graph_version(self):
+        self.seed_user("u1")
+        self.seed_node("n1", concept_name="Loops")
+        kg = get_knowledge_graph("u1")
+        trace = instrumentation.start_trace("kg")
+        self.assertIs(get_knowledge_graph("u1"), kg)
+        self.assertEqual(trace.round_trips, 0)
+
+
+class TestMatchingOnKnowledgeGraph(unittest.TestCase):
+
+    def test_same_matches_from_payload_or_engine(self):
+        theirs = [dict(n, mastery_score=1 - n["mastery_score"]) for n in NODES]
+        members = [
+            {"user_id": "u1", "name": "Ada", "graph": _assemble_graph("u1", NODES, EDGES, 0, set())},
+            {"user_id": "u2", "name": "Grace", "graph": _assemble_graph("u2", theirs, [], 0, set())},
+        ]
+        from_payload = find_study_matches("u1", members)
+        engines = [dict(m, graph=KnowledgeGraph.from_graph(m["user_id"], m["graph"])) for m in members]
+        self.assertEqual(find_study_matches("u1", engines), from_payload)
+
+        match = from_payload[0]
+        self.assertEqual([t["concept"] for t in match["you_can_teach"]], ["Sets"])
+        # Biggest mastery gap first
+        self.assertEqual([t["concept"] for t in match["they_can_teach"]], ["Recursion", "Loops"])
+
+    def _match(self, mine, theirs):
+        members = [
+            {"user_id": "u1", "name": "Ada", "graph": KnowledgeGraph.from_rows("u1", mine, [])},
+            {"user_id": "u2", "name": "Grace", "graph": KnowledgeGraph.from_rows("u2", theirs, [])},
+        ]
+        return find_study_matches("u1", members)[0]
+
+    def test_general_is_not_a_shared_subject(self):
+        mine = [{"id": "a", "concept_name": "Sets", "mastery_score": 0.9, "subject": None}]
+        theirs = [{"id": "b", "concept_name": "Loops", "mastery_score": 0.9, "subject": None}]
+        match = self._match(mine, theirs)
+        self.assertNotIn("General", match["summary"])
+        self.assertEqual(match["compatibility_score"], 18)   # no overlap at all: the floor
+
+    def test_duplicate_concept_names_use_the_last_row(self):
+        mine = [
+            {"id": "a1", "concept_name": "Sets", "mastery_score": 0.1, "subject": "MATH"},
+            {"id": "a2", "concept_name": "Sets", "mastery_score": 0.9, "subject": "MATH"},
+        ]
+        theirs = [{"id": "b", "concept_name": "Sets", "mastery_score": 0.2, "subject": "MATH"}]
+        match = self._match(mine, theirs)
+        self.assertEqual(match["you_can_teach"],
+                         [{"concept": "Sets", "your_mastery": 0.9, "their_mastery": 0.2}])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,145 @@
+"""
+Unit tests for the Gemini response cache.
+
+Tests: services.llm_cache_service (key normalization, LRU eviction, TTL, the
+       SQLite disk tier shared across instances, periodic pruning of expired
+       rows, stats), call_gemini and
+       call_gemini_json opt-in caching (only parsed JSON is stored), and
+       parse_syllabus serving a repeated document from the cache.
+
+Run from backend/:
+    python -m pytest tests/test_llm_cache.py -v
+"""
+import sys
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import gemini_service, llm_cache_service
+from services.llm_cache_service import ResponseCache, cache_key
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_key_normalizes_whitespace_only(self):
+        base = cache_key("m", "Summarize:\nAlice\nBob", False, 0.7)
+        self.assertEqual(base, cache_key("m", "  Summarize:   \r\nAlice\nBob\n", False, 0.7))
+        self.assertNotEqual(base, cache_key("m", "Summarize:\nBob\nAlice", False, 0.7))
+        self.assertNotEqual(base, cache_key("m", "Summarize:\nAlice\nBob", True, 0.7))
+        self.assertNotEqual(base, cache_key("m", "Summarize:\nAlice\nBob", False, 0.2))
+        self.assertNotEqual(base, cache_key("other", "Summarize:\nAlice\nBob", False, 0.7))
+
+    def test_lru_eviction_and_stats(self):
+        cache = ResponseCache(maxsize=2, ttl=60, db_path="")
+        cache.put("a", "1")
+        cache.put("b", "2")
+        cache.get("a")           # a is now most recently used
+        cache.put("c", "3")      # evicts b
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), ("1", "3"))
+        stats = cache.stats()
+        self.assertEqual((stats["memory_hits"], stats["misses"], stats["evictions"]), (3, 1, 1))
+        self.assertEqual(stats["hit_rate"], 0.75)
+
+    def test_entries_expire(self):
+        cache = ResponseCache(maxsize=4, ttl=-1, db_path="")
+        cache.put("a", "1")
+        self.assertIsNone(cache.get("a"))
+
+    def test_disk_tier_survives_a_new_process(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "llm_cache.db")
+            ResponseCache(maxsize=4, ttl=60, db_path=path).put("k", "cached reply")
+
+            fresh = ResponseCache(maxsize=4, ttl=60, db_path=path)
+            self.assertEqual(fresh.get("k"), "cached reply")
+            self.assertEqual(fresh.get("k"), "cached reply")
+            self.assertEqual((fresh.disk_hits, fresh.memory_hits), (1, 1))
+
+            expired = ResponseCache(maxsize=4, ttl=-1, db_path=path)
+            expired.put("old", "stale")
+            self.assertIsNone(ResponseCache(maxsize=4, ttl=60, db_path=path).get("old"))
+
+    def test_expired_rows_pruned_periodically(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "llm_cache.db")
+            cache = ResponseCache(maxsize=4, ttl=-1, db_path=path)
+            self.addCleanup(cache._db.close)
+            indexes = {r[1] for r in cache._db.execute("PRAGMA index_list(llm_cache)")}
+            self.assertIn("llm_cache_expires_at", indexes)
+
+            def rows():
+                return cache._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+            with patch.object(llm_cache_service, "PRUNE_EVERY", 3):
+                cache.put("a", "1")
+                cache.put("b", "2")
+                self.assertEqual(rows(), 2)        # not pruned on every put
+                cache.put("c", "3")
+                self.assertEqual(rows(), 0)
+            self.assertEqual(cache.stats()["pruned"], 3)
+
+            cache.put("d", "4")
+            self.assertEqual(ResponseCache(maxsize=4, ttl=60, db_path=path).pruned, 1)  # on open
+
+
+class TestCachedCalls(unittest.TestCase):
+
+    def setUp(self):
+        self.client = MagicMock()
+        self.cache = ResponseCache(maxsize=8, ttl=60, db_path="")
+        self._patches = [
+            patch.object(gemini_service, "_client", self.client),
+            patch.object(llm_cache_service, "get", self.cache.get),
+            patch.object(llm_cache_service, "put", self.cache.put),
+        ]
+        for p in self._patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self._patches:
+            p.stop()
+
+    def test_opt_in_per_call(self):
+        self.client.models.generate_content.return_value = MagicMock(text="summary")
+        for _ in range(3):
+            self.assertEqual(gemini_service.call_gemini("room", cache=True), "summary")
+        gemini_service.call_gemini("room")
+        self.assertEqual(self.client.models.generate_content.call_count, 2)
+
+    def test_invalid_json_is_not_cached(self):
+        self.client.models.generate_content.side_effect = [
+            MagicMock(text="not json"), MagicMock(text='{"questions": [1]}'),
+        ]
+        with self.assertRaises(ValueError):
+            gemini_service.call_gemini_json("quiz", cache=True)
+        self.assertEqual(gemini_service.call_gemini_json("quiz", cache=True), {"questions": [1]})
+        self.assertEqual(gemini_service.call_gemini_json("quiz", cache=True), {"questions": [1]})
+        self.assertEqual(self.client.models.generate_content.call_count, 2)
+
+    def test_parse_syllabus_reuses_result(self):
+        from services.calendar_service import parse_syllabus
+
+        self.client.models.generate_content.return_value = MagicMock(text='{"assignments": []}')
+        self.assertEqual(parse_syllabus("CS101 syllabus"), {"assignments": []})
+        self.assertEqual(parse_syllabus("CS101 syllabus"), {"assignments": []})
+        self.assertEqual(self.client.models.generate_content.call_count, 1)
+        self.assertEqual(self.cache.memory_hits, 1)
+
+
+@patch("routes.debug.DEBUG_ENDPOINTS", True)
+class TestDebugRoute(unittest.TestCase):
+
+    def test_reports_cache_stats(self):
+        from fastapi.testclient import TestClient
+        import main
+
+        body = TestClient(main.app).get("/api/debug/llm-cache").json()
+        self.assertEqual(body, llm_cache_service.stats())
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,163 @@
+"""
+Unit tests for the SQLite-backed PostgREST stand-in.
+
+Tests: db.local_postgrest (schema translation, filter operators, ordering,
+       upserts, representation) driven through db.connection.table(), and
+       re-running the schema over duplicate graph edges.
+
+Run from backend/:
+    python -m pytest tests/test_local_postgrest.py -v
+"""
+import sys
+import os
+import unittest
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.connection import table
+from db.local_postgrest import SCHEMA_PATH, translate_schema
+from local_backend import LocalBackendTestCase
+
+
+class TestLocalPostgrestFilters(LocalBackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seed_user("u1", "Ada")
+        self.seed_user("u2", "Grace")
+        self.seed_node("n1", concept_name="Loops", mastery_score=0.9, mastery_tier="mastered")
+        self.seed_node("n2", concept_name="Recursion", mastery_score=0.2, mastery_tier="struggling")
+        self.seed_node("n3", concept_name="Proofs", subject="MATH", mastery_score=0.5, mastery_tier="learning")
+        self.seed_node("n4", user_id="u2", concept_name="Loops", mastery_score=0.4, mastery_tier="struggling")
+
+    def _ids(self, rows):
+        return sorted(r["id"] for r in rows)
+
+    def test_eq_and_columns(self):
+        rows = table("graph_nodes").select("id,concept_name", filters={"user_id": "eq.u2"})
+        self.assertEqual(rows, [{"id": "n4", "concept_name": "Loops"}])
+
+    def test_in_and_not_in(self):
+        rows = table("graph_nodes").select("id", filters={"id": "in.(n1,n3)"})
+        self.assertEqual(self._ids(rows), ["n1", "n3"])
+        rows = table("users").select("id", filters={"id": "not.in.(u1)"})
+        self.assertEqual(self._ids(rows), ["u2"])
+
+    def test_gte_and_numeric_comparison(self):
+        rows = table("graph_nodes").select("id", filters={"mastery_score": "gte.0.5"})
+        self.assertEqual(self._ids(rows), ["n1", "n3"])
+
+    def test_is_null(self):
+        table("graph_nodes").update({"last_studied_at": "2026-01-01T00:00:00"}, filters={"id": "eq.n1"})
+        rows = table("graph_nodes").select("id", filters={"last_studied_at": "is.null", "user_id": "eq.u1"})
+        self.assertEqual(self._ids(rows), ["n2", "n3"])
+
+    def test_order_and_limit(self):
+        rows = table("graph_nodes").select(
+            "concept_name",
+            filters={"user_id": "eq.u1", "mastery_tier": "in.(struggling,learning,unexplored)"},
+            order="mastery_score.asc",
+            limit=1,
+        )
+        self.assertEqual(rows, [{"concept_name": "Recursion"}])
+        rows = table("graph_nodes").select("id", filters={"user_id": "eq.u1"}, order="mastery_score.desc")
+        self.assertEqual([r["id"] for r in rows], ["n1", "n3", "n2"])
+
+    def test_unknown_table_is_404(self):
+        with self.assertRaises(httpx.HTTPStatusError) as ctx:
+            table("nope").select()
+        self.assertEqual(ctx.exception.response.status_code, 404)
+
+
+class TestLocalPostgrestWrites(LocalBackendTestCase):
+
+    def test_insert_returns_representation_with_defaults(self):
+        self.seed_user("u1")
+        rows = table("graph_nodes").insert({"id": "n1", "user_id": "u1", "concept_name": "Loops"})
+        self.assertEqual(rows[0]["mastery_tier"], "unexplored")
+        self.assertEqual(rows[0]["times_studied"], 0)
+        self.assertTrue(rows[0]["created_at"])
+
+    def test_jsonb_round_trip(self):
+        self.seed_user("u1")
+        table("sessions").insert({"id": "s1", "user_id": "u1", "mode": "socratic", "topic": "Loops"})
+        table("messages").insert({
+            "id": "m1", "session_id": "s1", "role": "assistant", "content": "hi",
+            "graph_update_json": {"new_nodes": [{"concept_name": "Loops"}]},
+        })
+        rows = table("messages").select("graph_update_json", filters={"id": "eq.m1"})
+        self.assertEqual(rows[0]["graph_update_json"], {"new_nodes": [{"concept_name": "Loops"}]})
+
+    def test_upsert_on_conflict_merges(self):
+        self.seed_user("u1")
+        table("course_context").upsert(
+            {"course_name": "CS101", "context_json": {"v": 1}, "student_count": 1},
+            on_conflict="course_name",
+        )
+        rows = table("course_context").upsert(
+            {"course_name": "CS101", "context_json": {"v": 2}, "student_count": 3},
+            on_conflict="course_name",
+        )
+        self.assertEqual(rows[0]["student_count"], 3)
+        self.assertEqual(len(table("course_context").select()), 1)
+
+    def test_composite_on_conflict(self):
+        self.seed_user("u1")
+        self.seed_node("n1")
+        for ctx in ({"a": 1}, {"a": 2}):
+            table("quiz_context").upsert(
+                {"user_id": "u1", "concept_node_id": "n1", "context_json": ctx},
+                on_conflict="user_id,concept_node_id",
+            )
+        rows = table("quiz_context").select("context_json")
+        self.assertEqual(rows, [{"context_json": {"a": 2}}])
+
+    def test_unique_violation_is_409(self):
+        self.seed_user("u1")
+        with self.assertRaises(httpx.HTTPStatusError) as ctx:
+            self.seed_user("u1")
+        self.assertEqual(ctx.exception.response.status_code, 409)
+
+    def test_foreign_keys_enforced(self):
+        with self.assertRaises(httpx.HTTPStatusError):
+            self.seed_node("n1", user_id="ghost")
+
+    def test_schema_rerun_keeps_oldest_duplicate_edge(self):
+        self.seed_user("u1")
+        self.seed_node("n1")
+        self.seed_node("n2")
+        # A database from before the (source, target) unique index
+        self.db.query("DROP INDEX graph_edges_source_target_key")
+        table("graph_edges").insert([
+            {"id": "a", "user_id": "u1", "source_node_id": "n1", "target_node_id": "n2",
+             "strength": 0.1, "created_at": "2026-01-02T00:00:00"},
+            {"id": "b", "user_id": "u1", "source_node_id": "n1", "target_node_id": "n2",
+             "strength": 0.2, "created_at": "2026-01-01T00:00:00"},
+            {"id": "c", "user_id": "u1", "source_node_id": "n2", "target_node_id": "n1",
+             "created_at": "2026-01-03T00:00:00"},
+        ])
+        with open(SCHEMA_PATH) as f:
+            for statement in translate_schema(f.read()).split(";"):
+                if statement.strip():
+                    self.db.query(statement)
+        self.assertEqual(sorted(r["id"] for r in table("graph_edges").select("id")), ["b", "c"])
+        pair_indexes = [
+            i["name"] for i in self.db.query("PRAGMA index_list(graph_edges)")
+            if [c["name"] for c in self.db.query(f"PRAGMA index_info('{i['name']}')")]
+            == ["source_node_id", "target_node_id"]
+        ]
+        self.assertEqual(pair_indexes, ["graph_edges_source_target_key"])
+
+    def test_delete_returns_deleted_rows(self):
+        self.seed_user("u1")
+        self.seed_node("n1")
+        self.seed_node("n2")
+        rows = table("graph_nodes").delete({"id": "in.(n1,n2)"})
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(table("graph_nodes").select(), [])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
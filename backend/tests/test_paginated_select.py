@@ -0,0 +1,78 @@
+"""
+Unit tests for SupabaseTable.select_iter (Range-header pagination).
+
+Tests: paging through the local SQLite stand-in, max-rows truncation,
+       async iteration, and the get_students caller.
+
+Run from backend/:
+    python -m pytest tests/test_paginated_select.py -v
+"""
+import sys
+import os
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import connection, instrumentation
+from db.connection import async_table, table
+from local_backend import LocalBackendTestCase
+
+
+class TestSelectIter(LocalBackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seed_user("u1")
+        for i in range(10):
+            self.seed_node(f"n{i:02d}", concept_name=f"C{i}", mastery_score=i / 10)
+
+    def test_yields_all_rows_in_order(self):
+        ids = [r["id"] for r in table("graph_nodes").select_iter("id", page_size=3)]
+        self.assertEqual(ids, [f"n{i:02d}" for i in range(10)])
+
+    def test_page_count(self):
+        trace = instrumentation.start_trace("paging")
+        list(table("graph_nodes").select_iter("id", page_size=5))
+        # two full pages, then one request past the end to confirm
+        self.assertEqual(trace.round_trips, 3)
+
+    def test_filters_and_custom_order(self):
+        rows = table("graph_nodes").select_iter(
+            "concept_name", filters={"mastery_score": "gte.0.5"},
+            order="mastery_score.desc", page_size=2,
+        )
+        self.assertEqual([r["concept_name"] for r in rows], ["C9", "C8", "C7", "C6", "C5"])
+
+    def test_not_truncated_by_server_max_rows(self):
+        connection.use_local_backend(":memory:", max_rows=4)
+        self.seed_user("u1")
+        for i in range(10):
+            self.seed_node(f"m{i}")
+        self.assertEqual(len(table("graph_nodes").select()), 4)
+        self.assertEqual(len(list(table("graph_nodes").select_iter("id", page_size=100))), 10)
+
+    def test_async_iteration(self):
+        async def collect():
+            return [r["id"] async for r in async_table("graph_nodes").select_iter("id", page_size=4)]
+
+        self.assertEqual(len(asyncio.run(collect())), 10)
+
+
+class TestGetStudentsStreaming(LocalBackendTestCase):
+
+    def test_top_concepts_and_counts(self):
+        self.seed_user("u1", "Ada")
+        for i, score in enumerate([0.8, 0.95, 0.9, 0.76, 0.85]):
+            self.seed_node(f"m{i}", concept_name=f"M{i}", mastery_score=score, mastery_tier="mastered")
+        self.seed_node("s1", concept_name="S", mastery_score=0.2, mastery_tier="struggling")
+
+        from routes.social import get_students
+        student = get_students()["students"][0]
+        self.assertEqual(student["stats"]["total"], 6)
+        self.assertEqual(student["stats"]["mastered"], 5)
+        self.assertEqual(student["top_concepts"], ["M1", "M2", "M4", "M0"])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
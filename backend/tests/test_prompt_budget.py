@@ -0,0 +1,174 @@
+"""
+Unit tests for prompt token budgets.
+
+Tests: services.prompt_budget_service.PromptBudget (sections within budget
+       unchanged, graph compaction, relevance-ordered dropping of concepts,
+       summarizing old turns, shared-context trimming, message truncation,
+       reports), and the chat route fitting a long session into its budget.
+
+Run from backend/:
+    python -m pytest tests/test_prompt_budget.py -v
+"""
+import sys
+import os
+import json
+import unittest
+from unittest.mock import AsyncMock, patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.connection import table
+from services.prompt_budget_service import PromptBudget, estimate_tokens, recent_reports
+from local_backend import LocalBackendTestCase
+
+
+def _node(i: int, **overrides) -> dict:
+    node = {
+        "id": f"n{i}", "user_id": "u1", "concept_name": f"Concept {i}",
+        "mastery_score": 0.9, "mastery_tier": "mastered", "subject": "MATH200",
+        "times_studied": 1, "last_studied_at": None,
+    }
+    node.update(overrides)
+    return node
+
+
+def _graph(n: int) -> dict:
+    nodes = [_node(i) for i in range(n)]
+    nodes[7].update(concept_name="Recursion", subject="CS101", mastery_tier="learning")
+    nodes[8].update(concept_name="Stacks", subject="CS101")
+    nodes[9].update(concept_name="Heaps", subject="CS101", mastery_tier="struggling")
+    edges = [{"id": "e1", "source": "n7", "target": "n8", "strength": 0.5}]
+    root = {**_node(999), "id": "subject_root__CS101", "is_subject_root": True,
+            "mastery_tier": "subject_root"}
+    return {"nodes": nodes + [root], "edges": edges, "stats": {"total_nodes": n}, "version": 3}
+
+
+class TestGraphSection(unittest.TestCase):
+
+    def test_small_graph_unchanged(self):
+        graph = _graph(10)
+        budget = PromptBudget("t")
+        self.assertEqual(budget.graph(graph), json.dumps(graph, indent=2))
+        self.assertEqual(budget.sections["graph"]["steps"], [])
+
+    def test_compacted_before_anything_is_dropped(self):
+        graph = _graph(40)
+        full = estimate_tokens(json.dumps(graph, indent=2))
+        budget = PromptBudget("t", graph=full - 1)
+        compact = json.loads(budget.graph(graph))
+        self.assertEqual(budget.sections["graph"]["steps"], ["compact"])
+        self.assertEqual(len(compact["concepts"]), 40)           # subject root left out
+        self.assertEqual(compact["edges"], [["Recursion", "Stacks"]])
+        self.assertLess(budget.sections["graph"]["tokens"], full // 2)
+
+    def test_least_relevant_concepts_dropped_first(self):
+        budget = PromptBudget("t", graph=120)
+        text = budget.graph(_graph(200), focus=("recursion",), course="CS101")
+        self.assertLessEqual(estimate_tokens(text), 120)
+        compact = json.loads(text)
+        kept = [c[0] for c in compact["concepts"]]
+        # topic, its neighbour, then the weakest concept of the course
+        self.assertEqual(kept[:3], ["Recursion", "Stacks", "Heaps"])
+        self.assertLess(len(kept), 200)
+        self.assertEqual(compact["omitted_concepts"], 200 - len(kept))
+        self.assertIn("dropped", budget.sections["graph"]["steps"][1])
+
+
+class TestHistorySection(unittest.TestCase):
+
+    def _history(self, n: int) -> list:
+        return [
+            {"role": "user" if i % 2 == 0 else "assistant",
+             "content": f"Message {i} first sentence. " + "More detail here. " * 30}
+            for i in range(n)
+        ]
+
+    def test_short_history_verbatim(self):
+        history = self._history(4)
+        text = PromptBudget("t").history(history)
+        self.assertTrue(text.startswith("Student: Message 0"))
+        self.assertEqual(text.count("More detail"), 120)
+
+    def test_old_turns_summarized(self):
+        budget = PromptBudget("t", history=1200)
+        text = budget.history(self._history(30))
+        self.assertLessEqual(estimate_tokens(text), 1200)
+        self.assertIn("EARLIER IN THIS SESSION", text)
+        self.assertIn("- Sapling: Message 23 first sentence.", text)
+        self.assertTrue(text.rstrip().endswith("More detail here."))
+        self.assertIn("Sapling: Message 29 first sentence. More detail", text)
+        self.assertEqual(budget.sections["history"]["steps"][0], "summarized 24 older messages")
+
+    def test_oldest_extracts_omitted_when_still_too_long(self):
+        budget = PromptBudget("t", history=700)
+        text = budget.history(self._history(200))
+        self.assertLessEqual(estimate_tokens(text), 700)
+        self.assertIn("earliest omitted", text)
+        self.assertNotIn("Message 0 first", text)
+
+
+class TestOtherSections(unittest.TestCase):
+
+    def test_shared_context_lists_trimmed(self):
+        ctx = {"common_misconceptions": [f"misconception {i}" for i in range(200)],
+               "student_count": 12}
+        budget = PromptBudget("t", shared=100)
+        trimmed = json.loads(budget.shared(ctx))
+        self.assertEqual(trimmed["student_count"], 12)
+        self.assertEqual(trimmed["common_misconceptions"][0], "misconception 0")
+        self.assertLess(len(trimmed["common_misconceptions"]), 200)
+        self.assertEqual(budget.sections["shared"]["steps"], ["compact", "trimmed lists"])
+
+    def test_message_truncated(self):
+        budget = PromptBudget("t", message=50)
+        text = budget.message("start " + "x" * 1000 + " end")
+        self.assertLessEqual(estimate_tokens(text), 50)
+        self.assertTrue(text.startswith("start") and text.endswith("end"))
+
+    def test_report(self):
+        budget = PromptBudget("chat")
+        prompt = budget.message("hello") + "\n\nSapling:"
+        entry = budget.report(prompt, system_prefix="x" * 400)
+        self.assertEqual(entry["sections"]["preamble"]["tokens"], 100)
+        self.assertEqual(entry["total_tokens"], 100 + estimate_tokens(prompt))
+        self.assertIs(recent_reports()[0], entry)
+
+
+@patch("services.course_context_service.update_course_context")
+class TestChatRouteBudget(LocalBackendTestCase):
+
+    def test_long_session_fits_and_is_reported(self, _ctx):
+        from fastapi.testclient import TestClient
+        import main
+
+        self.seed_user("u1")
+        for i in range(150):
+            self.seed_node(f"n{i}", concept_name=f"Concept {i}", subject="CS101")
+        table("sessions").insert({"id": "s1", "user_id": "u1", "mode": "socratic", "topic": ""})
+        table("messages").insert([
+            {"id": f"m{i}", "session_id": "s1", "role": "user" if i % 2 == 0 else "assistant",
+             "content": f"Turn {i}. " + "words " * 200, "created_at": f"2026-01-01T00:{i:02d}:00"}
+            for i in range(60)
+        ])
+
+        with patch("routes.learn.call_gemini_async", new_callable=AsyncMock,
+                   return_value="Good.") as gemini:
+            response = TestClient(main.app).post("/api/learn/chat", json={
+                "session_id": "s1", "user_id": "u1", "message": "Next?", "mode": "socratic",
+            })
+        self.assertEqual(response.status_code, 200)
+        prompt = gemini.await_args.args[0]
+        self.assertIn("EARLIER IN THIS SESSION", prompt)
+        self.assertLess(estimate_tokens(prompt), 4000 + 4000 + 1000)
+
+        report = recent_reports()[0]
+        self.assertEqual(report["label"], "chat")
+        self.assertEqual(set(report["sections"]), {"graph", "history", "message", "preamble"})
+        self.assertEqual(report["sections"]["graph"]["steps"][0], "compact")
+        with patch("routes.debug.DEBUG_ENDPOINTS", True):
+            debug = TestClient(main.app).get("/api/debug/prompts").json()
+        self.assertEqual(debug["prompts"][0]["label"], "chat")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,208 @@
+"""
+Unit tests for cached system-prompt prefixes.
+
+Tests: services.prompt_cache_service.PrefixCache (one cache per prefix,
+       concurrent first requests sharing one create, refresh before expiry,
+       inline fallback after a failed create, prefixes below the model's
+       minimum sent inline without a create), cache creation admitted by the
+       rate limiter,
+       call_gemini_async with system_prefix (cached_content vs inline system
+       instruction, recovery from a cache Gemini no longer knows), and the
+       learn routes sending the static prefix for their mode.
+
+Run from backend/:
+    python -m pytest tests/test_prompt_cache.py -v
+"""
+import sys
+import os
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.connection import table
+from services import gemini_service, prompt_cache_service
+from services.prompt_cache_service import LocalCacheBackend, PrefixCache
+from local_backend import LocalBackendTestCase
+
+
+class FailingBackend:
+    async def create(self, prefix, ttl, label):
+        raise RuntimeError("400 Cached content is too small")
+
+
+class TestPrefixCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.backend = LocalCacheBackend()
+        self.cache = PrefixCache(self.backend, ttl=600, enabled=True, min_tokens=0,
+                                 clock=lambda: self.now)
+
+    def _get(self, prefix, label="socratic"):
+        return asyncio.run(self.cache.get(prefix, label))
+
+    def test_one_cache_per_prefix(self):
+        first = self._get("socratic rules")
+        self.assertEqual(self._get("socratic rules"), first)
+        self.assertNotEqual(self._get("expository rules", "expository"), first)
+        self.assertEqual(self.backend.contents[first], "socratic rules")
+        stats = self.cache.stats()
+        self.assertEqual((stats["created"], stats["hits"]), (2, 1))
+
+    def test_refreshed_before_expiry(self):
+        first = self._get("socratic rules")
+        self.now = 600 - 61
+        self.assertEqual(self._get("socratic rules"), first)
+        self.now = 600 - 59   # inside the refresh margin
+        second = self._get("socratic rules")
+        self.assertNotEqual(second, first)
+        self.assertEqual(self.cache.stats()["refreshed"], 1)
+
+    def test_failed_create_falls_back_inline_then_retries(self):
+        self.cache.backend = FailingBackend()
+        with self.assertLogs("sapling.prompts", "WARNING"):
+            self.assertIsNone(self._get("short prefix"))
+            self.assertIsNone(self._get("short prefix"))
+            self.assertEqual(self.cache.stats()["failures"], 1)   # not retried on every call
+            self.cache.backend = self.backend
+            self.now = 301
+            self.assertIsNotNone(self._get("short prefix"))
+
+    def test_concurrent_first_requests_share_one_create(self):
+        calls = []
+
+        class SlowBackend(LocalCacheBackend):
+            async def create(self, prefix, ttl, label):
+                calls.append(label)
+                await asyncio.sleep(0.01)
+                return await super().create(prefix, ttl, label)
+
+        self.cache.backend = SlowBackend()
+
+        async def run():
+            return await asyncio.gather(*(self.cache.get("socratic rules", "socratic") for _ in range(5)))
+
+        names = asyncio.run(run())
+        self.assertEqual(calls, ["socratic"])
+        self.assertEqual(len(set(names)), 1)
+        self.assertIsNotNone(names[0])
+        self.assertEqual(self.cache.stats()["joined"], 4)
+
+    def test_prefix_below_minimum_sent_inline(self):
+        self.cache.min_tokens = 1024
+        self.cache.backend = FailingBackend()
+        with self.assertNoLogs("sapling.prompts", "WARNING"):
+            self.assertIsNone(self._get("x" * 4000))        # ~1000 tokens
+        self.assertEqual(self.cache.stats()["too_small"], 1)
+        self.assertEqual(self.cache.stats()["failures"], 0)
+        self.cache.backend = self.backend
+        self.assertIsNotNone(self._get("x" * 4100))
+
+    def test_disabled(self):
+        self.cache.enabled = False
+        self.assertIsNone(self._get("socratic rules"))
+
+
+class TestPrefixedCalls(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = LocalCacheBackend()
+        self.client = MagicMock()
+        self.client.aio.models.generate_content = AsyncMock(return_value=MagicMock(text="reply"))
+        self._patches = [patch.object(gemini_service, "_client", self.client),
+                         patch.object(prompt_cache_service._cache, "min_tokens", 0)]
+        for p in self._patches:
+            p.start()
+        prompt_cache_service.set_backend(self.backend)
+
+    def tearDown(self):
+        for p in self._patches:
+            p.stop()
+        prompt_cache_service.set_backend(gemini_service._CachedContentBackend())
+
+    def _call(self):
+        return asyncio.run(gemini_service.call_gemini_async(
+            "STUDENT CONTEXT ...", system_prefix="You are Sapling ...", prefix_label="socratic",
+        ))
+
+    def _configs(self):
+        return [c.kwargs["config"] for c in self.client.aio.models.generate_content.call_args_list]
+
+    def test_prefix_sent_as_cached_content(self):
+        self._call()
+        self._call()
+        configs = self._configs()
+        self.assertEqual(len(self.backend.contents), 1)
+        self.assertEqual({c.cached_content for c in configs}, set(self.backend.contents))
+        self.assertIsNone(configs[0].system_instruction)
+        call = self.client.aio.models.generate_content.call_args
+        self.assertEqual(call.kwargs["contents"], "STUDENT CONTEXT ...")
+
+    def test_inline_when_caching_unavailable(self):
+        prompt_cache_service.set_backend(FailingBackend())
+        with self.assertLogs("sapling.prompts", "WARNING"):
+            self.assertEqual(self._call(), "reply")
+        (config,) = self._configs()
+        self.assertIsNone(config.cached_content)
+        self.assertEqual(config.system_instruction, "You are Sapling ...")
+
+    def test_create_goes_through_rate_limiter(self):
+        prompt_cache_service.set_backend(gemini_service._CachedContentBackend())
+        cached = MagicMock()
+        cached.name = "cachedContents/x"
+        self.client.aio.caches.create = AsyncMock(return_value=cached)
+        with patch.object(gemini_service.limiter, "acquire_async", new_callable=AsyncMock) as acquire:
+            self._call()
+        # one admission for the create (as chat), one for the generation
+        self.assertEqual(sorted(c.args for c in acquire.await_args_list),
+                         [(gemini_service.CHAT,), (gemini_service.QUIZ,)])
+        self.client.aio.caches.create.assert_awaited_once()
+
+    def test_expired_cache_is_recreated(self):
+        self.client.aio.models.generate_content.side_effect = [
+            RuntimeError("403 PERMISSION_DENIED. CachedContent not found (or permission denied)"),
+            MagicMock(text="reply"),
+        ]
+        self.assertEqual(self._call(), "reply")
+        first, second = self._configs()
+        self.assertNotEqual(first.cached_content, second.cached_content)
+        self.assertEqual(len(self.backend.contents), 2)
+
+
+async def _agen(items):
+    for item in items:
+        yield item
+
+
+@patch("services.course_context_service.update_course_context")
+class TestLearnRoutesSendPrefix(LocalBackendTestCase):
+
+    def test_chat_sends_static_prefix_for_mode(self, _ctx):
+        from fastapi.testclient import TestClient
+        from routes.learn import STATIC_PROMPTS
+        import main
+
+        self.seed_user("u1")
+        table("sessions").insert({"id": "s1", "user_id": "u1", "mode": "teachback", "topic": ""})
+        calls = []
+
+        def fake_stream(prompt, **kwargs):
+            calls.append((prompt, kwargs))
+            return _agen(["Explain it back to me."])
+
+        with patch("routes.learn.stream_gemini_async", side_effect=fake_stream):
+            TestClient(main.app).post(
+                "/api/learn/chat", params={"stream": "true"},
+                json={"session_id": "s1", "user_id": "u1", "message": "Hi", "mode": "teachback"},
+            )
+        ((prompt, kwargs),) = calls
+        self.assertEqual(kwargs["system_prefix"], STATIC_PROMPTS["teachback"])
+        self.assertEqual(kwargs["prefix_label"], "teachback")
+        self.assertNotIn("MODE:", prompt)
+        self.assertIn("STUDENT CONTEXT", prompt)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
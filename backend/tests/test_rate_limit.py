@@ -0,0 +1,178 @@
+"""
+Unit tests for Gemini admission control.
+
+Tests: services.rate_limit_service.RateLimiter (burst then refill, priority
+       ordering of queued callers, queue timeout vs cancellation, penalize on
+       429, stats), backoff_delay, call_gemini retries (one by default,
+       backoff, 429 penalty, no retry on other errors) and GET
+       /api/debug/gemini.
+
+Run from backend/:
+    python -m pytest tests/test_rate_limit.py -v
+"""
+import sys
+import os
+import asyncio
+import unittest
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import gemini_service, rate_limit_service
+from services.rate_limit_service import (
+    BACKGROUND, CHAT, QUIZ, GeminiBusyError, RateLimiter, backoff_delay,
+)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_burst_then_refill(self):
+        limiter = RateLimiter(rpm=1200, burst=2)  # one token per 50ms
+        self.assertLess(limiter.acquire(), 0.01)
+        self.assertLess(limiter.acquire(), 0.01)
+        waited = limiter.acquire()
+        self.assertGreater(waited, 0.03)
+        self.assertLess(waited, 0.5)
+
+    def test_higher_priority_admitted_first(self):
+        limiter = RateLimiter(rpm=1200, burst=1)
+        limiter.acquire()  # bucket now empty: everyone below has to queue
+        order = []
+
+        async def call(priority, name):
+            await limiter.acquire_async(priority)
+            order.append(name)
+
+        async def run():
+            await asyncio.gather(call(BACKGROUND, "summary"), call(QUIZ, "quiz"),
+                                 call(BACKGROUND, "context"), call(CHAT, "chat"))
+        asyncio.run(run())
+        self.assertEqual(order, ["chat", "quiz", "summary", "context"])
+
+    def test_threads_and_coroutines_share_the_queue(self):
+        limiter = RateLimiter(rpm=1200, burst=1)
+        limiter.acquire()
+        order = []
+
+        def background():
+            limiter.acquire(BACKGROUND)
+            order.append("background")
+
+        async def chat():
+            await asyncio.sleep(0.01)  # queued after the thread
+            await limiter.acquire_async(CHAT)
+            order.append("chat")
+
+        async def run():
+            await asyncio.gather(asyncio.to_thread(background), chat())
+        asyncio.run(run())
+        self.assertEqual(order, ["chat", "background"])
+
+    def test_queue_timeout(self):
+        limiter = RateLimiter(rpm=1, burst=1)
+        limiter.acquire()
+        with self.assertRaises(GeminiBusyError):
+            limiter.acquire(BACKGROUND, timeout=0.05)
+        stats = limiter.stats()
+        self.assertEqual(stats["queue_depth"]["background"], 0)
+        self.assertEqual(stats["classes"]["background"]["timeouts"], 1)
+        self.assertEqual(stats["classes"]["background"]["admitted"], 0)
+
+    def test_cancelled_waiter_is_not_a_timeout(self):
+        limiter = RateLimiter(rpm=1, burst=1)
+        limiter.acquire()
+
+        async def run():
+            waiter = asyncio.create_task(limiter.acquire_async(CHAT, timeout=30))
+            await asyncio.sleep(0.02)
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+        asyncio.run(run())
+        chat = limiter.stats()["classes"]["chat"]
+        self.assertEqual((chat["cancelled"], chat["timeouts"]), (1, 0))
+        self.assertEqual(limiter.stats()["queue_depth"]["chat"], 0)
+
+    def test_default_retries_unchanged(self):
+        with patch.object(gemini_service, "_client") as client, \
+             patch.object(gemini_service.time, "sleep"), \
+             patch.object(gemini_service, "limiter", RateLimiter(rpm=6000, burst=10)):
+            client.models.generate_content.side_effect = RuntimeError("500 internal")
+            with self.assertRaises(RuntimeError):
+                gemini_service.call_gemini("p")
+        self.assertEqual(client.models.generate_content.call_count, 2)
+
+    def test_penalize_empties_bucket(self):
+        limiter = RateLimiter(rpm=60, burst=5)
+        limiter.penalize()
+        stats = limiter.stats()
+        self.assertLess(stats["tokens"], 1)
+        self.assertEqual(stats["penalties"], 1)
+        self.assertEqual(set(stats["classes"]), {"chat", "quiz", "background"})
+
+    def test_backoff_is_jittered_and_capped(self):
+        with patch.object(rate_limit_service, "BACKOFF_CAP", 5.0):
+            delays = [backoff_delay(10) for _ in range(50)]
+        self.assertTrue(all(0 <= d <= 5.0 for d in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+
+class TestCallGeminiRetries(unittest.TestCase):
+
+    def setUp(self):
+        self.limiter = RateLimiter(rpm=6000, burst=10)
+        self.sleeps = []
+        self._patches = [
+            patch.object(gemini_service, "limiter", self.limiter),
+            patch.object(gemini_service, "backoff_delay", side_effect=lambda attempt: attempt + 1),
+            patch.object(gemini_service.time, "sleep", side_effect=self.sleeps.append),
+        ]
+        for p in self._patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self._patches:
+            p.stop()
+
+    def _client(self, side_effect):
+        client = MagicMock()
+        client.models.generate_content.side_effect = side_effect
+        return patch.object(gemini_service, "_client", client), client
+
+    def test_backs_off_exponentially_and_penalizes_429(self):
+        patched, client = self._client([RuntimeError("429 quota"), RuntimeError("500 internal"),
+                                        MagicMock(text="ok")])
+        with patched:
+            self.assertEqual(gemini_service.call_gemini("p", retries=2, priority=BACKGROUND), "ok")
+        self.assertEqual(self.sleeps, [1, 2])
+        self.assertEqual(self.limiter.penalties, 1)
+        self.assertEqual(self.limiter.stats()["classes"]["background"]["admitted"], 3)
+
+    def test_gives_up_after_retries(self):
+        patched, client = self._client(RuntimeError("429 quota"))
+        with patched, self.assertRaises(RuntimeError):
+            gemini_service.call_gemini("p", retries=2)
+        self.assertEqual(client.models.generate_content.call_count, 3)
+
+    def test_other_errors_are_not_retried(self):
+        patched, client = self._client(ValueError("bad request"))
+        with patched, self.assertRaises(ValueError):
+            gemini_service.call_gemini("p")
+        self.assertEqual(self.sleeps, [])
+        self.assertEqual(self.limiter.penalties, 0)
+
+
+@patch("routes.debug.DEBUG_ENDPOINTS", True)
+class TestDebugRoute(unittest.TestCase):
+
+    def test_reports_limiter_stats(self):
+        from fastapi.testclient import TestClient
+        import main
+
+        body = TestClient(main.app).get("/api/debug/gemini").json()
+        self.assertEqual(set(body["queue_depth"]), {"chat", "quiz", "background"})
+        self.assertIn("avg_wait", body["classes"]["chat"])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,145 @@
+"""
+Unit tests for the graph-aware recommendation engine.
+
+Tests: services.recommendation_service.rank (prerequisite readiness,
+       centrality, staleness, mastered concepts excluded, large graphs) and
+       pagerank; services.graph_service.get_recommendations caching per graph
+       version.
+
+Run from backend/:
+    python -m pytest tests/test_recommendations.py -v
+"""
+import sys
+import os
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import instrumentation
+from db.connection import table
+from services import recommendation_service
+from services.graph_service import apply_graph_update, get_recommendations
+from services.knowledge_graph_service import KnowledgeGraph
+from local_backend import LocalBackendTestCase
+
+NOW = datetime(2026, 3, 31, tzinfo=timezone.utc)
+
+
+def _node(node_id, score=0.0, tier="unexplored", last_studied=None, subject="CS101"):
+    return {"id": node_id, "user_id": "u1", "concept_name": node_id.title(), "mastery_score": score,
+            "mastery_tier": tier, "subject": subject, "times_studied": 0,
+            "last_studied_at": last_studied}
+
+
+def _edge(src, tgt, strength=0.5):
+    return {"id": f"{src}-{tgt}", "source_node_id": src, "target_node_id": tgt, "strength": strength}
+
+
+def _rank(nodes, edges=()):
+    return recommendation_service.rank(KnowledgeGraph.from_rows("u1", nodes, list(edges)), now=NOW)
+
+
+class TestPageRank(unittest.TestCase):
+
+    def test_cycle_is_uniform(self):
+        src, tgt = np.array([0, 1, 2]), np.array([1, 2, 0])
+        rank = recommendation_service.pagerank(3, src, tgt, np.ones(3))
+        np.testing.assert_allclose(rank, [1 / 3] * 3)
+
+    def test_sums_to_one_with_dangling_nodes(self):
+        src, tgt = np.array([0, 1, 3]), np.array([2, 2, 2])
+        rank = recommendation_service.pagerank(4, src, tgt, np.array([1.0, 0.5, 0.2]))
+        self.assertAlmostEqual(rank.sum(), 1.0)
+        self.assertEqual(int(rank.argmax()), 2)
+
+
+class TestRank(unittest.TestCase):
+
+    def test_prerequisites_come_first(self):
+        recs = _rank([_node("calculus"), _node("limits")], [_edge("limits", "calculus")])
+        self.assertEqual([r["id"] for r in recs], ["limits", "calculus"])
+
+    def test_mastered_prerequisite_unlocks_dependent(self):
+        nodes = [_node("limits", 0.9, "mastered"), _node("calculus"),
+                 _node("proofs"), _node("topology")]
+        recs = _rank(nodes, [_edge("limits", "calculus", 1.0), _edge("proofs", "topology", 1.0)])
+        ids = [r["id"] for r in recs]
+        self.assertNotIn("limits", ids)
+        self.assertLess(ids.index("calculus"), ids.index("topology"))
+        self.assertEqual(ids[-1], "topology")
+        self.assertIn("prerequisites", recs[ids.index("calculus")]["reason"])
+
+    def test_central_concept_outranks_leaf(self):
+        nodes = [_node("hub"), _node("leaf")] + [_node(f"d{i}", 0.9, "mastered") for i in range(4)]
+        edges = [_edge("hub", f"d{i}") for i in range(4)]
+        recs = _rank(nodes, edges)
+        self.assertEqual([r["id"] for r in recs], ["hub", "leaf"])
+        self.assertIn("build on it", recs[0]["reason"])
+
+    def test_stale_concept_outranks_fresh_one(self):
+        fresh = (NOW - timedelta(hours=2)).isoformat()
+        stale = (NOW - timedelta(days=30)).isoformat()
+        recs = _rank([_node("fresh", 0.5, "learning", fresh), _node("stale", 0.5, "learning", stale)])
+        self.assertEqual([r["id"] for r in recs], ["stale", "fresh"])
+        self.assertIn("30 days ago", recs[0]["reason"])
+
+    def test_only_recommendable_tiers(self):
+        nodes = [_node("done", 0.95, "mastered"), _node("odd", 0.0, None),
+                 _node("root", 0.0, "subject_root"), _node("todo", 0.2, "struggling")]
+        self.assertEqual([r["id"] for r in _rank(nodes, [_edge("todo", "done")])], ["todo"])
+
+    def test_empty_and_all_mastered(self):
+        self.assertEqual(_rank([]), [])
+        self.assertEqual(_rank([_node("a", 0.9, "mastered")]), [])
+
+    def test_large_graph(self):
+        rng = np.random.default_rng(7)
+        n = 3000
+        scores = rng.random(n)
+        nodes = [_node(f"n{i}", float(scores[i]), "learning") for i in range(n)]
+        edges = [_edge(f"n{a}", f"n{b}") for a, b in rng.integers(0, n, size=(3 * n, 2)) if a != b]
+        started = time.perf_counter()
+        recs = recommendation_service.rank(KnowledgeGraph.from_rows("u1", nodes, edges), now=NOW)
+        self.assertLess(time.perf_counter() - started, 2.0)
+        self.assertEqual(len(recs), recommendation_service.MAX_RANKED)
+        self.assertEqual([r["score"] for r in recs], sorted((r["score"] for r in recs), reverse=True))
+
+
+class TestGetRecommendations(LocalBackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seed_user("u1")
+        self.seed_node("n1", concept_name="Limits")
+        self.seed_node("n2", concept_name="Derivatives")
+        table("graph_edges").insert(
+            {"id": "e1", "user_id": "u1", "source_node_id": "n1", "target_node_id": "n2", "strength": 0.8}
+        )
+
+    def test_cached_per_graph_version(self):
+        self.assertEqual([r["concept_name"] for r in get_recommendations("u1")], ["Limits", "Derivatives"])
+        trace = instrumentation.start_trace("recs")
+        with patch.object(recommendation_service, "rank") as rank:
+            get_recommendations("u1")
+        self.assertEqual(trace.round_trips, 0)
+        rank.assert_not_called()
+
+    @patch("services.course_context_service.update_course_context")
+    def test_recomputed_after_graph_change(self, _ctx):
+        get_recommendations("u1")
+        apply_graph_update("u1", {"updated_nodes": [{"concept_name": "Limits", "mastery_delta": 0.9}]})
+        self.assertEqual([r["concept_name"] for r in get_recommendations("u1")], ["Derivatives"])
+
+    def test_limit_and_shape(self):
+        recs = get_recommendations("u1", limit=1)
+        self.assertEqual(len(recs), 1)
+        self.assertEqual(set(recs[0]), {"id", "concept_name", "subject", "score", "reason"})
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
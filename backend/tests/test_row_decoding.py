@@ -0,0 +1,113 @@
+"""
+Unit tests for fast response decoding and slotted row structs.
+
+Tests: db.rows.decode (orjson and stdlib paths), db.rows.Row dict-compatible
+       access, and table(..., row_type=...) selects against the local stand-in.
+
+Run from backend/:
+    python -m pytest tests/test_row_decoding.py -v
+"""
+import sys
+import os
+import asyncio
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import connection, rows
+from db.rows import GraphEdge, GraphNode, Message
+from tests.local_backend import LocalBackendTestCase
+
+
+class TestDecode(unittest.TestCase):
+
+    def test_stdlib_and_fast_paths_agree(self):
+        body = b'[{"id": "n1", "mastery_score": 0.5, "graph_update_json": {"a": [1, null]}}]'
+        with patch.object(rows, "FAST_JSON", False):
+            slow = rows.decode(body)
+        self.assertEqual(rows.decode(body), slow)
+
+    def test_empty_body(self):
+        self.assertIsNone(rows.decode(b""))
+
+
+class TestRowStructs(unittest.TestCase):
+
+    def test_no_instance_dict(self):
+        node = GraphNode.from_dict({"id": "n1", "concept_name": "Loops"})
+        self.assertFalse(hasattr(node, "__dict__"))
+        with self.assertRaises(AttributeError):
+            node.nickname = "x"
+
+    def test_dict_style_access(self):
+        node = GraphNode.from_dict({"id": "n1", "concept_name": "Loops", "mastery_score": None})
+        self.assertEqual(node["concept_name"], "Loops")
+        self.assertIsNone(node.subject)                  # unselected column
+        self.assertEqual(node.get("mastery_score", 0), 0)
+        with self.assertRaises(KeyError):
+            node["nope"]
+
+    def test_round_trip(self):
+        edge = GraphEdge(id="e1", source_node_id="a", target_node_id="b", strength=0.5)
+        self.assertEqual(GraphEdge.from_dict(edge.to_dict()), edge)
+
+    def test_as_rows_passthrough(self):
+        data = [{"id": "m1"}]
+        self.assertIs(rows.as_rows(data, None), data)
+
+
+class TestRowTypeSelects(LocalBackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seed_user("u1", "Ada")
+        for i in range(5):
+            self.seed_node(f"n{i}", concept_name=f"C{i}", mastery_score=i / 10)
+
+    def test_select_returns_structs(self):
+        nodes = connection.table("graph_nodes", row_type=GraphNode).select(
+            "id,concept_name", filters={"user_id": "eq.u1"}, order="id.asc"
+        )
+        self.assertIsInstance(nodes[0], GraphNode)
+        self.assertEqual([n.concept_name for n in nodes], ["C0", "C1", "C2", "C3", "C4"])
+
+    def test_select_iter_returns_structs(self):
+        names = [n.id for n in connection.table("graph_nodes", row_type=GraphNode)
+                 .select_iter("id", page_size=2)]
+        self.assertEqual(names, ["n0", "n1", "n2", "n3", "n4"])
+
+    def test_chunked_select_returns_structs(self):
+        ids = ",".join(f"n{i}" for i in range(5))
+        with patch.object(connection, "MAX_IN_ITEMS", 2):
+            nodes = connection.table("graph_nodes", row_type=GraphNode).select(
+                "id", filters={"id": f"in.({ids})"}, order="mastery_score.desc"
+            )
+        self.assertEqual([n.id for n in nodes], ["n4", "n3", "n2", "n1", "n0"])
+        self.assertIsNone(nodes[0].mastery_score)        # order column stripped after merge
+
+    def test_conversation_history_uses_message_rows(self):
+        connection.table("sessions").insert({"id": "s1", "user_id": "u1", "mode": "socratic", "topic": "t"})
+        connection.table("messages").insert([
+            {"id": "m1", "session_id": "s1", "role": "user", "content": "hi",
+             "created_at": "2026-01-01T00:00:00"},
+            {"id": "m2", "session_id": "s1", "role": "model", "content": "hello",
+             "created_at": "2026-01-01T00:00:01"},
+        ])
+        from routes.learn import get_conversation_history_async
+        self.assertEqual(asyncio.run(get_conversation_history_async("s1")), [
+            {"role": "user", "content": "hi"},
+            {"role": "model", "content": "hello"},
+        ])
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_benchmark_runs(self):
+        results = rows._benchmark(n_rows=50, repeat=1)
+        self.assertIn("r.json()", results)
+        self.assertLess(results["_env"]["slotted_row_bytes"], results["_env"]["dict_row_bytes"])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,290 @@
+"""
+Unit tests for PostgREST /rpc/ calls and the aggregate SQL functions.
+
+Tests: db.connection.rpc / rpc_async against the local stand-in,
+       user_tier_counts, course_concept_stats, get_graph_bundle,
+       courses_with_node_counts and delete_course_cascade (db/local_rpc.py),
+       and the get_students / update_course_context / get_graph / get_courses /
+       delete_course callers on both the rpc path and the client-side fallback
+       (taken only for a function that is not deployed, which is remembered).
+
+Run from backend/:
+    python -m pytest tests/test_rpc.py -v
+"""
+import sys
+import os
+import asyncio
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import connection, instrumentation
+from db.connection import RpcNotFoundError, rpc, rpc_async, table
+from local_backend import LocalBackendTestCase
+
+
+class RpcTestCase(LocalBackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.seed_user("u1", "Ada")
+        self.seed_user("u2", "Grace")
+        self.seed_node("a1", "u1", "Loops", mastery_score=0.9, mastery_tier="mastered")
+        self.seed_node("a2", "u1", "Recursion", mastery_score=0.1, mastery_tier="struggling")
+        self.seed_node("a3", "u1", "Sets", subject="MATH", mastery_score=0.8, mastery_tier="mastered")
+        self.seed_node("b1", "u2", "Loops", mastery_score=0.3, mastery_tier="learning")
+        self.seed_node("b2", "u2", "Recursion", mastery_score=0.2, mastery_tier="struggling")
+        table("quiz_context").insert([
+            {"user_id": "u1", "concept_node_id": "a2",
+             "context_json": {"common_mistakes": ["No base case"], "weak_areas": []}},
+            {"user_id": "u1", "concept_node_id": "a3",
+             "context_json": {"common_mistakes": ["Confuses union and intersection"]}},
+        ])
+
+
+class TestRpcCall(RpcTestCase):
+
+    def test_unknown_function_is_404(self):
+        with self.assertRaises(RpcNotFoundError) as ctx:
+            rpc("no_such_function")
+        self.assertEqual(ctx.exception.response.status_code, 404)
+        self.assertIsInstance(ctx.exception, httpx.HTTPStatusError)
+
+    def test_missing_function_remembered(self):
+        with self.assertRaises(RpcNotFoundError):
+            rpc("no_such_function")
+        trace = instrumentation.start_trace("rpc")
+        with patch.object(self.db, "rpc", wraps=self.db.rpc) as server:
+            with self.assertRaises(RpcNotFoundError):
+                rpc("no_such_function")
+            with self.assertRaises(RpcNotFoundError):
+                asyncio.run(rpc_async("no_such_function"))
+        server.assert_not_called()
+        self.assertEqual(trace.round_trips, 0)
+
+    def test_missing_table_inside_function_is_not_not_found(self):
+        from db.local_postgrest import PostgrestError
+        missing = PostgrestError(404, 'relation "public.graph_nodes" does not exist', "42P01")
+        with patch.object(self.db, "query", side_effect=missing):
+            with self.assertRaises(httpx.HTTPStatusError) as ctx:
+                rpc("user_tier_counts")
+        self.assertNotIsInstance(ctx.exception, RpcNotFoundError)
+
+    def test_recorded_as_one_round_trip(self):
+        trace = instrumentation.start_trace("rpc")
+        rpc("user_tier_counts")
+        self.assertEqual(trace.round_trips, 1)
+        self.assertEqual(trace.queries[0]["table"], "rpc/user_tier_counts")
+
+    def test_async(self):
+        rows = asyncio.run(rpc_async("user_tier_counts"))
+        self.assertEqual({r["user_id"] for r in rows}, {"u1", "u2"})
+
+
+class TestUserTierCounts(RpcTestCase):
+
+    def test_counts_and_top_concepts(self):
+        by_user = {r["user_id"]: r for r in rpc("user_tier_counts")}
+        self.assertEqual(by_user["u1"]["total"], 3)
+        self.assertEqual(by_user["u1"]["mastered"], 2)
+        self.assertEqual(by_user["u1"]["top_concepts"], ["Loops", "Sets"])
+        self.assertEqual(by_user["u2"]["top_concepts"], [])
+
+    def test_get_students_fallback_matches_rpc(self):
+        from routes.social import get_students
+        via_rpc = get_students()
+        with patch("routes.social.rpc", side_effect=RpcNotFoundError("user_tier_counts")):
+            via_stream = get_students()
+        self.assertEqual(via_rpc, via_stream)
+
+
+class TestCourseConceptStats(RpcTestCase):
+
+    def test_summary(self):
+        summary = rpc("course_concept_stats", {"p_course_name": "CS101"})
+        self.assertEqual(summary["student_count"], 2)
+        loops = next(c for c in summary["concepts"] if c["concept_name"] == "Loops")
+        self.assertEqual(loops["n"], 2)
+        self.assertAlmostEqual(loops["score_sum"], 1.2)
+        self.assertEqual(loops["mastered"], 1)
+        # the MATH node's quiz context is not part of CS101
+        self.assertEqual(summary["contexts"], [{"common_mistakes": ["No base case"], "weak_areas": []}])
+
+    def test_update_course_context_fallback_matches_rpc(self):
+        from services.course_context_service import get_course_context, update_course_context
+        update_course_context("CS101")
+        via_rpc = get_course_context("CS101")
+        with patch("services.course_context_service.rpc", side_effect=RpcNotFoundError("course_concept_stats")):
+            update_course_context("CS101")
+        self.assertEqual(get_course_context("CS101"), via_rpc)
+        self.assertEqual(via_rpc["student_count"], 2)
+        self.assertEqual(via_rpc["common_misconceptions"], ["No base case"])
+
+
+class TestGetGraphBundle(RpcTestCase):
+
+    def setUp(self):
+        super().setUp()
+        table("graph_edges").insert({"id": "e1", "user_id": "u1", "source_node_id": "a1",
+                                     "target_node_id": "a2", "strength": 0.5})
+        table("courses").insert({"id": "c1", "user_id": "u1", "course_name": "HIST"})
+
+    def test_single_round_trip(self):
+        from services.graph_service import get_graph
+        trace = instrumentation.start_trace("graph")
+        graph = get_graph("u1")
+        self.assertEqual(trace.round_trips, 1)
+        roots = {n["id"] for n in graph["nodes"] if n.get("is_subject_root")}
+        self.assertEqual(roots, {"subject_root__CS101", "subject_root__MATH", "subject_root__HIST"})
+        self.assertEqual(graph["stats"]["total_nodes"], 3)
+
+    def test_matches_per_table_fallback(self):
+        from services import graph_service
+        via_rpc = graph_service.get_graph("u1")
+        unavailable = RpcNotFoundError("get_graph_bundle")
+        with patch.object(graph_service, "rpc", side_effect=unavailable), \
+             patch.object(graph_service, "rpc_async", side_effect=unavailable), \
+             patch.object(graph_service.graph_cache, "get", return_value=None):
+            self.assertEqual(graph_service.get_graph("u1"), via_rpc)
+            self.assertEqual(asyncio.run(graph_service.get_graph_async("u1")), via_rpc)
+        graph_service.graph_cache.clear()
+        self.assertEqual(asyncio.run(graph_service.get_graph_async("u1")), via_rpc)
+
+    def test_other_failures_are_raised(self):
+        from services import graph_service
+        with patch.object(graph_service, "rpc", side_effect=httpx.ReadTimeout("timed out")), \
+             patch.object(graph_service, "_get_graph_per_table") as per_table:
+            with self.assertRaises(httpx.ReadTimeout):
+                graph_service.get_graph("u1")
+        per_table.assert_not_called()
+
+    def test_creates_missing_user(self):
+        from services.graph_service import get_graph
+        graph = get_graph("user_new_student")
+        self.assertEqual(graph["nodes"], [])
+        users = table("users").select("name", filters={"id": "eq.user_new_student"})
+        self.assertEqual(users, [{"name": "New Student"}])
+
+
+class TestCoursesWithNodeCounts(RpcTestCase):
+
+    def setUp(self):
+        super().setUp()
+        table("courses").insert([
+            {"id": "c1", "user_id": "u1", "course_name": "CS101", "created_at": "2026-01-01T00:00:00"},
+            {"id": "c2", "user_id": "u1", "course_name": "HIST", "created_at": "2026-01-03T00:00:00"},
+            {"id": "c3", "user_id": "u1", "course_name": "MATH", "created_at": "2026-01-02T00:00:00"},
+            {"id": "c4", "user_id": "u2", "course_name": "CS101", "created_at": "2026-01-01T00:00:00"},
+        ])
+
+    def test_single_round_trip(self):
+        from services.graph_service import get_courses
+        trace = instrumentation.start_trace("courses")
+        courses = get_courses("u1")
+        self.assertEqual(trace.round_trips, 1)
+        self.assertEqual(
+            [(c["course_name"], c["node_count"]) for c in courses],
+            [("CS101", 2), ("MATH", 1), ("HIST", 0)],
+        )
+        self.assertEqual(set(courses[0]), {"id", "course_name", "color", "node_count", "created_at"})
+
+    def test_matches_per_table_fallback(self):
+        from services import graph_service
+        via_rpc = graph_service.get_courses("u1")
+        with patch.object(graph_service, "rpc", side_effect=RpcNotFoundError("courses_with_node_counts")):
+            trace = instrumentation.start_trace("courses")
+            self.assertEqual(graph_service.get_courses("u1"), via_rpc)
+        self.assertEqual(trace.round_trips, 2)
+        self.assertEqual(graph_service.get_courses("nobody"), [])
+
+
+class TestDeleteCourseCascade(RpcTestCase):
+
+    EXPECTED = {"quiz_context": 1, "quiz_attempts": 1, "graph_edges": 2, "graph_nodes": 2, "courses": 1}
+
+    def setUp(self):
+        super().setUp()
+        table("courses").insert({"id": "c1", "user_id": "u1", "course_name": "CS101"})
+        table("quiz_attempts").insert({"id": "qa1", "user_id": "u1", "concept_node_id": "a1"})
+        table("graph_edges").insert([
+            {"id": "e1", "user_id": "u1", "source_node_id": "a1", "target_node_id": "a2", "strength": 0.5},
+            {"id": "e2", "user_id": "u1", "source_node_id": "a3", "target_node_id": "a1", "strength": 0.5},
+        ])
+
+    def _assert_course_gone(self):
+        nodes = table("graph_nodes").select("id", filters={"user_id": "eq.u1"})
+        self.assertEqual(nodes, [{"id": "a3"}])
+        self.assertEqual(table("graph_edges").select("id"), [])
+        self.assertEqual(table("courses").select("id"), [])
+        remaining = table("quiz_context").select("concept_node_id")
+        self.assertEqual(remaining, [{"concept_node_id": "a3"}])
+        logged = {r["entity_id"] for r in table("graph_changes").select("entity_id")}
+        self.assertEqual(logged, {"a1", "a2", "subject_root__CS101", "e1", "e2"})
+
+    def test_single_round_trip(self):
+        from services.graph_service import delete_course
+        trace = instrumentation.start_trace("delete")
+        result = delete_course("u1", "CS101")
+        self.assertEqual(trace.round_trips, 1)
+        self.assertEqual(result, {"deleted": True, "removed": self.EXPECTED})
+        self._assert_course_gone()
+
+    def test_cached_tables_invalidated(self):
+        from db import cache
+        from services.graph_service import delete_course
+        for name in ("courses", "graph_nodes"):
+            cache.enable_cache(name, ttl=60)
+            self.addCleanup(cache.disable_cache, name)
+        self.assertEqual(len(table("courses").select("id")), 1)
+        self.assertEqual(len(table("graph_nodes").select("id", filters={"user_id": "eq.u1"})), 3)
+        delete_course("u1", "CS101")
+        self.assertEqual(table("courses").select("id"), [])
+        self._assert_course_gone()
+
+    def test_cache_invalidated_when_call_fails(self):
+        from db import cache
+        cache.enable_cache("courses", ttl=60)
+        self.addCleanup(cache.disable_cache, "courses")
+        table("courses").select("id")
+        with patch.object(self.db, "query", side_effect=RuntimeError("connection lost")):
+            with self.assertRaises(Exception):
+                rpc("delete_course_cascade", {"p_user_id": "u1", "p_course_name": "CS101"},
+                    writes=("courses",))
+        self.assertEqual(cache.get_cache("courses").stats()["size"], 0)
+
+    def test_per_table_fallback_reports_same_counts(self):
+        from services import graph_service
+        with patch.object(graph_service, "rpc", side_effect=RpcNotFoundError("delete_course_cascade")):
+            result = graph_service.delete_course("u1", "CS101")
+        self.assertEqual(result["removed"], self.EXPECTED)
+        self._assert_course_gone()
+
+    def test_other_failures_do_not_fall_back(self):
+        from services import graph_service
+        with patch.object(graph_service, "rpc", side_effect=httpx.ReadTimeout("timed out")), \
+             patch.object(graph_service, "_delete_course_per_table") as per_table:
+            with self.assertRaises(httpx.ReadTimeout):
+                graph_service.delete_course("u1", "CS101")
+        per_table.assert_not_called()
+
+    def test_failure_rolls_back(self):
+        query = self.db.query
+
+        def fail_on_courses(sql, args=()):
+            if sql.startswith("DELETE FROM courses"):
+                raise RuntimeError("connection lost")
+            return query(sql, args)
+
+        with patch.object(self.db, "query", side_effect=fail_on_courses):
+            with self.assertRaises(Exception):
+                rpc("delete_course_cascade", {"p_user_id": "u1", "p_course_name": "CS101"})
+        self.assertEqual(len(table("graph_nodes").select("id", filters={"user_id": "eq.u1"})), 3)
+        self.assertEqual(len(table("graph_edges").select("id")), 2)
+        self.assertEqual(table("graph_changes").select("id"), [])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
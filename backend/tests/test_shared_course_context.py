@@ -2,7 +2,8 @@
 Unit tests for the shared course context system.
 
 Tests: course_context_service, graph_service (apply_graph_update side-effects),
-       learn.py helpers (_resolve_course, _get_session_topic, build_system_prompt),
+       learn.py helpers (_resolve_course_async, _get_session_topic_async,
+       build_system_prompt_async),
        quiz.py (generate_quiz prompt augmentation).
 
 Run from backend/:
@@ -10,9 +11,10 @@ Run from backend/:
 """
 import sys
 import os
+import asyncio
 import json
 import unittest
-from unittest.mock import patch, MagicMock, call
+from unittest.mock import AsyncMock, patch, MagicMock, call
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -77,6 +79,14 @@ class TestGetCourseContext(unittest.TestCase):
 # ─────────────────────────────────────────────────────────────────────────────
 
 class TestUpdateCourseContext(unittest.TestCase):
+    """Client-side aggregation path (course_concept_stats SQL function not deployed)."""
+
+    def setUp(self):
+        from db.connection import RpcNotFoundError
+        patcher = patch("services.course_context_service.rpc",
+                        side_effect=RpcNotFoundError("course_concept_stats"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     def test_no_op_for_empty_course_name(self):
         from services.course_context_service import update_course_context
@@ -108,7 +118,7 @@ class TestUpdateCourseContext(unittest.TestCase):
             return node_rows
 
         node_tbl = MagicMock()
-        node_tbl.select.side_effect = _select
+        node_tbl.select_iter.side_effect = _select
 
         quiz_tbl = MagicMock()
         quiz_tbl.select.return_value = []
@@ -153,7 +163,7 @@ class TestUpdateCourseContext(unittest.TestCase):
         ]
 
         node_tbl = MagicMock()
-        node_tbl.select.return_value = node_rows
+        node_tbl.select_iter.return_value = node_rows
         quiz_tbl = MagicMock()
         quiz_tbl.select.return_value = []
         ctx_tbl = MagicMock()
@@ -190,7 +200,7 @@ class TestUpdateCourseContext(unittest.TestCase):
         ]
 
         node_tbl = MagicMock()
-        node_tbl.select.return_value = node_rows
+        node_tbl.select_iter.return_value = node_rows
         quiz_tbl = MagicMock()
         quiz_tbl.select.return_value = quiz_rows
         ctx_tbl = MagicMock()
@@ -217,6 +227,12 @@ class TestUpdateCourseContext(unittest.TestCase):
 
 class TestApplyGraphUpdateTriggersContext(unittest.TestCase):
 
+    def setUp(self):
+        for target in ("services.graph_changes_service.record", "services.subject_stats_service.apply"):
+            patcher = patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
     @patch("services.graph_service.table")
     @patch("services.course_context_service.update_course_context")
     def test_update_course_context_called_for_touched_subjects(
@@ -226,7 +242,8 @@ class TestApplyGraphUpdateTriggersContext(unittest.TestCase):
         # patch it at the source module so the import resolves to our mock.
         node_tbl = MagicMock()
         node_tbl.select.return_value = [
-            {"id": "n1", "mastery_score": 0.4, "times_studied": 2, "subject": "CS101"}
+            {"id": "n1", "concept_name": "Loops", "mastery_score": 0.4, "times_studied": 2,
+             "subject": "CS101", "concept_key": "loop"}
         ]
 
         def _table(name):
@@ -254,7 +271,8 @@ class TestApplyGraphUpdateTriggersContext(unittest.TestCase):
         """A failure in update_course_context must never surface to the caller."""
         node_tbl = MagicMock()
         node_tbl.select.return_value = [
-            {"id": "n1", "mastery_score": 0.4, "times_studied": 2, "subject": "CS101"}
+            {"id": "n1", "concept_name": "Loops", "mastery_score": 0.4, "times_studied": 2,
+             "subject": "CS101", "concept_key": "loop"}
         ]
 
         def _table(name):
@@ -279,7 +297,8 @@ class TestApplyGraphUpdateTriggersContext(unittest.TestCase):
         """Nodes with subject='General' should NOT trigger a context refresh."""
         node_tbl = MagicMock()
         node_tbl.select.return_value = [
-            {"id": "n1", "mastery_score": 0.4, "times_studied": 0, "subject": "General"}
+            {"id": "n1", "concept_name": "GenericConcept", "mastery_score": 0.4, "times_studied": 0,
+             "subject": "General", "concept_key": "genericconcept"}
         ]
 
         def _table(name):
@@ -298,77 +317,75 @@ class TestApplyGraphUpdateTriggersContext(unittest.TestCase):
 
 
 # ─────────────────────────────────────────────────────────────────────────────
-# 4. learn.py — _resolve_course, _get_session_topic, build_system_prompt
+# 4. learn.py — _resolve_course_async, _get_session_topic_async, build_system_prompt_async
 # ─────────────────────────────────────────────────────────────────────────────
 
 class TestLearnHelpers(unittest.TestCase):
 
-    @patch("routes.learn.table")
+    @patch("routes.learn.async_table")
     def test_resolve_course_when_topic_is_subject(self, mock_table):
-        mock_table.return_value.select.return_value = [{"subject": "CS101"}]
+        mock_table.return_value.select = AsyncMock(return_value=[{"subject": "CS101"}])
 
-        from routes.learn import _resolve_course
-        result = _resolve_course("CS101", "user1")
+        from routes.learn import _resolve_course_async
+        result = asyncio.run(_resolve_course_async("CS101", "user1"))
         self.assertEqual(result, "CS101")
 
-    @patch("routes.learn.table")
+    @patch("routes.learn.async_table")
     def test_resolve_course_when_topic_is_concept(self, mock_table):
-        tbl = MagicMock()
         # First call (is topic a subject?) → not found
         # Second call (is topic a concept?) → found with subject
-        tbl.select.side_effect = [[], [{"subject": "CS101"}]]
-        mock_table.return_value = tbl
+        mock_table.return_value.select = AsyncMock(side_effect=[[], [{"subject": "CS101"}]])
 
-        from routes.learn import _resolve_course
-        result = _resolve_course("Loops", "user1")
+        from routes.learn import _resolve_course_async
+        result = asyncio.run(_resolve_course_async("Loops", "user1"))
         self.assertEqual(result, "CS101")
 
-    @patch("routes.learn.table")
+    @patch("routes.learn.async_table")
     def test_resolve_course_unknown_topic_returns_empty(self, mock_table):
-        mock_table.return_value.select.return_value = []
+        mock_table.return_value.select = AsyncMock(return_value=[])
 
-        from routes.learn import _resolve_course
-        result = _resolve_course("RandomTopic", "user1")
+        from routes.learn import _resolve_course_async
+        result = asyncio.run(_resolve_course_async("RandomTopic", "user1"))
         self.assertEqual(result, "")
 
     def test_resolve_course_empty_topic_returns_empty(self):
-        from routes.learn import _resolve_course
-        result = _resolve_course("", "user1")
+        from routes.learn import _resolve_course_async
+        result = asyncio.run(_resolve_course_async("", "user1"))
         self.assertEqual(result, "")
 
-    @patch("routes.learn.table")
+    @patch("routes.learn.async_table")
     def test_get_session_topic_found(self, mock_table):
-        mock_table.return_value.select.return_value = [{"topic": "Recursion"}]
+        mock_table.return_value.select = AsyncMock(return_value=[{"topic": "Recursion"}])
 
-        from routes.learn import _get_session_topic
-        result = _get_session_topic("session-abc")
+        from routes.learn import _get_session_topic_async
+        result = asyncio.run(_get_session_topic_async("session-abc"))
         self.assertEqual(result, "Recursion")
 
-    @patch("routes.learn.table")
+    @patch("routes.learn.async_table")
     def test_get_session_topic_not_found(self, mock_table):
-        mock_table.return_value.select.return_value = []
+        mock_table.return_value.select = AsyncMock(return_value=[])
 
-        from routes.learn import _get_session_topic
-        result = _get_session_topic("session-missing")
+        from routes.learn import _get_session_topic_async
+        result = asyncio.run(_get_session_topic_async("session-missing"))
         self.assertEqual(result, "")
 
-    # get_course_context is lazily imported inside build_system_prompt;
+    # get_course_context_async is lazily imported inside build_system_prompt_async;
     # patch it at the source module so the `from ... import` resolves to our mock.
-    @patch("services.course_context_service.get_course_context", return_value={})
+    @patch("services.course_context_service.get_course_context_async", return_value={})
     def test_build_system_prompt_no_course_name(self, mock_ctx):
-        from routes.learn import build_system_prompt
-        prompt = build_system_prompt("socratic", "Alice", "{}")
+        from routes.learn import build_system_prompt_async
+        _, prompt = asyncio.run(build_system_prompt_async("socratic", "Alice", "{}"))
         self.assertNotIn("COURSE INTELLIGENCE", prompt)
         mock_ctx.assert_not_called()
 
-    @patch("services.course_context_service.get_course_context", return_value={})
+    @patch("services.course_context_service.get_course_context_async", return_value={})
     def test_build_system_prompt_course_name_but_empty_ctx(self, mock_ctx):
-        from routes.learn import build_system_prompt
-        prompt = build_system_prompt("socratic", "Alice", "{}", course_name="CS101")
+        from routes.learn import build_system_prompt_async
+        _, prompt = asyncio.run(build_system_prompt_async("socratic", "Alice", "{}", course_name="CS101"))
         self.assertNotIn("COURSE INTELLIGENCE", prompt)
-        mock_ctx.assert_called_once_with("CS101")
+        mock_ctx.assert_awaited_once_with("CS101")
 
-    @patch("services.course_context_service.get_course_context")
+    @patch("services.course_context_service.get_course_context_async")
     def test_build_system_prompt_injects_shared_block(self, mock_ctx):
         mock_ctx.return_value = {
             "struggling_concepts": [{"concept": "Pointers", "avg_mastery": 0.2}],
@@ -379,23 +396,27 @@ class TestLearnHelpers(unittest.TestCase):
             "student_count": 10,
         }
 
-        from routes.learn import build_system_prompt
-        prompt = build_system_prompt("socratic", "Alice", "{}", course_name="CS101")
+        from routes.learn import build_system_prompt_async
+        _, prompt = asyncio.run(build_system_prompt_async("socratic", "Alice", "{}", course_name="CS101"))
         self.assertIn("COURSE INTELLIGENCE", prompt)
         self.assertIn("CS101", prompt)
-        mock_ctx.assert_called_once_with("CS101")
+        mock_ctx.assert_awaited_once_with("CS101")
 
-    @patch("services.course_context_service.get_course_context")
-    def test_build_system_prompt_mode_appended_after_shared_block(self, mock_ctx):
-        """Mode prompt must always be the last section."""
+    @patch("services.course_context_service.get_course_context_async")
+    def test_build_system_prompt_mode_in_static_prefix(self, mock_ctx):
+        """Mode prompt goes in the static prefix; per-student data only in the context."""
         mock_ctx.return_value = {"struggling_concepts": [], "student_count": 5}
 
-        from routes.learn import build_system_prompt, MODE_PROMPTS
-        prompt = build_system_prompt("expository", "Bob", "{}", course_name="CS101")
-        expository_text = MODE_PROMPTS["expository"]
-        ctx_pos = prompt.find("COURSE INTELLIGENCE")
-        mode_pos = prompt.find(expository_text[:40])
-        self.assertGreater(mode_pos, ctx_pos)
+        from routes.learn import build_system_prompt_async, MODE_PROMPTS
+        prefix, context = asyncio.run(
+            build_system_prompt_async("expository", "Bob", '{"nodes": []}', course_name="CS101")
+        )
+        self.assertTrue(prefix.endswith(MODE_PROMPTS["expository"]))
+        self.assertNotIn("Bob", prefix)
+        self.assertNotIn("COURSE INTELLIGENCE", prefix)
+        self.assertIn("COURSE INTELLIGENCE", context)
+        self.assertIn('{"nodes": []}', context)
+        self.assertEqual(prefix, asyncio.run(build_system_prompt_async("expository", "Alice", "{}"))[0])
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -0,0 +1,218 @@
+"""
+Unit tests for streamed tutor replies (server-sent events).
+
+Tests: services.gemini_service.GraphUpdateFilter (tags split across chunks,
+       text after the block, false alarms), stream_gemini_async retries, and
+       POST /api/learn/chat?stream=true (token/done events, graph update
+       applied and message saved after the stream, 502 before the first
+       chunk, error event mid-stream or while saving, reply saved when the
+       client disconnects).
+
+Run from backend/:
+    python -m pytest tests/test_streaming_chat.py -v
+"""
+import sys
+import os
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.connection import table
+from models import ChatBody
+from services import gemini_service
+from services.gemini_service import GraphUpdateFilter, extract_graph_update
+from local_backend import LocalBackendTestCase
+
+GRAPH_UPDATE = {
+    "new_nodes": [{"concept_name": "Recursion", "subject": "CS101", "initial_mastery": 0.2}],
+    "updated_nodes": [],
+    "new_edges": [],
+    "recommended_next": [],
+}
+RAW = (
+    "Great question! What happens when a function calls itself?"
+    f"\n<graph_update>{json.dumps(GRAPH_UPDATE)}</graph_update>\n"
+    "Take your time."
+)
+
+
+def _stream(text: str, size: int) -> list:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _filtered(chunks: list) -> tuple:
+    split = GraphUpdateFilter()
+    visible = "".join(split.feed(c) for c in chunks) + split.flush()
+    return visible, split.finish()
+
+
+def _events(body: str) -> list:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+async def _agen(items):
+    for item in items:
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+class TestGraphUpdateFilter(unittest.TestCase):
+
+    def test_block_held_back_at_any_chunk_size(self):
+        reply, graph_update = extract_graph_update(RAW)
+        for size in (1, 2, 5, 13, len(RAW)):
+            visible, finished = _filtered(_stream(RAW, size))
+            self.assertNotIn("graph_update", visible)
+            self.assertNotIn("new_nodes", visible)
+            self.assertEqual(visible.strip(), reply)
+            self.assertEqual(finished, (reply, graph_update))
+
+    def test_lookalike_tag_is_released(self):
+        visible, (reply, _) = _filtered(["a < b and <graph", "ics> are fine <gr"])
+        self.assertEqual(visible, "a < b and <graphics> are fine <gr")
+        self.assertEqual(reply, visible)
+
+    def test_text_before_tag_streams_immediately(self):
+        split = GraphUpdateFilter()
+        self.assertEqual(split.feed("Hello <graph_"), "Hello ")
+        self.assertEqual(split.feed("update>{}"), "")
+        self.assertEqual(split.feed("</graph_update> bye"), " bye")
+
+    def test_every_block_removed_as_while_streaming(self):
+        raw = ("One <graph_update>" + json.dumps(GRAPH_UPDATE) + "</graph_update> two "
+               '<graph_update>{"new_edges": [{"source": "A", "target": "B"}]}</graph_update>'
+               " three <graph_update>{\"new_nodes\": [")
+        visible, (reply, graph_update) = _filtered(_stream(raw, 4))
+        self.assertEqual(reply, "One  two  three")
+        self.assertEqual(visible.strip(), reply)
+        self.assertEqual(graph_update["new_nodes"], GRAPH_UPDATE["new_nodes"])
+        self.assertEqual(graph_update["new_edges"], [{"source": "A", "target": "B"}])
+
+
+class TestStreamGeminiAsync(unittest.TestCase):
+
+    def _collect(self):
+        async def run():
+            return [c async for c in gemini_service.stream_gemini_async("prompt")]
+        return asyncio.run(run())
+
+    @patch("services.gemini_service.asyncio.sleep", new_callable=AsyncMock)
+    def test_retries_before_first_chunk(self, _sleep):
+        chunks = [MagicMock(text="Hi "), MagicMock(text=None), MagicMock(text="there")]
+        client = MagicMock()
+        client.aio.models.generate_content_stream = AsyncMock(
+            side_effect=[RuntimeError("429 quota"), _agen(chunks)]
+        )
+        with patch.object(gemini_service, "_client", client):
+            self.assertEqual(self._collect(), ["Hi ", "there"])
+
+    def test_no_retry_after_text_was_sent(self):
+        client = MagicMock()
+        client.aio.models.generate_content_stream = AsyncMock(
+            return_value=_agen([MagicMock(text="Hi"), RuntimeError("500 backend")])
+        )
+        with patch.object(gemini_service, "_client", client):
+            with self.assertRaises(RuntimeError):
+                self._collect()
+        self.assertEqual(client.aio.models.generate_content_stream.await_count, 1)
+
+
+@patch("services.course_context_service.update_course_context")
+class TestChatStreamRoute(LocalBackendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        from fastapi.testclient import TestClient
+        import main
+
+        self.client = TestClient(main.app)
+        self.seed_user("u1")
+        table("sessions").insert({"id": "s1", "user_id": "u1", "mode": "socratic", "topic": ""})
+        self.body = {"session_id": "s1", "user_id": "u1", "message": "What is recursion?"}
+
+    def _chat(self, chunks):
+        with patch("routes.learn.stream_gemini_async", side_effect=lambda prompt, **kw: _agen(chunks)):
+            return self.client.post("/api/learn/chat", params={"stream": "true"}, json=self.body)
+
+    def test_streams_tokens_then_done(self, _ctx):
+        response = self._chat(_stream(RAW, 7))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        self.assertNotIn("content-encoding", response.headers)
+
+        events = _events(response.text)
+        kinds = [kind for kind, _ in events]
+        self.assertGreater(kinds.count("token"), 2)
+        self.assertEqual(kinds[-1], "done")
+        streamed = "".join(data["text"] for kind, data in events if kind == "token")
+        self.assertNotIn("graph_update", streamed)
+
+        done = events[-1][1]
+        reply, _ = extract_graph_update(RAW)
+        self.assertEqual(done["reply"], reply)
+        self.assertEqual(done["mastery_changes"], [])
+        self.assertEqual(done["graph_update"]["new_nodes"][0]["concept_name"], "Recursion")
+
+        # Applied and saved once the stream completed
+        self.assertEqual([n["concept_name"] for n in table("graph_nodes").select("concept_name")],
+                         ["Recursion"])
+        saved = table("messages").select("role,content", filters={"session_id": "eq.s1"},
+                                         order="created_at.asc")
+        self.assertEqual([m["role"] for m in saved], ["user", "assistant"])
+        self.assertEqual(saved[1]["content"], reply)
+
+    def test_failure_before_first_chunk_is_502(self, _ctx):
+        response = self._chat([RuntimeError("quota")])
+        self.assertEqual(response.status_code, 502)
+
+    def test_failure_mid_stream_ends_with_error_event(self, _ctx):
+        events = _events(self._chat(["Let's ", "think", RuntimeError("connection reset")]).text)
+        self.assertEqual([kind for kind, _ in events], ["token", "token", "error"])
+        self.assertEqual(table("graph_nodes").select("id"), [])
+
+    def test_failure_while_saving_ends_with_error_event(self, _ctx):
+        with patch("routes.learn.apply_graph_update_async", side_effect=RuntimeError("db down")), \
+             patch("routes.learn.logger"):
+            events = _events(self._chat(_stream(RAW, 7)).text)
+        self.assertEqual(events[-1], ("error", {"detail": "Could not save reply: db down"}))
+        self.assertNotIn("done", [kind for kind, _ in events])
+
+    def test_reply_saved_after_client_disconnects(self, _ctx):
+        from routes import learn
+
+        async def slow(prompt, **kw):
+            for chunk in _stream(RAW, 7):
+                await asyncio.sleep(0)
+                yield chunk
+
+        async def run():
+            with patch("routes.learn.stream_gemini_async", side_effect=slow):
+                response = await learn.chat(ChatBody(**self.body), stream=True)
+            body = response.body_iterator
+            await anext(body)
+            await body.aclose()          # what Starlette does when the client goes away
+            await asyncio.gather(*learn._replies_in_flight)
+
+        asyncio.run(run())
+        saved = table("messages").select("role,content", filters={"session_id": "eq.s1"},
+                                         order="created_at.asc")
+        self.assertEqual([m["role"] for m in saved], ["user", "assistant"])
+        self.assertEqual(saved[1]["content"], extract_graph_update(RAW)[0])
+
+    def test_non_streaming_response_unchanged(self, _ctx):
+        with patch("routes.learn.call_gemini_async", new_callable=AsyncMock, return_value=RAW):
+            body = self.client.post("/api/learn/chat", json=self.body).json()
+        self.assertEqual(set(body), {"reply", "graph_update", "mastery_changes"})
+        self.assertEqual(body["reply"], extract_graph_update(RAW)[0])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,200 @@
+"""
+Unit tests for the materialized per-subject statistics (subject_stats).
+
+Tests: services.subject_stats_service.deltas, incremental maintenance by
+       apply_graph_update and submit_quiz (checked against rebuild(), also
+       when another write lands between the quiz's read and write), the
+       per-table fallback, rebuilding after a lost delta, delete_course
+       cleanup and GET
+       /api/graph/{user_id}/subjects.
+
+Run from backend/:
+    python -m pytest tests/test_subject_stats.py -v
+"""
+import sys
+import os
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import BackgroundTasks
+
+from db import instrumentation
+from db.connection import RpcNotFoundError, table
+from models import AnswerItem, SubmitQuizBody
+from services import subject_stats_service as subject_stats
+from services.graph_service import apply_graph_update, delete_course
+from local_backend import LocalBackendTestCase
+
+
+def _stored(user_id: str = "u1") -> dict:
+    return {
+        r["subject"]: {k: round(r[k], 6) for k in subject_stats.COUNTERS}
+        for r in subject_stats.get(user_id)
+    }
+
+
+class TestDeltas(unittest.TestCase):
+
+    def test_insert_update_delete(self):
+        before = [
+            {"subject": "CS101", "mastery_score": 0.5, "mastery_tier": "learning", "times_studied": 2},
+            {"subject": None, "mastery_score": 0.1, "mastery_tier": "struggling", "times_studied": 1},
+        ]
+        after = [
+            {"subject": "CS101", "mastery_score": 0.8, "mastery_tier": "mastered", "times_studied": 3},
+            {"subject": "MATH", "mastery_score": 0.0, "mastery_tier": "unexplored", "times_studied": 0},
+        ]
+        by_subject = {d["subject"]: d for d in subject_stats.deltas(before, after)}
+        cs = by_subject["CS101"]
+        self.assertEqual((cs["node_count"], cs["times_studied"]), (0, 1))
+        self.assertAlmostEqual(cs["mastery_sum"], 0.3)
+        self.assertEqual((cs["learning"], cs["mastered"]), (-1, 1))
+        self.assertEqual(by_subject["General"]["node_count"], -1)  # no subject counts as General
+        self.assertEqual((by_subject["MATH"]["node_count"], by_subject["MATH"]["unexplored"]), (1, 1))
+
+    def test_unchanged_subjects_dropped(self):
+        row = {"subject": "CS101", "mastery_score": 0.5, "mastery_tier": "learning", "times_studied": 2}
+        self.assertEqual(subject_stats.deltas([row], [dict(row)]), [])
+
+
+@patch("services.course_context_service.update_course_context")
+class TestMaintainedOnWrite(LocalBackendTestCase):
+
+    UPDATE = {
+        "new_nodes": [
+            {"concept_name": "Loops", "subject": "CS101", "initial_mastery": 0.9},   # exists
+            {"concept_name": "Recursion", "subject": "CS101", "initial_mastery": 0.3},
+            {"concept_name": "Limits", "subject": "MATH", "initial_mastery": 0.0},
+        ],
+        "updated_nodes": [
+            {"concept_name": "Loops", "mastery_delta": 0.2},
+            {"concept_name": "Loops", "mastery_delta": 0.2},
+            {"concept_name": "Recursion", "mastery_delta": 0.2},
+        ],
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.seed_user("u1")
+        self.seed_node("loops", concept_name="Loops", mastery_score=0.7,
+                       mastery_tier="learning", times_studied=3)
+        self.seed_node("arrays", concept_name="Arrays", mastery_score=0.5, mastery_tier="learning")
+
+    def test_graph_update_matches_rebuild(self, _ctx):
+        trace = instrumentation.start_trace("update")
+        apply_graph_update("u1", self.UPDATE)
+        self.assertEqual(
+            [q["table"] for q in trace.queries if "subject_stats" in q["table"]],
+            ["rpc/apply_subject_stats_deltas"],
+        )
+        incremental = _stored()
+        self.assertEqual(incremental["CS101"]["node_count"], 3)
+        self.assertEqual(incremental["CS101"]["mastered"], 1)
+        self.assertEqual(incremental["MATH"]["unexplored"], 1)
+        subject_stats.rebuild("u1")
+        self.assertEqual(_stored(), incremental)
+
+    def test_per_table_fallback_matches_rebuild(self, _ctx):
+        with patch.object(subject_stats, "rpc", side_effect=RpcNotFoundError("apply_subject_stats_deltas")):
+            apply_graph_update("u1", self.UPDATE)
+        incremental = _stored()
+        self.assertEqual(set(incremental), {"CS101", "MATH"})
+        subject_stats.rebuild("u1")
+        self.assertEqual(_stored(), incremental)
+
+    def test_lost_delta_rebuilt_on_next_read(self, _ctx):
+        with patch.object(subject_stats, "rpc", side_effect=RuntimeError("statement timeout")), \
+             self.assertLogs("sapling.db", "WARNING"):
+            apply_graph_update("u1", self.UPDATE)
+        self.assertIn("u1", subject_stats._dirty)
+        from services.graph_service import get_courses
+        get_courses("u1")                          # any reader repairs first
+        self.assertNotIn("u1", subject_stats._dirty)
+        incremental = _stored()
+        self.assertEqual(incremental["CS101"]["node_count"], 3)
+        subject_stats.rebuild("u1")
+        self.assertEqual(_stored(), incremental)
+
+    def test_failed_rebuild_stays_dirty(self, _ctx):
+        subject_stats.mark_dirty("u1")
+        with patch.object(subject_stats, "rebuild", side_effect=RuntimeError("down")), \
+             self.assertLogs("sapling.db", "WARNING"):
+            subject_stats.repair()
+        self.assertIn("u1", subject_stats._dirty)
+
+    def test_submit_quiz(self, _ctx):
+        from routes.quiz import submit_quiz
+        table("quiz_attempts").insert({
+            "id": "q1", "user_id": "u1", "concept_node_id": "arrays",
+            "questions_json": [{"id": 1, "options": [{"label": "A", "correct": True}]}],
+        })
+        with patch("routes.quiz.get_quiz_context", return_value=None):
+            result = submit_quiz(
+                SubmitQuizBody(quiz_id="q1", answers=[AnswerItem(question_id="1", selected_label="A")]),
+                BackgroundTasks(),
+            )
+        cs = _stored()["CS101"]
+        self.assertAlmostEqual(cs["mastery_sum"], 0.7 + result["mastery_after"])
+        self.assertEqual(cs["times_studied"], 4)
+        subject_stats.rebuild("u1")
+        self.assertEqual(_stored()["CS101"], cs)
+
+    def test_submit_quiz_builds_on_a_concurrent_update(self, _ctx):
+        from db.connection import SupabaseTable
+        from routes.quiz import submit_quiz
+        table("quiz_attempts").insert({
+            "id": "q1", "user_id": "u1", "concept_node_id": "arrays",
+            "questions_json": [{"id": 1, "options": [{"label": "A", "correct": True}]}],
+        })
+        real_update = SupabaseTable.update
+        raced = []
+
+        def update(tbl, data, filters):
+            if tbl.name == "graph_nodes" and not raced:   # another writer gets in first
+                raced.append(1)
+                apply_graph_update("u1", {"updated_nodes": [{"concept_name": "Arrays", "mastery_delta": 0.2}]})
+            return real_update(tbl, data, filters)
+
+        with patch("routes.quiz.get_quiz_context", return_value=None), \
+             patch.object(SupabaseTable, "update", update):
+            result = submit_quiz(
+                SubmitQuizBody(quiz_id="q1", answers=[AnswerItem(question_id="1", selected_label="A")]),
+                BackgroundTasks(),
+            )
+        self.assertAlmostEqual(result["mastery_before"], 0.7)     # re-read after the race
+        self.assertAlmostEqual(result["mastery_after"], 0.73)
+        node = table("graph_nodes").select("*", filters={"id": "eq.arrays"})[0]
+        self.assertEqual(node["times_studied"], 2)                # neither write was lost
+        self.assertNotIn("u1", subject_stats._dirty)
+        cs = _stored()["CS101"]
+        subject_stats.rebuild("u1")
+        self.assertEqual(_stored()["CS101"], cs)
+
+    def test_delete_course_drops_summary(self, _ctx):
+        self.seed_node("sets", concept_name="Sets", subject="MATH")
+        delete_course("u1", "CS101")
+        self.assertEqual(set(_stored()), {"MATH"})
+        with patch("services.graph_service.rpc", side_effect=RpcNotFoundError("delete_course_cascade")):
+            delete_course("u1", "MATH")
+        self.assertEqual(_stored(), {})
+
+
+class TestSubjectsRoute(LocalBackendTestCase):
+
+    def test_reads_summaries(self):
+        from fastapi.testclient import TestClient
+        import main
+
+        self.seed_user("u1")
+        self.seed_node("n1", concept_name="Loops", mastery_score=0.9, mastery_tier="mastered")
+        self.seed_node("n2", concept_name="Recursion", mastery_score=0.4, mastery_tier="learning")
+        body = TestClient(main.app).get("/api/graph/u1/subjects").json()
+        (cs,) = body["subjects"]
+        self.assertEqual((cs["subject"], cs["node_count"], cs["avg_mastery"]), ("CS101", 2, 65))
+        self.assertEqual((cs["mastered"], cs["learning"]), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
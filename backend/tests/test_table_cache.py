@@ -0,0 +1,130 @@
+"""
+Unit tests for the SupabaseTable read-through cache.
+
+Tests: db.cache.TableCache (TTL, LRU eviction, counters),
+       db.connection.SupabaseTable (cache hits skip HTTP, writes invalidate,
+       a select that a write overtook is not cached).
+
+Run from backend/:
+    python -m pytest tests/test_table_cache.py -v
+"""
+import sys
+import os
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import cache, connection
+
+REST_URL = "http://supabase.test/rest/v1"
+
+
+class TestTableCache(unittest.TestCase):
+
+    def test_hit_and_miss_counters(self):
+        c = cache.TableCache(ttl=60, maxsize=4)
+        key = cache.make_key("users", "name", {"id": "eq.u1"}, None, None)
+        self.assertIsNone(c.get(key))
+        c.put(key, [{"name": "Ada"}])
+        self.assertEqual(c.get(key), [{"name": "Ada"}])
+        self.assertEqual((c.hits, c.misses), (1, 1))
+
+    def test_filter_order_does_not_change_key(self):
+        a = cache.make_key("graph_nodes", "*", {"user_id": "eq.u1", "subject": "eq.CS"}, None, None)
+        b = cache.make_key("graph_nodes", "*", {"subject": "eq.CS", "user_id": "eq.u1"}, None, None)
+        self.assertEqual(a, b)
+
+    def test_expired_entries_miss(self):
+        c = cache.TableCache(ttl=10, maxsize=4)
+        with patch("db.cache.time.monotonic", return_value=100.0):
+            c.put(("k",), [{"id": 1}])
+        with patch("db.cache.time.monotonic", return_value=111.0):
+            self.assertIsNone(c.get(("k",)))
+
+    def test_lru_eviction(self):
+        c = cache.TableCache(ttl=60, maxsize=2)
+        c.put(("a",), [])
+        c.put(("b",), [])
+        c.get(("a",))          # touch a, so b is least recently used
+        c.put(("c",), [])
+        self.assertIsNone(c.get(("b",)))
+        self.assertEqual(c.get(("a",)), [])
+        self.assertEqual(c.evictions, 1)
+
+    def test_returned_rows_are_copies(self):
+        c = cache.TableCache(ttl=60, maxsize=2)
+        c.put(("a",), [{"id": "r1"}])
+        c.get(("a",))[0]["member_count"] = 3
+        self.assertEqual(c.get(("a",)), [{"id": "r1"}])
+
+
+class TestSupabaseTableCaching(unittest.TestCase):
+
+    def setUp(self):
+        self.requests = []
+
+        def handler(request: httpx.Request):
+            self.requests.append(request.method)
+            return httpx.Response(200, json=[{"id": "u1", "name": "Ada"}])
+
+        self._patches = [
+            patch.object(connection, "_client", httpx.Client(transport=httpx.MockTransport(handler))),
+            patch.object(connection, "REST_URL", REST_URL),
+        ]
+        for p in self._patches:
+            p.start()
+        cache.enable_cache("users", ttl=60)
+
+    def tearDown(self):
+        cache.disable_cache("users")
+        for p in self._patches:
+            p.stop()
+
+    def test_repeated_select_is_served_from_cache(self):
+        for _ in range(3):
+            connection.table("users").select("name", filters={"id": "eq.u1"})
+        self.assertEqual(self.requests, ["GET"])
+        self.assertEqual(cache.get_cache("users").hits, 2)
+
+    def test_write_invalidates_table(self):
+        connection.table("users").select("name", filters={"id": "eq.u1"})
+        connection.table("users").update({"name": "Grace"}, filters={"id": "eq.u1"})
+        connection.table("users").select("name", filters={"id": "eq.u1"})
+        self.assertEqual(self.requests, ["GET", "PATCH", "GET"])
+
+    def test_select_overtaken_by_write_is_not_stored(self):
+        table = connection.table("users")
+        send = connection._transport.send
+
+        def slow_select(client, verb, *args, **kwargs):
+            response = send(client, verb, *args, **kwargs)
+            if verb == "select":  # rows as they were before this write landed
+                connection.table("users").update({"name": "Grace"}, filters={"id": "eq.u1"})
+            return response
+
+        with patch.object(connection._transport, "send", side_effect=slow_select):
+            table.select("name", filters={"id": "eq.u1"})
+        table.select("name", filters={"id": "eq.u1"})
+        self.assertEqual(self.requests, ["GET", "PATCH", "GET"])
+        self.assertEqual(cache.get_cache("users").stale_fills, 1)
+
+    def test_uncached_table_and_bypass(self):
+        connection.table("users", cached=False).select("name")
+        connection.table("users", cached=False).select("name")
+        connection.table("sessions").select("*")
+        connection.table("sessions").select("*")
+        self.assertEqual(self.requests, ["GET"] * 4)
+
+    def test_cache_stats_totals(self):
+        connection.table("users").select("name")
+        connection.table("users").select("name")
+        stats = connection.cache_stats()
+        self.assertEqual(stats["tables"]["users"]["hits"], 1)
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
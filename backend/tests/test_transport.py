@@ -0,0 +1,195 @@
+"""
+Unit tests for the Supabase HTTP transport policy.
+
+Tests: db.transport.CircuitBreaker state machine, retry/backoff of reads
+       and read-only rpc calls, one breaker failure per request however
+       often it was retried, no retry for writes, a cancelled half-open
+       trial releasing the breaker, and the 503 mapping in main.py.
+
+Run from backend/:
+    python -m pytest tests/test_transport.py -v
+"""
+import sys
+import os
+import asyncio
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import transport
+from db.transport import CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(threshold=2, reset_timeout=10, clock=self.clock)
+
+    def test_opens_after_threshold(self):
+        self.breaker.record_failure()
+        self.breaker.before_call()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "open")
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+    def test_half_open_allows_single_trial(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.now = 11
+        self.breaker.before_call()               # the trial call
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()           # concurrent callers still rejected
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, "closed")
+
+    def test_failed_trial_reopens(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.now = 11
+        self.breaker.before_call()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "open")
+        self.assertEqual(self.breaker.times_opened, 2)
+
+
+class TestSendRetries(unittest.TestCase):
+
+    def setUp(self):
+        transport.breaker.reset()
+        self._no_sleep = patch.object(transport, "backoff_delay", return_value=0)
+        self._no_sleep.start()
+
+    def tearDown(self):
+        self._no_sleep.stop()
+        transport.breaker.reset()
+
+    def _client(self, statuses):
+        calls = []
+
+        def handler(request):
+            calls.append(request.method)
+            return httpx.Response(statuses[min(len(calls), len(statuses)) - 1], json=[])
+
+        return httpx.Client(transport=httpx.MockTransport(handler)), calls
+
+    def test_get_retries_transient_errors(self):
+        client, calls = self._client([503, 429, 200])
+        r = transport.send(client, "select", "GET", "http://x/rest/v1/users")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(calls), 3)
+
+    def test_get_gives_up_after_max_retries(self):
+        client, calls = self._client([500])
+        with patch.object(transport, "MAX_RETRIES", 2):
+            with self.assertRaises(httpx.HTTPStatusError):
+                transport.send(client, "select", "GET", "http://x/rest/v1/users")
+        self.assertEqual(len(calls), 3)
+
+    def test_writes_are_not_retried(self):
+        client, calls = self._client([503, 201])
+        with self.assertRaises(httpx.HTTPStatusError):
+            transport.send(client, "insert", "POST", "http://x/rest/v1/users", json={})
+        self.assertEqual(calls, ["POST"])
+
+    def test_retried_request_counts_as_one_failure(self):
+        client, calls = self._client([503])
+        with patch.object(transport, "MAX_RETRIES", 3):
+            with self.assertRaises(httpx.HTTPStatusError):
+                transport.send(client, "select", "GET", "http://x/rest/v1/users")
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(transport.breaker.failures, 1)
+        self.assertEqual(transport.breaker.state, "closed")
+
+    def test_recovered_request_records_no_failure(self):
+        client, _ = self._client([503, 503, 200])
+        transport.send(client, "select", "GET", "http://x/rest/v1/users")
+        self.assertEqual(transport.breaker.failures, 0)
+
+    def test_read_only_rpc_is_retried(self):
+        from db import connection
+        client, calls = self._client([503, 200])
+        with patch.object(connection, "_client", client), \
+             patch.object(connection, "REST_URL", "http://x/rest/v1"):
+            self.assertEqual(connection.rpc("get_graph_bundle", {"p_user_id": "u1"}), [])
+        self.assertEqual(calls, ["POST", "POST"])
+
+        client, calls = self._client([503, 200])
+        with patch.object(connection, "_client", client), \
+             patch.object(connection, "REST_URL", "http://x/rest/v1"):
+            with self.assertRaises(httpx.HTTPStatusError):
+                connection.rpc("delete_course_cascade", {"p_user_id": "u1"})
+        self.assertEqual(calls, ["POST"])
+
+    def test_client_errors_do_not_trip_breaker(self):
+        client, _ = self._client([404])
+        for _ in range(transport.BREAKER_THRESHOLD + 1):
+            with self.assertRaises(httpx.HTTPStatusError):
+                transport.send(client, "select", "GET", "http://x/rest/v1/nope")
+        self.assertEqual(transport.breaker.state, "closed")
+
+    def test_connection_reset_is_retried_async(self):
+        attempts = []
+
+        def handler(request):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise httpx.ConnectError("reset")
+            return httpx.Response(200, json=[])
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        r = asyncio.run(transport.asend(client, "select", "GET", "http://x/rest/v1/users"))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(attempts), 2)
+
+    def test_cancelled_trial_releases_half_open_breaker(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 11
+
+        async def handler(request):
+            await asyncio.sleep(10)
+
+        async def run():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            task = asyncio.create_task(transport.asend(client, "select", "GET", "http://x/rest/v1/users"))
+            await asyncio.sleep(0.01)   # the trial is in flight
+            with self.assertRaises(CircuitOpenError):
+                breaker.before_call()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        with patch.object(transport, "breaker", breaker):
+            asyncio.run(run())
+        self.assertEqual(breaker.state, "half_open")
+        self.assertTrue(breaker.before_call())   # the next call is the new trial
+
+
+class TestBreakerOpenResponse(unittest.TestCase):
+
+    def test_open_breaker_maps_to_503(self):
+        from fastapi.testclient import TestClient
+        import main
+
+        with patch.object(transport.breaker, "before_call", side_effect=CircuitOpenError(4.2)):
+            response = TestClient(main.app).get("/api/users")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "4")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)